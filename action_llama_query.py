@@ -1,66 +1,66 @@
 # actions/action_llama_query.py
 from rasa_sdk import Action, Tracker
 from rasa_sdk.executor import CollectingDispatcher
-import os, json, requests
+import logging
+import os
+
+from actions.filter_compiler import UnsafeFilterError, cached_filter, compile_and_cache
+from actions.llm_client import get_llm_client
+from actions.mongo import get_async_db
+from actions.prompt_context import build_context
+from actions.query_planner import CASE_INSENSITIVE
+from actions.schema import get_schema
+
+MAX_RESULTS = 50
+
+logger = logging.getLogger(__name__)
 
 class ActionQueryLlamaMongo(Action):
     def name(self):
         return "action_llama_query"
 
-    def call_llama3_together(self, prompt, api_key):
-        url = "https://api.together.xyz/v1/completions"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "model": "meta-llama/Llama-3-8b-chat-hf",
-            "prompt": prompt,
-            "max_tokens": 200,
-            "temperature": 0.0,
-            "top_p": 0.7
-        }
-        r = requests.post(url, headers=headers, json=data)
-        r.raise_for_status()
-        return r.json()["choices"][0]["text"].strip()
+    async def call_llama3_together(self, prompt, api_key):
+        return await get_llm_client(api_key).acomplete(prompt, max_tokens=200, temperature=0.0, top_p=0.7)
 
-    def run(self, dispatcher, tracker, domain):
+    async def run(self, dispatcher, tracker, domain):
         api_key = os.getenv("TOGETHER_API_KEY")
         user_message = tracker.latest_message.get("text")
 
-        # Step 1: Ask LLaMA to build Mongo query
+        # Step 1: Compile the question into a Mongo filter. Questions shaped
+        # like one seen before reuse its cached plan; otherwise ask LLaMA.
+        brokers = get_schema()["brokers"]
         prompt_query = f"""
 Given the user question and the following MongoDB schema:
-Collection: brokers(name, city, phone)
-Write a MongoDB filter (as a Python dict) to answer the question.
+Collection: {brokers.signature("filter")}
+Write a MongoDB filter (as a JSON object) to answer the question.
 User question: {user_message}
 Filter:
 """
-        llm_query = self.call_llama3_together(prompt_query, api_key)
-
-        # Step 2: Apply query to fake/mock data
-        brokers = [
-            {"name": "Horizon Group", "city": "Mumbai", "phone": "+91 9213434545"},
-            {"name": "Prime Investments", "city": "Delhi", "phone": "+91 9876543210"},
-            {"name": "Legacy Partners", "city": "Mumbai", "phone": "+91 9123456789"},
-        ]
+        entity_values = [ent.get("value") for ent in tracker.latest_message.get("entities", [])]
+        llm_query = None
         try:
-            mongo_filter = json.loads(llm_query)
-            allowed_fields = {"city", "name"}
-            if not isinstance(mongo_filter, dict) or not set(mongo_filter).issubset(allowed_fields):
-                raise ValueError("Unsafe query fields")
-        except:
+            mongo_filter, template, bindings = cached_filter("brokers", user_message, entity_values)
+            if mongo_filter is None:
+                llm_query = await self.call_llama3_together(prompt_query, api_key)
+                mongo_filter = compile_and_cache("brokers", template, bindings, llm_query)
+        except UnsafeFilterError as e:
+            logger.warning("Rejected LLM filter %r: %s", llm_query, e)
             mongo_filter = {}
 
-        results = [b for b in brokers if all(str(b.get(k, "")).lower() == str(v).lower() for k, v in mongo_filter.items())]
+        # Step 2: Run the compiled filter in MongoDB
+        projection = {"_id": 0, **{field: 1 for field in brokers.with_flag("answer")}}
+        results = await get_async_db()["brokers"].find(
+            mongo_filter, projection, collation=CASE_INSENSITIVE, limit=MAX_RESULTS
+        ).to_list(None)
+        data, _, _ = build_context("brokers", results, user_message)
 
         # Step 3: Ask LLaMA to summarize result
         prompt_summary = f"""
 Given the data and user's question, summarize answer in natural language.
 User: {user_message}
-Data: {results}
+Data: {data}
 """
-        summary = self.call_llama3_together(prompt_summary, api_key)
+        summary = await self.call_llama3_together(prompt_summary, api_key)
 
         # Final response
         dispatcher.utter_message(text=summary)
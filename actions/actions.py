@@ -4,61 +4,178 @@
 # See this guide on how to implement these action:
 # https://rasa.com/docs/rasa/custom-actions
 
+import asyncio
+import logging
 import os
-import requests
+import time
 from rasa_sdk import Action, Tracker
+from rasa_sdk.events import SlotSet
 from rasa_sdk.executor import CollectingDispatcher
-from pymongo import MongoClient
 from dotenv import load_dotenv
 load_dotenv()
-import difflib
+
+from actions.analytics import compile_analytics
+from actions.attribute_answers import answer_metrics, detect_attribute, utter_attribute
+from actions.catalog import get_catalog
+from actions.gazetteer import get_gazetteer, normalize
+from actions.llm_client import get_llm_client
+from actions.mongo import get_async_db, pool_metrics
+from actions.pagination import (
+    LIST_FILTER_FIELDS, RESUME_SLOT, fetch_page, is_show_more, page_settings, recognised_filter, resume_page,
+)
+from actions.prompt_context import build_context
+from actions.query_planner import COLLECTION_KEYWORDS, plan_query, target_collections
+from actions.response_cache import get_response_cache
+from actions.retrieval import retrieval_settings, search_catalog
+from actions.schema import observe_catalog
+from actions.session_state import get_session_store, is_follow_up
+from actions.streaming import stream_answer
+from actions.tracing import configure as configure_tracing, span
+from actions.vector_index import get_retriever
+
+configure_tracing()
+logger = logging.getLogger(__name__)
+
+COLLECTION_LABELS = {"properties": "property", "projects": "project", "brokers": "broker"}
+
+def _labelled(label, value):
+    # blockName is usually stored as "BLOCK B" and floorName as "Floor 4" already.
+    value = str(value if value is not None else "").strip()
+    if not value or value.lower().startswith(label.lower()):
+        return value
+    return f"{label} {value}"
+
+
+def display_name(collection, doc):
+    if collection == "properties" and not doc.get("name"):
+        parts = [
+            str(doc.get("propertyType") or "").strip(),
+            _labelled("Block", doc.get("blockName")),
+            _labelled("Floor", doc.get("floorName")),
+            _labelled("Shop", doc.get("shopNo")),
+        ]
+        return " ".join(part for part in parts if part) or str(doc.get("_id"))
+    return doc.get("name") or str(doc.get("_id"))
 
 def call_llama3_together(prompt, api_key):
-    url = "https://api.together.xyz/v1/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": "meta-llama/Llama-3-8b-chat-hf",
-        "prompt": prompt,
-        "max_tokens": 100,
-        "temperature": 0.7,
-        "top_p": 0.7
-    }
-    response = requests.post(url, headers=headers, json=data)
-    response.raise_for_status()
-    return response.json()["choices"][0]["text"].strip()
+    return get_llm_client(api_key).complete(prompt, max_tokens=100, temperature=0.7, top_p=0.7)
+
+async def acall_llama3_together(prompt, api_key):
+    return await get_llm_client(api_key).acomplete(prompt, max_tokens=100, temperature=0.7, top_p=0.7)
 
 class ActionSearchDatabase(Action):
+    def __init__(self):
+        # Warm the catalog snapshot when the action server registers the action.
+        self.catalog = get_catalog()
+        observe_catalog()
+        self.response_cache = get_response_cache(self.catalog)
+        get_gazetteer(self.catalog)
+        self.sessions = get_session_store()
+
     def name(self):
         return "action_search_database"
 
-    def run(self, dispatcher, tracker, domain):
-        user_message = tracker.latest_message.get("text")
+    async def answer_from_document(self, dispatcher, tracker, collection, doc, user_message, api_key):
+        """Answer from one document; returns how: "template", "cache", "generated" or "unavailable"."""
+        started = time.perf_counter()
+        outcome = await self._answer_from_document(dispatcher, tracker, collection, doc, user_message, api_key)
+        answer_metrics.record(outcome, time.perf_counter() - started)
+        return outcome
+
+    async def _answer_from_document(self, dispatcher, tracker, collection, doc, user_message, api_key):
+        # One attribute of the document ("what is its facing?") is read, not generated.
+        field = detect_attribute(collection, user_message, tracker.latest_message.get("entities", []), doc.get("name"))
+        if field is not None:
+            with span("template.render", collection=collection, field=field) as stage:
+                stage.set(found=utter_attribute(dispatcher, collection, doc, field, display_name(collection, doc)))
+            return "template"
+        cached = self.response_cache.get(collection, doc, user_message)
+        if cached is not None:
+            logger.debug("Response cache hit: %s", self.response_cache.stats())
+            dispatcher.utter_message(text=cached)
+            return "cache"
+        label = COLLECTION_LABELS[collection]
+        with span("prompt.build", collection=collection) as stage:
+            context, tokens, saved = build_context(collection, [doc], user_message)
+            stage.set(context_tokens=tokens, tokens_saved=saved)
+            prompt = (
+                f"You are a property assistant. Only answer using the following {label} data. "
+                f"If the answer is not present, say: 'Sorry, I can only answer questions about {collection} in my database.'\n"
+                f"{label.capitalize()} data:\n{context}\n"
+                f"User question: {user_message}\n"
+            )
+        logger.debug("Prompt context: %d tokens, %d saved", tokens, saved)
+        if get_llm_client(api_key).ready:
+            try:
+                answer = await stream_answer(dispatcher, tracker, prompt, api_key)
+                self.response_cache.set(collection, doc, user_message, answer)
+                return "generated"
+            except Exception as e:
+                logger.warning("Answer generation failed: %s", e)
+                dispatcher.utter_message(text="Sorry, there was an error generating the answer.")
+        else:
+            dispatcher.utter_message(text="Sorry, the Llama 3 API key is not set.")
+        return "unavailable"
+
+    def remember(self, tracker, collection, doc, hits=()):
+        """Record the document this turn resolved, for follow-ups."""
+        self.sessions.set(tracker.sender_id, {
+            "collection": collection,
+            "doc_id": str(doc["_id"]),
+            "hits": [[round(score, 4), c, str(d["_id"])] for score, c, d in hits],
+        })
+
+    def remembered_document(self, session):
+        collection = session.get("collection")
+        if collection not in COLLECTION_LABELS:
+            return None
+        return get_retriever(self.catalog, collection).documents().get(session.get("doc_id"))
+
+    def utter_page(self, dispatcher, page):
+        names = ", ".join(display_name(page.collection, d) for d in page.docs)
+        text = f"{page.collection.capitalize()} {page.start}-{page.shown}: {names}"
+        if page.has_more:
+            text += '\nSay "show more" for the next ones.'
+        dispatcher.utter_message(text=text)
+        return [SlotSet(RESUME_SLOT, page.resume_token())]
+
+    async def answer_from_aggregate(self, dispatcher, tracker, analytics, value, user_message, api_key):
+        result = analytics.describe(value)
+        if not get_llm_client(api_key).ready:
+            dispatcher.utter_message(text=result)
+            return
+        prompt = (
+            f"You are a property assistant. Answer the user's question in one sentence using only this result.\n"
+            f"Result: {result}\n"
+            f"User question: {user_message}\n"
+        )
+        try:
+            await stream_answer(dispatcher, tracker, prompt, api_key)
+        except Exception as e:
+            logger.warning("Answer generation failed: %s", e)
+            dispatcher.utter_message(text=result)
+
+    async def run(self, dispatcher, tracker, domain):
         intent = tracker.latest_message.get("intent", {}).get("name")
-        print("[DEBUG] Extracted intent:", intent)
-        greeting_phrases = ["hi", "hello", "hey", "good morning", "good evening"]
-        if any(phrase in user_message.lower() for phrase in greeting_phrases):
-            dispatcher.utter_message(response="utter_greet")
-            return []
+        with span("action_search_database", intent=intent, sender_id=tracker.sender_id) as root:
+            return await self._run(dispatcher, tracker, intent, root)
+
+    async def _run(self, dispatcher, tracker, intent, root):
+        user_message = tracker.latest_message.get("text")
+        logger.debug("Extracted intent: %s", intent)
         if intent == "greet":
             dispatcher.utter_message(response="utter_greet")
             return []
         if intent == "goodbye":
             dispatcher.utter_message(response="utter_goodbye")
             return []
-        print("[DEBUG] User message:", user_message)
-        mongo_uri = os.getenv("MONGODB_URI")
-        mongo_db = os.getenv("MONGODB_DB", "homelead")
-        print("[DEBUG] MongoDB URI:", mongo_uri)
-        client = MongoClient(mongo_uri)
-        db = client[mongo_db]
+        logger.debug("User message: %s", user_message)
+        db = get_async_db()
+        logger.debug("MongoDB pool: %s", pool_metrics.snapshot())
         api_key = os.getenv("TOGETHER_API_KEY")
         user_message_lower = user_message.lower()
-        # Print extracted entities
         entities = tracker.latest_message.get("entities", [])
-        print("[DEBUG] Extracted entities:", entities)
+        logger.debug("Extracted entities: %s", entities)
 
         # Helper to extract entity value by type
         def get_entity_value(entity_type):
@@ -67,208 +184,108 @@ class ActionSearchDatabase(Action):
                     return ent.get("value")
             return None
 
-        # Helper to extract likely name from message
-        import re
-        def extract_likely_name(msg, keywords):
-            for kw in keywords:
-                pattern = rf"(.+?)\s*{kw}"
-                match = re.search(pattern, msg, re.IGNORECASE)
-                if match:
-                    return match.group(1).strip()
-            return None
+        # Catalog values (names, cities, companies, blocks, statuses) named in the message
+        recognised = get_gazetteer(self.catalog).extract(user_message)
+        logger.debug("Recognised values: %s", recognised)
 
-        # List queries with optional city/category filter
-        if "list" in user_message_lower or "all" in user_message_lower:
-            if "broker" in user_message_lower:
-                query = {}
-                for field in ["city", "company"]:
-                    if field in user_message_lower:
-                        query[field] = {"$regex": user_message, "$options": "i"}
-                brokers = list(db["brokers"].find(query))
-                print("[DEBUG] Brokers found:", brokers)
-                if brokers:
-                    def broker_display_name(b):
-                        return b.get("name") or str(b.get("_id"))
-                    names = [broker_display_name(b) for b in brokers]
-                    dispatcher.utter_message(text="Brokers: " + ", ".join(names))
-                    return []
-            if "property" in user_message_lower:
-                query = {}
-                for field in ["city", "category", "projectStatus"]:
-                    if field in user_message_lower:
-                        query[field] = {"$regex": user_message, "$options": "i"}
-                properties = list(db["properties"].find(query))
-                print("[DEBUG] Properties found:", properties)
-                if properties:
-                    def property_display_name(p):
-                        if p.get("name"):
-                            return p["name"]
-                        return f"{p.get('propertyType', '')} Block {p.get('blockName', '')} Floor {p.get('floorName', '')} Shop {p.get('shopNo', '')}".strip()
-                    names = [property_display_name(p) for p in properties]
-                    dispatcher.utter_message(text="Properties: " + ", ".join(names))
-                    return []
-            if "project" in user_message_lower:
-                query = {}
-                for field in ["city", "category", "projectStatus"]:
-                    if field in user_message_lower:
-                        query[field] = {"$regex": user_message, "$options": "i"}
-                projects = list(db["projects"].find(query))
-                print("[DEBUG] Projects found:", projects)
-                if projects:
-                    def project_display_name(p):
-                        return p.get("name") or str(p.get("_id"))
-                    names = [project_display_name(p) for p in projects]
-                    dispatcher.utter_message(text="Projects: " + ", ".join(names))
-                    return []
+        def recognised_name(collection):
+            names = recognised.get(collection, {}).get("name")
+            return names[0] if names else None
 
-        # Load all data from MongoDB collections
-        all_brokers = list(db["brokers"].find())
-        all_properties = list(db["properties"].find())
-        all_projects = list(db["projects"].find())
-
-        # --- Robust fuzzy matching for specific queries ---
-        # Properties
-        prop_fields = ["propertyType", "blockName", "floorName", "series", "shopNo", "furnishedStatus", "minBudget", "maxBudget", "facing", "vastuCompliant", "carpetArea", "builtUpArea", "superBuiltUpArea", "carpetAreaType", "builtUpAreaType", "superBuiltUpAreaType", "noOfBalconies", "noOfBathRooms", "noOfBedRooms", "noOfKitchens", "noOfDrawingRooms", "noOfParkingLots"]
-        prop_query_value = get_entity_value("property_name") or extract_likely_name(user_message, ["property"]) or user_message
-        print("[DEBUG] Property search value:", prop_query_value)
-        property_blobs = []
-        property_docs = []
-        for doc in all_properties:
-            blob = " ".join([str(v).lower() for k, v in doc.items() if k in prop_fields and isinstance(v, (str, int, float))])
-            property_blobs.append(blob)
-            property_docs.append(doc)
-        prop = None
-        matches = difflib.get_close_matches(prop_query_value.lower(), property_blobs, n=1, cutoff=0.5)
-        if matches:
-            idx = property_blobs.index(matches[0])
-            prop = property_docs[idx]
-        print("[DEBUG] Fuzzy-matched property:", prop)
+        # Aggregate questions (count/avg/min/max/sum) run server-side
+        analytics = compile_analytics(user_message, entities, recognised)
+        if analytics is not None:
+            logger.debug("Analytics pipeline: %s", analytics.pipeline())
+            root.set(path="analytics")
+            with span("mongo.fetch", collection=analytics.collection, kind="aggregate"):
+                value = await analytics.arun(db)
+            await self.answer_from_aggregate(dispatcher, tracker, analytics, value, user_message, api_key)
+            return []
 
-        # Projects
-        proj_fields = ["name", "slug", "category", "projectStatus", "minBudget", "maxBudget", "startDate", "completionDate", "countryCode", "phone", "email", "address", "zipCode", "reraRegistrationNumber", "projectRegistrationNumber", "projectType", "projectUnitSubType", "layoutPlanImages"]
-        proj_query_value = get_entity_value("project_name") or extract_likely_name(user_message, ["project"]) or user_message
-        print("[DEBUG] Project search value:", proj_query_value)
-        project_blobs = []
-        project_docs = []
-        for doc in all_projects:
-            blob = " ".join([str(v).lower() for k, v in doc.items() if k in proj_fields and isinstance(v, (str, int, float))])
-            project_blobs.append(blob)
-            project_docs.append(doc)
-        proj = None
-        matches = difflib.get_close_matches(proj_query_value.lower(), project_blobs, n=1, cutoff=0.5)
-        if matches:
-            idx = project_blobs.index(matches[0])
-            proj = project_docs[idx]
-        print("[DEBUG] Fuzzy-matched project:", proj)
+        # "Show more" continues the last list from the resume token in the slot
+        if is_show_more(user_message):
+            with span("mongo.fetch", kind="list_page"):
+                page = await resume_page(db, tracker.get_slot(RESUME_SLOT), **page_settings())
+            root.set(path="list")
+            if page is None or not page.docs:
+                dispatcher.utter_message(text="There is nothing more to show.")
+                return [SlotSet(RESUME_SLOT, None)]
+            return self.utter_page(dispatcher, page)
 
-        # Brokers
-        brok_fields = ["name", "company", "countryCode", "phone", "city", "state", "address", "zipCode", "commissionPercent", "bankDetails", "realEstateLicenseDetails", "yearStartedInRealEstate", "status"]
-        brok_query_value = get_entity_value("broker_name") or extract_likely_name(user_message, ["broker"]) or user_message
-        print("[DEBUG] Broker search value:", brok_query_value)
-        broker_blobs = []
-        broker_docs = []
-        for doc in all_brokers:
-            blob = " ".join([str(v).lower() for k, v in doc.items() if k in brok_fields and isinstance(v, (str, int, float))])
-            broker_blobs.append(blob)
-            broker_docs.append(doc)
-        brok = None
-        matches = difflib.get_close_matches(brok_query_value.lower(), broker_blobs, n=1, cutoff=0.5)
-        if matches:
-            idx = broker_blobs.index(matches[0])
-            brok = broker_docs[idx]
-        print("[DEBUG] Fuzzy-matched broker:", brok)
+        # Follow-ups ("what about its budget?") reuse the document resolved last turn
+        names_given = any(get_entity_value(e) for e in ("property_name", "project_name", "broker_name")) or any(
+            recognised_name(c) for c in COLLECTION_LABELS
+        )
+        if not names_given and is_follow_up(user_message):
+            session = self.sessions.get(tracker.sender_id)
+            doc = self.remembered_document(session) if session else None
+            if doc is not None:
+                root.set(path="session", collection=session["collection"])
+                self.sessions.set(tracker.sender_id, session)  # keeps the session alive
+                root.set(answer=await self.answer_from_document(
+                    dispatcher, tracker, session["collection"], doc, user_message, api_key
+                ))
+                return []
 
-        # --- Specific queries: use extracted entity, then likely name, then fallback ---
-        # Try properties (search across multiple fields)
-        prop_fields = ["name", "address", "category", "city", "blockName", "series", "projectStatus"]
-        prop_query_value = get_entity_value("property_name") or extract_likely_name(user_message, ["property"]) or user_message
-        print("[DEBUG] Property search value:", prop_query_value)
-        def build_or_query(fields, value):
-            return {"$or": [{field: {"$regex": value, "$options": "i"}} for field in fields]}
-        prop = None
-        # Search through all_properties for the best match
-        for doc in all_properties:
-            if any(prop_query_value.lower() in str(v).lower() for k, v in doc.items() if k in prop_fields and isinstance(v, str)):
-                prop = doc
-                break
-        print("[DEBUG] Property found:", prop)
-        if prop:
-            prompt = (
-                f"You are a property assistant. Only answer using the following property data. "
-                f"If the answer is not present, say: 'Sorry, I can only answer questions about properties in my database.'\n"
-                f"Property data: {prop}\n"
-                f"User question: {user_message}\n"
-            )
-            if api_key:
-                try:
-                    llama_response = call_llama3_together(prompt, api_key)
-                    dispatcher.utter_message(text=llama_response)
-                except Exception as e:
-                    print("[DEBUG] Llama 3 API error:", e)
-                    dispatcher.utter_message(text="Sorry, there was an error generating the answer.")
-            else:
-                dispatcher.utter_message(text="Sorry, the Llama 3 API key is not set.")
-            return []
-        print("[DEBUG] No specific property match found.")
+        # List queries with optional city/company/category/status filters, one page at a time
+        wanted = []
+        # Whole words only: "mall of jaipur" is not a list question.
+        if {"list", "all"} & set(normalize(user_message).split()):
+            wanted = [c for c in LIST_FILTER_FIELDS if COLLECTION_KEYWORDS[c] in user_message_lower]
+        if wanted:
+            # Fetch the first page of every collection the question names at once; answer from the first non-empty one.
+            settings = page_settings()
+            with span("mongo.fetch", collection=",".join(wanted), kind="list") as stage:
+                pages = await asyncio.gather(
+                    *(fetch_page(db, c, recognised_filter(c, recognised), **settings) for c in wanted)
+                )
+                stage.set(documents=sum(len(page.docs) for page in pages))
+            for page in pages:
+                logger.debug("%s page: %d", page.collection.capitalize(), len(page.docs))
+                if page.docs:
+                    root.set(path="list")
+                    return self.utter_page(dispatcher, page)
 
-        # Try projects (search across multiple fields)
-        proj_fields = ["name", "address", "category", "city", "projectStatus"]
-        proj_query_value = get_entity_value("project_name") or extract_likely_name(user_message, ["project"]) or user_message
-        print("[DEBUG] Project search value:", proj_query_value)
-        proj = None
-        for doc in all_projects:
-            if any(proj_query_value.lower() in str(v).lower() for k, v in doc.items() if k in proj_fields and isinstance(v, str)):
-                proj = doc
-                break
-        print("[DEBUG] Project found:", proj)
-        if proj:
-            prompt = (
-                f"You are a property assistant. Only answer using the following project data. "
-                f"If the answer is not present, say: 'Sorry, I can only answer questions about projects in my database.'\n"
-                f"Project data: {proj}\n"
-                f"User question: {user_message}\n"
-            )
-            if api_key:
-                try:
-                    llama_response = call_llama3_together(prompt, api_key)
-                    dispatcher.utter_message(text=llama_response)
-                except Exception as e:
-                    print("[DEBUG] Llama 3 API error:", e)
-                    dispatcher.utter_message(text="Sorry, there was an error generating the answer.")
-            else:
-                dispatcher.utter_message(text="Sorry, the Llama 3 API key is not set.")
-            return []
-        print("[DEBUG] No specific project match found.")
+        # --- Structured lookups pushed down to MongoDB, all target collections concurrently ---
+        plans = [(c, plan_query(c, entities)) for c in target_collections(entities, user_message)]
+        plans = [(c, plan) for c, plan in plans if plan is not None]
+        logger.debug("Query plans: %s", [plan for _, plan in plans])
+        if plans:
+            with span("mongo.fetch", collection=",".join(c for c, _ in plans), kind="find_one") as stage:
+                docs = await asyncio.gather(*(plan.afind_one(db) for _, plan in plans))
+                stage.set(documents=sum(1 for doc in docs if doc))
+        else:
+            docs = []
+        for (collection, _), doc in zip(plans, docs):
+            if doc:
+                root.set(path="planner", collection=collection)
+                self.remember(tracker, collection, doc)
+                root.set(answer=await self.answer_from_document(dispatcher, tracker, collection, doc, user_message, api_key))
+                return []
 
-        # Try brokers (search across multiple fields)
-        brok_fields = ["name", "address", "city", "company"]
-        brok_query_value = get_entity_value("broker_name") or extract_likely_name(user_message, ["broker"]) or user_message
-        print("[DEBUG] Broker search value:", brok_query_value)
-        brok = None
-        for doc in all_brokers:
-            if any(brok_query_value.lower() in str(v).lower() for k, v in doc.items() if k in brok_fields and isinstance(v, str)):
-                brok = doc
-                break
-        print("[DEBUG] Broker found:", brok)
-        if brok:
-            prompt = (
-                f"You are a property assistant. Only answer using the following broker data. "
-                f"If the answer is not present, say: 'Sorry, I can only answer questions about brokers in my database.'\n"
-                f"Broker data: {brok}\n"
-                f"User question: {user_message}\n"
-            )
-            if api_key:
-                try:
-                    llama_response = call_llama3_together(prompt, api_key)
-                    dispatcher.utter_message(text=llama_response)
-                except Exception as e:
-                    print("[DEBUG] Llama 3 API error:", e)
-                    dispatcher.utter_message(text="Sorry, there was an error generating the answer.")
-            else:
-                dispatcher.utter_message(text="Sorry, the Llama 3 API key is not set.")
+        # --- Specific queries: one ranked retrieval across all collections ---
+        search_values = {
+            "properties": get_entity_value("property_name") or recognised_name("properties") or user_message,
+            "projects": get_entity_value("project_name") or recognised_name("projects") or user_message,
+            "brokers": get_entity_value("broker_name") or recognised_name("brokers") or user_message,
+        }
+        # Collections the question points at are scanned first so the early exit favours them.
+        order = target_collections(entities, user_message) + list(search_values)
+        queries = {collection: search_values[collection] for collection in dict.fromkeys(order)}
+        logger.debug("Search values: %s", queries)
+        # Retrieval is CPU-bound; keep it off the event loop so other conversations proceed.
+        with span("fuzzy_match", collections=len(queries)) as stage:
+            hits = await asyncio.to_thread(search_catalog, self.catalog, queries, **retrieval_settings())
+            stage.set(hits=len(hits), top_score=hits[0][0] if hits else None)
+        logger.debug("Ranked matches: %s", [(round(score, 3), collection, doc.get("_id")) for score, collection, doc in hits])
+        if hits:
+            _, collection, doc = hits[0]
+            root.set(path="retrieval", collection=collection)
+            self.remember(tracker, collection, doc, hits)
+            root.set(answer=await self.answer_from_document(dispatcher, tracker, collection, doc, user_message, api_key))
             return []
-        print("[DEBUG] No specific broker match found.")
 
         dispatcher.utter_message(response="utter_fallback")
-        print("[DEBUG] No match found, fallback triggered.")
+        root.set(path="fallback")
+        logger.debug("No match found, fallback triggered.")
         return []
\ No newline at end of file
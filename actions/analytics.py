@@ -0,0 +1,166 @@
+# Server-side analytics for count/avg/min/max/sum questions.
+#
+# "How many brokers are there in Mumbai?" or "average minBudget for commercial
+# properties in BLOCK B" are compiled into an aggregation pipeline over a
+# whitelisted schema and run inside MongoDB; only the scalar result is handed
+# to the summarizer.
+#
+# Only questions about a collection are aggregates. A question about one
+# named document ("how many bedrooms does mall of jaipur have?", "minimum
+# budget of BLOCK B Floor 4 Shop 179") or a follow-up ("how many bedrooms does
+# it have?") is left to the document paths, which answer it from that
+# document.
+
+import re
+
+from actions.attribute_answers import attribute_at
+from actions.gazetteer import normalize
+from actions.pagination import recognised_filter
+from actions.query_planner import CASE_INSENSITIVE, COLLECTION_KEYWORDS, structured_filter, target_collections
+from actions.schema import get_schema
+
+# Numeric fields that may be aggregated, per collection.
+METRIC_FIELDS = get_schema().fields("metric")
+
+
+def _metric_pattern(phrases):
+    # Longest first, so "max budget" wins over "budget".
+    alternation = "|".join(re.escape(p) for p in sorted(phrases, key=len, reverse=True))
+    return re.compile(rf"\b(?:{alternation})\b") if phrases else None
+
+
+# Phrases that name a metric, per collection (field words and the registry's synonyms).
+METRIC_PATTERNS = {c: _metric_pattern(get_schema()[c].metric_phrases) for c in get_schema()}
+
+# Filters that may come from plain wording rather than entities.
+VALUE_KEYWORDS = {
+    "properties": {"propertyType": ["commercial", "residential"]},
+    "projects": {"category": ["commercial", "residential"]},
+    "brokers": {},
+}
+
+# Entities that name a single document.
+NAME_ENTITIES = ("property_name", "project_name", "broker_name")
+
+_HOW_MANY = re.compile(r"\bhow many ")
+
+OPERATIONS = [
+    # "number of projects", not "phone number of Horizon Group" or "number of bedrooms".
+    ("count", re.compile(r"\b(how many|count|number of(?= (?:the )?(?:propert|project|broker)))\b")),
+    ("avg", re.compile(r"\b(average|avg|mean)\b")),
+    ("min", re.compile(r"\b(minimum|lowest|cheapest|smallest|min)\b")),
+    ("max", re.compile(r"\b(maximum|highest|costliest|most expensive|largest|max)\b")),
+    ("sum", re.compile(r"\b(sum|total)\b")),
+]
+
+
+def detect_operation(message):
+    message = message.lower()
+    for operation, pattern in OPERATIONS:
+        if pattern.search(message):
+            return operation
+    return None
+
+
+def detect_metric(collection, message):
+    pattern = METRIC_PATTERNS.get(collection)
+    match = pattern.search(normalize(message)) if pattern is not None else None
+    return get_schema()[collection].metric_phrases[match.group(0)] if match else None
+
+
+def names_document(entities, recognised=None):
+    """Whether the question names one document, by entity or by a catalog name in the message."""
+    if any(ent.get("entity") in NAME_ENTITIES and ent.get("value") for ent in entities or []):
+        return True
+    return any(fields.get("name") for fields in (recognised or {}).values())
+
+
+def counts_attribute(collection, message):
+    """Whether "how many" is followed by an attribute ("how many bedrooms") rather than a collection."""
+    text = normalize(message)
+    return any(attribute_at(collection, text, m.end()) for m in _HOW_MANY.finditer(text))
+
+
+class AnalyticsQuery:
+    def __init__(self, collection, operation, field, match):
+        self.collection = collection
+        self.operation = operation
+        self.field = field
+        self.match = match
+
+    def __repr__(self):
+        return f"AnalyticsQuery({self.collection!r}, {self.operation!r}, {self.field!r}, {self.match!r})"
+
+    def pipeline(self):
+        stages = [{"$match": self.match}] if self.match else []
+        if self.operation == "count":
+            stages.append({"$count": "value"})
+        else:
+            stages.append({"$group": {"_id": None, "value": {f"${self.operation}": f"${self.field}"}}})
+        return stages
+
+    def run(self, db):
+        return self._value(list(db[self.collection].aggregate(self.pipeline(), collation=CASE_INSENSITIVE)))
+
+    async def arun(self, db):
+        cursor = await db[self.collection].aggregate(self.pipeline(), collation=CASE_INSENSITIVE)
+        return self._value(await cursor.to_list(None))
+
+    def _value(self, result):
+        if not result:
+            return 0 if self.operation == "count" else None
+        return result[0]["value"]
+
+    def describe(self, value):
+        filters = ", ".join(f"{k}={v}" for k, v in self.match.items()) or "no filter"
+        if self.operation == "count":
+            return f"count of {self.collection} ({filters}): {value}"
+        return f"{self.operation} of {self.field} over {self.collection} ({filters}): {value}"
+
+
+def compile_analytics(message, entities, recognised=None):
+    """An AnalyticsQuery when the message asks for an aggregate over a collection, else None.
+
+    `recognised` is the gazetteer's `{collection: {field: [values]}}` for the message;
+    its list-filter values narrow the match where no entity already does.
+    """
+    operation = detect_operation(message)
+    if operation is None or names_document(entities, recognised):
+        return None
+    targets = target_collections(entities, message)
+    if len(targets) != 1:
+        return None
+    collection = targets[0]
+    # The subject must be the collection itself: "how many brokers", "average budget of projects".
+    if COLLECTION_KEYWORDS[collection] not in message.lower() or counts_attribute(collection, message):
+        return None
+    field = None
+    if operation != "count":
+        field = detect_metric(collection, message)
+        if field is None:
+            # "total" on its own reads as a count ("total projects").
+            if operation != "sum":
+                return None
+            operation = "count"
+    if collection == "properties":
+        # Block/floor/shop wording in the question narrows the match too.
+        entities = list(entities or []) + [{"entity": "property_name", "value": message}]
+    match = structured_filter(collection, entities)
+    lowered = message.lower()
+    used = set()
+    for match_field, values in VALUE_KEYWORDS[collection].items():
+        if match_field in match:
+            continue
+        for value in values:
+            if re.search(rf"\b{value}\b", lowered):
+                match[match_field] = value.capitalize()
+                used.add(value)
+                break
+    # Catalog values the gazetteer found in the message ("brokers in Mumbai"
+    # without a city entity) filter the aggregate as they do a list, unless
+    # their words were already read as a keyword above.
+    for match_field, value in recognised_filter(collection, recognised).items():
+        values = value["$in"] if isinstance(value, dict) else [value]
+        if match_field not in match and not any(normalize(v) in used for v in values):
+            match[match_field] = value
+    return AnalyticsQuery(collection, operation, field, match)
@@ -0,0 +1,162 @@
+# Deterministic answers for single-attribute lookups.
+#
+# Many questions ask for one attribute of one document: a broker's phone, a
+# project's RERA registration number, a property's facing or carpet area.
+# Those are answered by reading the field from the resolved document and
+# rendering the `utter_attribute_value` response of domain.yml (or
+# `utter_attribute_missing` when the document has no value), without a
+# generation call. Open-ended questions, and questions naming several
+# attributes, still go to the LLM.
+#
+# The attribute comes from an `attribute` entity when the NLU extracted one,
+# otherwise from the attribute's phrases in the message. Fields are eligible
+# when the schema registry flags them `attribute`; their labels, units and
+# phrases come from the registry too.
+#
+# `answer_metrics` counts how each turn that resolved a document was answered
+# ("template", "cache", "generated", "unavailable") and how long it took,
+# and logs the share answered without generation every
+# ANSWER_METRICS_REPORT_EVERY answers (100, 0 disables).
+
+import datetime
+import logging
+import os
+import re
+import threading
+
+from actions.gazetteer import normalize
+from actions.schema import get_schema
+
+logger = logging.getLogger(__name__)
+
+ATTRIBUTE_ENTITY = "attribute"
+
+# Outcomes that did not call the LLM.
+WITHOUT_GENERATION = ("template", "cache")
+
+# Questions that want an opinion or an explanation, not a stored value.
+_OPEN_ENDED = re.compile(
+    r"\b(?:why|how(?! many| much)|should|would|could|compare|compared|difference|versus|vs|better|best|worth"
+    r"|good|bad|recommend|suggest|explain|describe|details|everything|and)\b"
+)
+
+
+def _compile(phrases):
+    # Longest first, so "rera registration number" wins over "registration number".
+    alternation = "|".join(re.escape(p) for p in sorted(phrases, key=len, reverse=True))
+    return phrases, re.compile(rf"\b(?:{alternation})\b") if phrases else None
+
+
+_MATCHERS = {collection: _compile(get_schema()[collection].attribute_phrases) for collection in get_schema()}
+
+
+def detect_attribute(collection, message, entities=(), subject=None):
+    """The one field of `collection` the message asks for, or None.
+
+    None when the question is open-ended, names no attribute or names several.
+    Entity values and the document's name are ignored when scanning the
+    message, so a name like "Lake View Address" does not ask for an address.
+    """
+    phrases, pattern = _MATCHERS.get(collection, ({}, None))
+    if pattern is None:
+        return None
+    text = normalize(message)
+    found = set()
+    for ent in entities or ():
+        value = normalize(ent.get("value") or "")
+        if ent.get("entity") == ATTRIBUTE_ENTITY:
+            field = phrases.get(value) or (ent.get("value") if ent.get("value") in phrases.values() else None)
+            if field is None:
+                return None  # an attribute this collection cannot answer from a template
+            found.add(field)
+        elif value:
+            text = text.replace(value, " ")
+    if subject:
+        text = text.replace(normalize(subject), " ")
+    if _OPEN_ENDED.search(text):
+        return None
+    found.update(phrases[match] for match in pattern.findall(text))
+    return found.pop() if len(found) == 1 else None
+
+
+def attribute_at(collection, text, position=0):
+    """The field whose phrase starts at `position` of normalized `text`, or None."""
+    phrases, pattern = _MATCHERS.get(collection, ({}, None))
+    match = pattern.match(text, position) if pattern is not None else None
+    return phrases[match.group(0)] if match else None
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return f"{value:,}" if isinstance(value, int) and abs(value) >= 10000 else str(value)
+
+
+def format_value(collection, doc, field):
+    """The document's value for `field` as answer text, or None when it has none."""
+    value = doc.get(field)
+    if value is None or value == "" or value == []:
+        return None
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, datetime.datetime):
+        return value.strftime("%d %B %Y")
+    if isinstance(value, list):
+        return ", ".join(str(v) for v in value)
+    if isinstance(value, (int, float)):
+        text = _number(value)
+        schema = get_schema()[collection]
+        if schema[field].unit:
+            return f"{text}{schema[field].unit}"
+        # carpetArea is qualified by carpetAreaType ("sqft"), and so on.
+        unit = doc.get(f"{field}Type") if f"{field}Type" in schema else None
+        return f"{text} {unit}" if unit else text
+    return str(value)
+
+
+def utter_attribute(dispatcher, collection, doc, field, subject):
+    """Answer with the domain.yml template; True when the document had a value."""
+    label = get_schema()[collection][field].label
+    value = format_value(collection, doc, field)
+    if value is None:
+        dispatcher.utter_message(response="utter_attribute_missing", attribute=label, subject=subject)
+        return False
+    dispatcher.utter_message(response="utter_attribute_value", attribute=label, subject=subject, value=value)
+    return True
+
+
+class AnswerMetrics:
+    def __init__(self, report_every=None):
+        if report_every is None:
+            report_every = int(os.getenv("ANSWER_METRICS_REPORT_EVERY", "100"))
+        self.report_every = report_every
+        self._lock = threading.Lock()
+        self.answers = 0
+        self.outcomes = {}  # outcome -> (answers, total seconds)
+
+    def record(self, outcome, seconds):
+        with self._lock:
+            self.answers += 1
+            count, total = self.outcomes.get(outcome, (0, 0.0))
+            self.outcomes[outcome] = (count + 1, total + seconds)
+            report = self.report_every and self.answers % self.report_every == 0
+        if report:
+            snapshot = self.snapshot()
+            logger.info(
+                "Answered %.1f%% of %d document turns without generation (avg ms by outcome: %s)",
+                100.0 * snapshot["without_generation_ratio"], snapshot["answers"],
+                {outcome: round(ms, 1) for outcome, ms in snapshot["avg_ms"].items()},
+            )
+
+    def snapshot(self):
+        with self._lock:
+            without = sum(self.outcomes.get(outcome, (0, 0.0))[0] for outcome in WITHOUT_GENERATION)
+            return {
+                "answers": self.answers,
+                "outcomes": {outcome: count for outcome, (count, _) in self.outcomes.items()},
+                "without_generation_ratio": without / self.answers if self.answers else 0.0,
+                "avg_ms": {outcome: total / count * 1000.0 for outcome, (count, total) in self.outcomes.items()},
+            }
+
+
+answer_metrics = AnswerMetrics()
@@ -0,0 +1,256 @@
+# Warm, process-level snapshot of the catalog collections.
+#
+# The snapshot is loaded once and then kept current incrementally: through
+# change streams when the deployment is a replica set, otherwise by polling on
+# an `updatedAt` watermark. A periodic full reload (CATALOG_TTL_SECONDS) also
+# catches deletes that polling cannot see. Actions read from the snapshot and
+# never hit MongoDB for full collection scans.
+#
+# The snapshot is authoritative: retrieval, the vector index and the
+# gazetteer are built from it, so documents are never evicted.
+# CATALOG_MAX_DOCUMENTS is a hard cap per collection; a larger collection is
+# truncated at load and further inserts are dropped, with a warning.
+#
+# When a load fails, reads serve the (empty or previous) snapshot instead of
+# querying MongoDB again on every request; the refresh thread retries every
+# CATALOG_POLL_SECONDS, and reads retry once CATALOG_TTL_SECONDS has passed.
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from actions.mongo import get_db
+
+logger = logging.getLogger(__name__)
+
+COLLECTIONS = ("brokers", "properties", "projects")
+
+
+class CatalogCache:
+    def __init__(
+        self,
+        db_factory=get_db,
+        collections=COLLECTIONS,
+        ttl_seconds=3600,
+        max_documents=200000,
+        poll_seconds=30,
+        watermark_field="updatedAt",
+        refresh_mode="auto",
+    ):
+        self._db_factory = db_factory
+        self.collections = tuple(collections)
+        self.ttl_seconds = ttl_seconds
+        self.max_documents = max_documents
+        self.poll_seconds = poll_seconds
+        self.watermark_field = watermark_field
+        self.refresh_mode = refresh_mode
+        self._lock = threading.RLock()
+        self._docs = {name: OrderedDict() for name in self.collections}
+        self._snapshots = {}
+        self._versions = {name: 0 for name in self.collections}
+        self._loaded_at = {}
+        self._failed_at = {}
+        self._capped = set()
+        self._watermarks = {}
+        self._listeners = []
+        self._polling = set()
+        self._stop = threading.Event()
+        self._threads = []
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            ttl_seconds=float(os.getenv("CATALOG_TTL_SECONDS", "3600")),
+            max_documents=int(os.getenv("CATALOG_MAX_DOCUMENTS", "200000")),
+            poll_seconds=float(os.getenv("CATALOG_POLL_SECONDS", "30")),
+            watermark_field=os.getenv("CATALOG_WATERMARK_FIELD", "updatedAt"),
+            refresh_mode=os.getenv("CATALOG_REFRESH_MODE", "auto"),
+        )
+
+    # -- reads ---------------------------------------------------------------
+
+    def documents(self, collection):
+        """All cached documents of a collection, as an immutable snapshot."""
+        if collection not in self._loaded_at:
+            failed_at = self._failed_at.get(collection)
+            if failed_at is None or time.monotonic() - failed_at >= self.ttl_seconds:
+                self.reload(collection)
+        with self._lock:
+            snapshot = self._snapshots.get(collection)
+            if snapshot is None:
+                snapshot = tuple(self._docs[collection].values())
+                self._snapshots[collection] = snapshot
+            return snapshot
+
+    def get(self, collection, doc_id):
+        with self._lock:
+            return self._docs[collection].get(doc_id)
+
+    def version(self, collection):
+        """Monotonic counter bumped on every change; derived indexes key on it."""
+        return self._versions[collection]
+
+    def subscribe(self, callback):
+        """Register `callback(collection, doc_id)`; doc_id is None after a full reload."""
+        self._listeners.append(callback)
+
+    # -- writes --------------------------------------------------------------
+
+    def reload(self, collection):
+        try:
+            docs = list(self._db_factory()[collection].find())
+        except PyMongoError as e:
+            logger.warning("Catalog load of %s failed: %s", collection, e)
+            self._failed_at[collection] = time.monotonic()
+            return False
+        if len(docs) > self.max_documents:
+            logger.warning(
+                "Catalog %s has %d documents, over CATALOG_MAX_DOCUMENTS=%d; only the first %d are served",
+                collection, len(docs), self.max_documents, self.max_documents,
+            )
+            docs = docs[:self.max_documents]
+        with self._lock:
+            self._docs[collection] = OrderedDict((doc["_id"], doc) for doc in docs)
+            self._capped.discard(collection)
+            self._failed_at.pop(collection, None)
+            self._loaded_at[collection] = time.monotonic()
+            self._watermarks[collection] = max(
+                (doc[self.watermark_field] for doc in docs if doc.get(self.watermark_field) is not None),
+                default=None,
+            )
+            self._changed(collection)
+        logger.info("Catalog loaded %d %s", len(docs), collection)
+        self._notify(collection, None)
+        return True
+
+    def upsert(self, collection, doc):
+        with self._lock:
+            docs = self._docs[collection]
+            if doc["_id"] not in docs and len(docs) >= self.max_documents:
+                if collection not in self._capped:
+                    self._capped.add(collection)
+                    logger.warning("Catalog %s is at CATALOG_MAX_DOCUMENTS=%d; new documents are dropped",
+                                   collection, self.max_documents)
+                return
+            docs[doc["_id"]] = doc
+            watermark = doc.get(self.watermark_field)
+            if watermark is not None and (self._watermarks.get(collection) is None or watermark > self._watermarks[collection]):
+                self._watermarks[collection] = watermark
+            self._changed(collection)
+        self._notify(collection, doc["_id"])
+
+    def delete(self, collection, doc_id):
+        with self._lock:
+            if self._docs[collection].pop(doc_id, None) is None:
+                return
+            self._changed(collection)
+        self._notify(collection, doc_id)
+
+    def _changed(self, collection):
+        self._versions[collection] += 1
+        self._snapshots.pop(collection, None)
+
+    def _notify(self, collection, doc_id):
+        for callback in self._listeners:
+            try:
+                callback(collection, doc_id)
+            except Exception:
+                logger.exception("Catalog listener failed")
+
+    # -- refresh -------------------------------------------------------------
+
+    def start(self):
+        """Load every collection and start the background refresh threads."""
+        for collection in self.collections:
+            self.reload(collection)
+        if self.refresh_mode != "poll":
+            for collection in self.collections:
+                self._spawn(self._watch, collection)
+        else:
+            self._polling.update(self.collections)
+        self._spawn(self._maintain)
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _spawn(self, target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True, name=f"catalog-{target.__name__}")
+        thread.start()
+        self._threads.append(thread)
+
+    def _watch(self, collection):
+        resume_token = None
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                coll = self._db_factory()[collection]
+                with coll.watch(full_document="updateLookup", resume_after=resume_token, max_await_time_ms=1000) as stream:
+                    backoff = 1.0
+                    while not self._stop.is_set() and stream.alive:
+                        change = stream.try_next()
+                        if change is None:
+                            continue
+                        resume_token = stream.resume_token
+                        self._apply_change(collection, change)
+            except OperationFailure as e:
+                # Standalone servers have no change streams; fall back to polling.
+                logger.info("Change streams unavailable for %s (%s), polling on %s", collection, e, self.watermark_field)
+                self._polling.add(collection)
+                return
+            except PyMongoError as e:
+                logger.warning("Change stream on %s interrupted: %s", collection, e)
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+
+    def _apply_change(self, collection, change):
+        op = change.get("operationType")
+        if op in ("insert", "update", "replace"):
+            doc = change.get("fullDocument")
+            if doc is not None:
+                self.upsert(collection, doc)
+            else:
+                self.delete(collection, change["documentKey"]["_id"])
+        elif op == "delete":
+            self.delete(collection, change["documentKey"]["_id"])
+        elif op in ("drop", "rename", "invalidate"):
+            self.reload(collection)
+
+    def _maintain(self):
+        while not self._stop.wait(self.poll_seconds):
+            now = time.monotonic()
+            for collection in self.collections:
+                loaded_at = self._loaded_at.get(collection)
+                if loaded_at is None or now - loaded_at >= self.ttl_seconds:
+                    self.reload(collection)
+                elif collection in self._polling:
+                    self._poll(collection)
+
+    def _poll(self, collection):
+        watermark = self._watermarks.get(collection)
+        query = {self.watermark_field: {"$gt": watermark}} if watermark is not None else {self.watermark_field: {"$exists": True}}
+        try:
+            changed = list(self._db_factory()[collection].find(query).sort(self.watermark_field, 1))
+        except PyMongoError as e:
+            logger.warning("Catalog poll of %s failed: %s", collection, e)
+            return
+        for doc in changed:
+            self.upsert(collection, doc)
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """Return the process-wide catalog cache, loading it on first use."""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = CatalogCache.from_env().start()
+    return _catalog
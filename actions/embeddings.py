@@ -0,0 +1,48 @@
+# Local text embeddings for similarity lookups.
+#
+# A hashing vectorizer: word unigrams, word bigrams and character trigrams
+# are hashed into a fixed number of buckets with signed counts, then
+# L2-normalized, so the dot product of two vectors is their cosine
+# similarity. No model files and no network; the same text always maps to
+# the same vector, in any process. Text is normalized as the NLU cache does
+# it (custom_components.nlu_cache.normalize_text).
+
+import functools
+import hashlib
+import re
+
+import numpy as np
+
+from custom_components.nlu_cache import normalize_text
+
+DEFAULT_DIMENSIONS = 512
+
+_WORD = re.compile(r"\w+")
+
+
+def features(text):
+    words = _WORD.findall(normalize_text(text))
+    yield from (f"w:{w}" for w in words)
+    yield from (f"b:{a} {b}" for a, b in zip(words, words[1:]))
+    for word in words:
+        padded = f" {word} "
+        yield from (f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+
+
+@functools.lru_cache(maxsize=1 << 17)
+def _bucket(feature, dimensions):
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+    value = int.from_bytes(digest, "little")
+    return value % dimensions, 1.0 if value >> 63 else -1.0
+
+
+def embed(text, dimensions=DEFAULT_DIMENSIONS):
+    """Unit-length float32 vector for `text` (all zeros for empty text)."""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for feature in features(text):
+        index, sign = _bucket(feature, dimensions)
+        vector[index] += sign
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    return vector
@@ -0,0 +1,331 @@
+# Compiler for MongoDB filters written by the LLM.
+#
+# The LLM's text is parsed into a small typed AST: only whitelisted fields
+# per collection and plain comparison operators are accepted, values are
+# checked against the field type, and anything else ($where, $expr, unknown
+# fields, deep nesting) is rejected before a query is built. Compiled plans
+# are cached by question template, so a question with a shape seen before
+# ("brokers in <city>") is answered without asking the LLM for a filter
+# again.
+
+import ast
+import json
+import re
+import threading
+from collections import OrderedDict
+
+from actions.schema import get_schema
+
+COMPARISONS = {"$eq", "$ne", "$gt", "$gte", "$lt", "$lte"}
+MEMBERSHIP = {"$in", "$nin"}
+LOGICAL = {"$and", "$or"}
+MAX_DEPTH = 4
+MAX_CONDITIONS = 16
+MAX_FILTER_CHARS = 2000
+
+
+class UnsafeFilterError(ValueError):
+    pass
+
+
+class Param:
+    """Placeholder for a value taken from the question at bind time."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f"Param({self.name!r})"
+
+
+class Condition:
+    def __init__(self, field, op, value):
+        self.field = field
+        self.op = op
+        self.value = value
+
+    def __repr__(self):
+        return f"Condition({self.field!r}, {self.op!r}, {self.value!r})"
+
+    def to_mongo(self, params):
+        value = self.value
+        if isinstance(value, Param):
+            value = params[value.name]
+        elif isinstance(value, list):
+            value = [params[v.name] if isinstance(v, Param) else v for v in value]
+        if self.op == "$eq":
+            return {self.field: value}
+        return {self.field: {self.op: value}}
+
+    def matches(self, doc, params):
+        expected = self.to_mongo(params)[self.field]
+        actual = doc.get(self.field)
+        if self.op == "$eq":
+            return _fold(actual) == _fold(expected)
+        expected = expected[self.op]
+        if self.op == "$ne":
+            return _fold(actual) != _fold(expected)
+        if self.op in MEMBERSHIP:
+            found = _fold(actual) in {_fold(v) for v in expected}
+            return found if self.op == "$in" else not found
+        if actual is None:
+            return False
+        try:
+            return {
+                "$gt": actual > expected,
+                "$gte": actual >= expected,
+                "$lt": actual < expected,
+                "$lte": actual <= expected,
+            }[self.op]
+        except TypeError:
+            return False
+
+    def conditions(self):
+        yield self
+
+
+class Logical:
+    def __init__(self, op, children):
+        self.op = op
+        self.children = children
+
+    def __repr__(self):
+        return f"Logical({self.op!r}, {self.children!r})"
+
+    def to_mongo(self, params):
+        if self.op == "$and":
+            merged = {}
+            # Flatten into one document when the fields do not collide.
+            for child in self.children:
+                part = child.to_mongo(params)
+                if set(part) & set(merged):
+                    return {"$and": [c.to_mongo(params) for c in self.children]}
+                merged.update(part)
+            return merged
+        return {"$or": [c.to_mongo(params) for c in self.children]}
+
+    def matches(self, doc, params):
+        results = (c.matches(doc, params) for c in self.children)
+        return all(results) if self.op == "$and" else any(results)
+
+    def conditions(self):
+        for child in self.children:
+            yield from child.conditions()
+
+
+def _fold(value):
+    return value.casefold() if isinstance(value, str) else value
+
+
+def _check_value(collection, field, value):
+    expected = get_schema()[collection].filter_types[field]
+    if isinstance(value, bool) or isinstance(value, (dict, list)):
+        raise UnsafeFilterError(f"Unsupported value for {field}: {value!r}")
+    if expected is str:
+        if not isinstance(value, (str, int, float)):
+            raise UnsafeFilterError(f"{field} expects text")
+        return str(value)
+    if isinstance(value, str):
+        try:
+            value = float(value.replace(",", ""))
+        except ValueError:
+            raise UnsafeFilterError(f"{field} expects a number, got {value!r}") from None
+    if not isinstance(value, (int, float)):
+        raise UnsafeFilterError(f"{field} expects a number")
+    return int(value) if expected is int else value
+
+
+def _parse_node(collection, node, depth):
+    if depth > MAX_DEPTH:
+        raise UnsafeFilterError("Filter is nested too deeply")
+    if not isinstance(node, dict):
+        raise UnsafeFilterError("Filter must be an object")
+    parts = []
+    for key, value in node.items():
+        if key in LOGICAL:
+            if not isinstance(value, list) or not value:
+                raise UnsafeFilterError(f"{key} expects a non-empty list")
+            parts.append(Logical(key, [_parse_node(collection, child, depth + 1) for child in value]))
+        elif key.startswith("$"):
+            raise UnsafeFilterError(f"Operator {key} is not allowed")
+        elif key not in get_schema()[collection].filter_types:
+            raise UnsafeFilterError(f"Field {key} is not queryable on {collection}")
+        elif isinstance(value, dict):
+            if not value:
+                raise UnsafeFilterError(f"Empty condition for {key}")
+            for op, operand in value.items():
+                if op in COMPARISONS:
+                    parts.append(Condition(key, op, _check_value(collection, key, operand)))
+                elif op in MEMBERSHIP:
+                    if not isinstance(operand, list):
+                        raise UnsafeFilterError(f"{op} expects a list")
+                    parts.append(Condition(key, op, [_check_value(collection, key, v) for v in operand]))
+                else:
+                    raise UnsafeFilterError(f"Operator {op} is not allowed")
+        else:
+            parts.append(Condition(key, "$eq", _check_value(collection, key, value)))
+    if len(parts) == 1:
+        return parts[0]
+    return Logical("$and", parts)
+
+
+def parse_llm_filter(text):
+    """Extract the first object literal from LLM output (JSON or Python dict syntax)."""
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end < start:
+        raise UnsafeFilterError("No filter object in LLM output")
+    body = text[start:end + 1]
+    if len(body) > MAX_FILTER_CHARS:
+        raise UnsafeFilterError("Filter is too long")
+    try:
+        return json.loads(body)
+    except ValueError:
+        pass
+    try:
+        return ast.literal_eval(body)
+    except (ValueError, SyntaxError) as e:
+        raise UnsafeFilterError(f"Unparseable filter: {e}") from None
+
+
+def compile_filter(collection, raw):
+    """Parse and validate a filter (dict or LLM text) into an AST."""
+    if isinstance(raw, str):
+        raw = parse_llm_filter(raw)
+    if raw == {}:
+        return Logical("$and", [])
+    tree = _parse_node(collection, raw, 0)
+    if sum(1 for _ in tree.conditions()) > MAX_CONDITIONS:
+        raise UnsafeFilterError("Filter has too many conditions")
+    return tree
+
+
+# -- plan cache --------------------------------------------------------------
+
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r"\s+")
+
+
+def templatize(question, values=()):
+    """Replace known literal values and numbers in `question` with placeholders.
+
+    Returns `(template, bindings)`: "brokers in Mumbai" with values ["Mumbai"]
+    becomes ("brokers in {v0}", {"v0": "Mumbai"}).
+    """
+    text = _SPACES.sub(" ", question.strip())
+    bindings = {}
+    for value in sorted({str(v) for v in values if v not in (None, "")}, key=len, reverse=True):
+        pattern = re.compile(rf"(?<!\w){re.escape(value)}(?!\w)", re.I)
+        if pattern.search(text):
+            name = f"v{len(bindings)}"
+            bindings[name] = value
+            text = pattern.sub("{" + name + "}", text)
+
+    def number(match):
+        name = f"v{len(bindings)}"
+        raw = match.group(0)
+        bindings[name] = float(raw) if "." in raw else int(raw)
+        return "{" + name + "}"
+
+    text = _NUMBER.sub(number, text)
+    return text.lower().rstrip(" ?.!"), bindings
+
+
+def parameterize(tree, bindings):
+    """Swap literal values that came from the question for Params, in place."""
+    by_value = {}
+    for name, value in bindings.items():
+        by_value.setdefault(_fold(value), name)
+    for condition in tree.conditions():
+        if isinstance(condition.value, list):
+            condition.value = [Param(by_value[_fold(v)]) if _fold(v) in by_value else v for v in condition.value]
+        elif _fold(condition.value) in by_value:
+            condition.value = Param(by_value[_fold(condition.value)])
+    return tree
+
+
+def params_of(tree):
+    names = set()
+    for condition in tree.conditions():
+        values = condition.value if isinstance(condition.value, list) else [condition.value]
+        names.update(v.name for v in values if isinstance(v, Param))
+    return names
+
+
+class CompiledPlan:
+    def __init__(self, collection, tree):
+        self.collection = collection
+        self.tree = tree
+        self.params = params_of(tree)
+
+    def bind(self, bindings):
+        """The native Mongo filter for these bindings, or None when a value is missing or has the wrong type.
+
+        Bound values are checked against their field's type like literals are
+        at compile time, so a numeric template bound with text is a miss.
+        """
+        if not self.params <= set(bindings):
+            return None
+        checked = dict(bindings)
+        for condition in self.tree.conditions():
+            values = condition.value if isinstance(condition.value, list) else [condition.value]
+            for param in values:
+                if not isinstance(param, Param):
+                    continue
+                try:
+                    checked[param.name] = _check_value(self.collection, condition.field, bindings[param.name])
+                except UnsafeFilterError:
+                    return None
+        return self.tree.to_mongo(checked)
+
+    def matches(self, doc, bindings):
+        return self.tree.matches(doc, bindings)
+
+
+class PlanCache:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, collection, template):
+        with self._lock:
+            plan = self._plans.get((collection, template))
+            if plan is None:
+                self.misses += 1
+                return None
+            self._plans.move_to_end((collection, template))
+            self.hits += 1
+            return plan
+
+    def put(self, collection, template, plan):
+        with self._lock:
+            self._plans[(collection, template)] = plan
+            self._plans.move_to_end((collection, template))
+            while len(self._plans) > self.max_entries:
+                self._plans.popitem(last=False)
+
+
+plan_cache = PlanCache()
+
+
+def cached_filter(collection, question, values=()):
+    """Look `question` up in the plan cache.
+
+    Returns `(mongo_filter, template, bindings)`; `mongo_filter` is None on a
+    miss, in which case the caller generates a filter and passes it to
+    `compile_and_cache` with the same template and bindings.
+    """
+    template, bindings = templatize(question, values)
+    plan = plan_cache.get(collection, template)
+    mongo_filter = plan.bind(bindings) if plan is not None else None
+    return mongo_filter, template, bindings
+
+
+def compile_and_cache(collection, template, bindings, raw):
+    """Compile an LLM-written filter, cache its plan under `template` and return the native filter."""
+    plan = CompiledPlan(collection, parameterize(compile_filter(collection, raw), bindings))
+    plan_cache.put(collection, template, plan)
+    return plan.bind(bindings)
@@ -0,0 +1,91 @@
+# Trigram inverted index for fuzzy document lookup.
+#
+# Replaces difflib.get_close_matches over every document blob: candidates are
+# found through a character-trigram inverted index and scored by the Dice
+# coefficient of their trigram sets, which retrieval blends with vector
+# similarity. Indexes are built once per catalog version.
+
+import heapq
+import threading
+from array import array
+from collections import defaultdict
+
+
+def document_blob(doc, fields):
+    return " ".join(str(v).lower() for k, v in doc.items() if k in fields and isinstance(v, (str, int, float)))
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FuzzyIndex:
+    def __init__(self, docs, fields, max_doc_frequency=0.5):
+        self.fields = frozenset(fields)
+        self.docs = list(docs)
+        self.blobs = [document_blob(doc, self.fields) for doc in self.docs]
+        self.max_doc_frequency = max_doc_frequency
+        postings = defaultdict(list)
+        self.gram_counts = array("I")
+        for doc_id, blob in enumerate(self.blobs):
+            grams = trigrams(blob)
+            self.gram_counts.append(len(grams))
+            for gram in grams:
+                postings[gram].append(doc_id)
+        self.postings = {gram: array("I", ids) for gram, ids in postings.items()}
+
+    def __len__(self):
+        return len(self.docs)
+
+    def scored_candidates(self, query, limit, max_postings=20000):
+        """`(dice, doc_id)` pairs for the best trigram matches of `query`."""
+        grams = trigrams(query)
+        if not grams:
+            return []
+        lists = sorted((self.postings[g] for g in grams if g in self.postings), key=len)
+        # Trigrams present in most documents barely discriminate; skip them
+        # unless nothing rarer is available, and stop once the rarest lists
+        # have touched enough postings.
+        max_df = max(1, int(len(self.docs) * self.max_doc_frequency))
+        selective = [ids for ids in lists if len(ids) <= max_df] or lists[:1]
+        shared = defaultdict(int)
+        touched = 0
+        for ids in selective:
+            if touched and touched + len(ids) > max_postings:
+                break
+            touched += len(ids)
+            for doc_id in ids:
+                shared[doc_id] += 1
+        n_query = len(grams)
+        gram_counts = self.gram_counts
+        return heapq.nlargest(
+            limit, ((2.0 * count / (n_query + gram_counts[doc_id]), doc_id) for doc_id, count in shared.items())
+        )
+
+    def dice(self, query, doc_id):
+        grams = trigrams(query)
+        if not grams:
+            return 0.0
+        return 2.0 * len(grams & trigrams(self.blobs[doc_id])) / (len(grams) + self.gram_counts[doc_id])
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_fuzzy_index(catalog, collection, fields):
+    """Index for the current version of `collection`, built on first use."""
+    key = (collection, frozenset(fields))
+    version = catalog.version(collection)
+    cached = _indexes.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with _indexes_lock:
+        cached = _indexes.get(key)
+        if cached is None or cached[0] != version:
+            docs = catalog.documents(collection)
+            version = catalog.version(collection)
+            cached = (version, FuzzyIndex(docs, fields))
+            _indexes[key] = cached
+    return cached[1]
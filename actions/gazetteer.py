@@ -0,0 +1,180 @@
+# Catalog gazetteer: typed values found in a message in one pass.
+#
+# Every distinct city, company, project/broker/property name, block name,
+# category, project status and property type in the catalog is compiled into
+# one Aho-Corasick automaton over normalized text (lower case, words joined by
+# single spaces). Scanning a message is linear in its length however many
+# values the catalog holds, and yields the leftmost-longest whole-word
+# matches, each tagged with the collections and fields it belongs to and the
+# value exactly as stored, so filters built from it are plain equality
+# matches MongoDB can serve from an index.
+#
+# The automaton is rebuilt when the catalog version of any collection
+# changes, in the background so requests keep using the previous one.
+
+import re
+import threading
+from collections import deque
+
+from actions.schema import get_schema
+
+# Fields whose values are worth recognising in a message, per collection.
+GAZETTEER_FIELDS = get_schema().fields("gazetteer")
+
+# Shorter values ("A", "12") match too much ordinary text.
+MIN_LENGTH = 3
+
+_WORD = re.compile(r"\w+")
+
+
+def normalize(text):
+    return " ".join(_WORD.findall(str(text).lower()))
+
+
+class Automaton:
+    """Aho-Corasick automaton over a fixed set of normalized patterns."""
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [-1]  # pattern ending at the node
+        self._link = [0]     # nearest node on the fail chain with an output
+        for index, pattern in enumerate(self.patterns):
+            node = 0
+            for char in pattern:
+                nxt = self._goto[node].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(-1)
+                    self._link.append(0)
+                node = nxt
+            self._output[node] = index
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                target = self._fail[child]
+                self._link[child] = target if self._output[target] >= 0 else self._link[target]
+
+    def iter(self, text):
+        """`(end, pattern_index)` for every occurrence, overlapping ones included."""
+        goto, fail, output, link = self._goto, self._fail, self._output, self._link
+        node = 0
+        for end, char in enumerate(text, 1):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            hit = node if output[node] >= 0 else link[node]
+            while hit:
+                yield end, output[hit]
+                hit = link[hit]
+
+
+class Match:
+    __slots__ = ("text", "start", "end", "values")
+
+    def __init__(self, text, start, end, values):
+        self.text = text
+        self.start = start
+        self.end = end
+        self.values = values  # [(collection, field, stored value), ...]
+
+    def __repr__(self):
+        return f"Match({self.text!r}, {self.values!r})"
+
+
+class Gazetteer:
+    def __init__(self, docs_by_collection, fields=GAZETTEER_FIELDS):
+        values = {}
+        for collection, docs in docs_by_collection.items():
+            for doc in docs:
+                for field in fields.get(collection, ()):
+                    value = doc.get(field)
+                    if not isinstance(value, str):
+                        continue
+                    key = normalize(value)
+                    if len(key) >= MIN_LENGTH and not key.isdigit():
+                        values.setdefault(key, {}).setdefault((collection, field), value)
+        self._values = [list((c, f, v) for (c, f), v in entries.items()) for entries in values.values()]
+        self._automaton = Automaton(values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def scan(self, text):
+        """Leftmost-longest, non-overlapping whole-word matches in `text`."""
+        normalized = normalize(text)
+        found = []
+        for end, index in self._automaton.iter(normalized):
+            start = end - len(self._automaton.patterns[index])
+            if (start == 0 or normalized[start - 1] == " ") and (end == len(normalized) or normalized[end] == " "):
+                found.append((start, end, index))
+        found.sort(key=lambda m: (m[0], m[0] - m[1]))
+        matches, position = [], 0
+        for start, end, index in found:
+            if start >= position:
+                matches.append(Match(normalized[start:end], start, end, self._values[index]))
+                position = end
+        return matches
+
+    def extract(self, text):
+        """`{collection: {field: [stored values]}}` for everything recognised in `text`."""
+        typed = {}
+        for match in self.scan(text):
+            for collection, field, value in match.values:
+                found = typed.setdefault(collection, {}).setdefault(field, [])
+                if value not in found:
+                    found.append(value)
+        return typed
+
+
+_gazetteer = None
+_gazetteer_versions = None
+_gazetteer_lock = threading.Lock()
+_rebuilding = threading.Event()
+
+
+def _build(catalog, collections):
+    global _gazetteer, _gazetteer_versions
+    docs = {c: catalog.documents(c) for c in collections}
+    # Read after documents(): a first load bumps the version.
+    versions = tuple(catalog.version(c) for c in collections)
+    gazetteer = Gazetteer(docs)
+    _gazetteer, _gazetteer_versions = gazetteer, versions
+
+
+def _rebuild(catalog, collections):
+    try:
+        with _gazetteer_lock:
+            _build(catalog, collections)
+    finally:
+        _rebuilding.clear()
+
+
+def get_gazetteer(catalog, collections=tuple(GAZETTEER_FIELDS)):
+    """Gazetteer for the current catalog.
+
+    The first call builds it; after a catalog change the previous one keeps
+    serving while a background thread builds the replacement.
+    """
+    versions = tuple(catalog.version(c) for c in collections)
+    if _gazetteer is not None and _gazetteer_versions == versions:
+        return _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                _build(catalog, collections)
+    elif not _rebuilding.is_set():
+        _rebuilding.set()
+        threading.Thread(target=_rebuild, args=(catalog, collections), name="gazetteer-rebuild", daemon=True).start()
+    return _gazetteer
@@ -0,0 +1,169 @@
+# Local CPU generation with llama.cpp (pip install llama-cpp-python).
+#
+# A drop-in GenerationBackend for the Together client: same calls, no
+# network. The model is a quantized GGUF file (e.g. a Q4_K_M Llama 3 8B
+# Instruct) loaded `instances` times; each instance generates one prompt at a
+# time on its own worker thread, so `instances` is the concurrency limit and
+# further requests queue.
+#
+# Prompt-prefix reuse: llama.cpp keeps the KV cache of the previous prompt
+# and only evaluates the tokens after the shared prefix, and a RAM state
+# cache (`prefix_cache_mb`) keeps the states of earlier prompts too. The
+# extraction and answer prompts start with long fixed instructions, so
+# requests are routed to an idle instance that last served the same prefix,
+# and batches are ordered so prompts sharing a prefix run back to back.
+#
+# Settings (env over endpoints.yml `llm.llama_cpp`): LLAMA_MODEL_PATH /
+# model_path, LLAMA_N_CTX / n_ctx (4096), LLAMA_N_THREADS / n_threads,
+# LLAMA_N_BATCH / n_batch (512), LLAMA_INSTANCES / instances (1),
+# LLAMA_PREFIX_CACHE_MB / prefix_cache_mb (256).
+
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from actions.llm_client import GenerationBackend, LLMError
+
+logger = logging.getLogger(__name__)
+
+# Characters that identify a prompt's fixed instruction prefix for routing.
+PREFIX_CHARS = 200
+_STREAM_END = object()
+
+
+class _Instance:
+    __slots__ = ("llm", "prefix")
+
+    def __init__(self, llm):
+        self.llm = llm
+        self.prefix = None
+
+
+class LlamaCppBackend(GenerationBackend):
+    def __init__(self, model_path, n_ctx=4096, n_threads=None, n_batch=512, instances=1, prefix_cache_mb=256):
+        try:
+            from llama_cpp import Llama, LlamaRAMCache
+        except ImportError as e:
+            raise LLMError("The llama_cpp backend needs llama-cpp-python (pip install llama-cpp-python)") from e
+        if not model_path or not os.path.exists(model_path):
+            raise LLMError(f"GGUF model not found: {model_path!r} (set LLAMA_MODEL_PATH)")
+        self.model = os.path.basename(model_path)
+        self.instances = max(1, int(instances))
+        self._idle = []
+        for _ in range(self.instances):
+            llm = Llama(model_path=model_path, n_ctx=n_ctx, n_threads=n_threads, n_batch=n_batch, verbose=False)
+            if prefix_cache_mb:
+                llm.set_cache(LlamaRAMCache(capacity_bytes=int(prefix_cache_mb) << 20))
+            self._idle.append(_Instance(llm))
+        self._available = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=self.instances, thread_name_prefix="llama-cpp")
+        logger.info("Loaded %s x%d (n_ctx=%d)", self.model, self.instances, n_ctx)
+
+    @staticmethod
+    def _model_path(**settings):
+        return os.getenv("LLAMA_MODEL_PATH", settings.get("model_path"))
+
+    @classmethod
+    def model_name(cls, **settings):
+        """What `.model` will be: the GGUF file name."""
+        path = cls._model_path(**settings)
+        return os.path.basename(path) if path else None
+
+    @classmethod
+    def from_env(cls, **settings):
+        n_threads = os.getenv("LLAMA_N_THREADS", settings.get("n_threads"))
+        return cls(
+            model_path=cls._model_path(**settings),
+            n_ctx=int(os.getenv("LLAMA_N_CTX", settings.get("n_ctx", 4096))),
+            n_threads=int(n_threads) if n_threads else None,
+            n_batch=int(os.getenv("LLAMA_N_BATCH", settings.get("n_batch", 512))),
+            instances=int(os.getenv("LLAMA_INSTANCES", settings.get("instances", 1))),
+            prefix_cache_mb=int(os.getenv("LLAMA_PREFIX_CACHE_MB", settings.get("prefix_cache_mb", 256))),
+        )
+
+    # -- public API ----------------------------------------------------------
+
+    async def acomplete(self, prompt, max_tokens=100, temperature=0.7, top_p=0.7, timeout=None, **params):
+        future = self._executor.submit(self._generate, prompt, max_tokens, temperature, top_p, params)
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+
+    async def astream(self, prompt, max_tokens=100, temperature=0.7, top_p=0.7, timeout=None, **params):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def emit(item):
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+
+        future = self._executor.submit(self._stream, prompt, max_tokens, temperature, top_p, params, emit)
+        future.add_done_callback(lambda _: emit(_STREAM_END))
+        while True:
+            item = await queue.get()
+            if item is _STREAM_END:
+                break
+            yield item
+        await asyncio.wrap_future(future)
+
+    def complete(self, prompt, max_tokens=100, temperature=0.7, top_p=0.7, timeout=None, **params):
+        return self._executor.submit(self._generate, prompt, max_tokens, temperature, top_p, params).result(timeout)
+
+    def complete_many(self, prompts, max_parallel=None, max_tokens=100, temperature=0.7, top_p=0.7, timeout=None, **params):
+        """Complete a batch, prompts sharing a prefix back to back; results in prompt order.
+
+        At most `instances` prompts run at once whatever `max_parallel` says.
+        A failed prompt yields its exception instead of a string.
+        """
+        order = sorted(range(len(prompts)), key=lambda i: prompts[i])
+        futures = {i: self._executor.submit(self._generate, prompts[i], max_tokens, temperature, top_p, params) for i in order}
+        results = []
+        for i in range(len(prompts)):
+            try:
+                results.append(futures[i].result(timeout))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # -- internals (run on the worker threads) ---------------------------------
+
+    def _acquire(self, prompt):
+        """An idle instance, preferring one whose KV cache already holds the prompt's prefix."""
+        prefix = prompt[:PREFIX_CHARS]
+        with self._available:
+            while not self._idle:
+                self._available.wait()
+            for i, instance in enumerate(self._idle):
+                if instance.prefix == prefix:
+                    return self._idle.pop(i)
+            return self._idle.pop()
+
+    def _release(self, instance, prompt):
+        instance.prefix = prompt[:PREFIX_CHARS]
+        with self._available:
+            self._idle.append(instance)
+            self._available.notify()
+
+    def _generate(self, prompt, max_tokens, temperature, top_p, params):
+        instance = self._acquire(prompt)
+        try:
+            output = instance.llm(prompt, max_tokens=max_tokens, temperature=temperature, top_p=top_p, **params)
+            return output["choices"][0]["text"].strip()
+        except (ValueError, RuntimeError) as e:
+            raise LLMError(f"llama.cpp generation failed: {e}") from e
+        finally:
+            self._release(instance, prompt)
+
+    def _stream(self, prompt, max_tokens, temperature, top_p, params, emit):
+        instance = self._acquire(prompt)
+        try:
+            for chunk in instance.llm(prompt, max_tokens=max_tokens, temperature=temperature, top_p=top_p, stream=True, **params):
+                text = chunk["choices"][0].get("text") or ""
+                if text:
+                    emit(text)
+        except (ValueError, RuntimeError) as e:
+            raise LLMError(f"llama.cpp generation failed: {e}") from e
+        finally:
+            self._release(instance, prompt)
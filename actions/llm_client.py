@@ -0,0 +1,477 @@
+# Shared text generation clients.
+#
+# All LLM call sites go through `get_llm_client()`, which returns one shared
+# GenerationBackend per process. The backend is chosen by LLM_BACKEND or the
+# `llm:` section of endpoints.yml (the NLU component can override it in
+# config.yml):
+#
+# * `together` (LLMClient): the Together completions API, with a keep-alive
+#   connection pool, a concurrency limit, retry/backoff and a circuit
+#   breaker. The client owns a private event loop running in a daemon
+#   thread: async callers await it from any loop (the action server's,
+#   Rasa's), and sync callers use the blocking shim without needing a loop of
+#   their own.
+# * `llama_cpp` (actions.llama_cpp_backend.LlamaCppBackend): a quantized GGUF
+#   model on the CPU, no network involved.
+
+import abc
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+import aiohttp
+import yaml
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+TOGETHER_COMPLETIONS_URL = "https://api.together.xyz/v1/completions"
+DEFAULT_MODEL = "meta-llama/Llama-3-8b-chat-hf"
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+_STREAM_END = object()
+
+
+class LLMError(Exception):
+    pass
+
+
+class CircuitOpenError(LLMError):
+    pass
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures and lets a single
+    trial call through once `reset_timeout` seconds have passed."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """Free the trial slot of a call that ended without an outcome (e.g. cancelled)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+class _LoopThread:
+    """Event loop running forever in a daemon thread."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True, name="llm-client-loop")
+        self.thread.start()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+
+_loop_thread = None
+_loop_thread_lock = threading.Lock()
+
+
+def _get_loop_thread():
+    global _loop_thread
+    if _loop_thread is None:
+        with _loop_thread_lock:
+            if _loop_thread is None:
+                _loop_thread = _LoopThread()
+    return _loop_thread
+
+
+class GenerationBackend(abc.ABC):
+    """What every generation backend offers the NLU component and the actions.
+
+    A backend missing one of the abstract methods fails when it is constructed.
+    """
+
+    model = None
+
+    @property
+    def ready(self):
+        """Whether the backend can generate at all (e.g. has its credentials)."""
+        return True
+
+    @abc.abstractmethod
+    async def acomplete(self, prompt, max_tokens=100, temperature=0.7, top_p=0.7, timeout=None, **params):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def astream(self, prompt, max_tokens=100, temperature=0.7, top_p=0.7, timeout=None, **params):
+        raise NotImplementedError
+        yield
+
+    @abc.abstractmethod
+    def complete(self, prompt, max_tokens=100, temperature=0.7, top_p=0.7, timeout=None, **params):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def complete_many(self, prompts, max_parallel=None, max_tokens=100, temperature=0.7, top_p=0.7, timeout=None, **params):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class UnavailableBackend(GenerationBackend):
+    """Stands in for a backend that could not be constructed (e.g. a missing GGUF model).
+
+    It is never ready, so actions give their "unavailable" reply; calls fail
+    with the construction error.
+    """
+
+    def __init__(self, name, reason):
+        self.model = name
+        self.reason = reason
+
+    @property
+    def ready(self):
+        return False
+
+    async def acomplete(self, prompt, max_tokens=100, temperature=0.7, top_p=0.7, timeout=None, **params):
+        raise LLMError(self.reason)
+
+    async def astream(self, prompt, max_tokens=100, temperature=0.7, top_p=0.7, timeout=None, **params):
+        raise LLMError(self.reason)
+        yield
+
+    def complete(self, prompt, max_tokens=100, temperature=0.7, top_p=0.7, timeout=None, **params):
+        raise LLMError(self.reason)
+
+    def complete_many(self, prompts, max_parallel=None, max_tokens=100, temperature=0.7, top_p=0.7, timeout=None, **params):
+        return [LLMError(self.reason) for _ in prompts]
+
+
+class LLMClient(GenerationBackend):
+    def __init__(
+        self,
+        api_key=None,
+        url=TOGETHER_COMPLETIONS_URL,
+        model=DEFAULT_MODEL,
+        timeout=30.0,
+        max_concurrency=8,
+        max_retries=3,
+        backoff_base=0.5,
+        backoff_max=8.0,
+        breaker=None,
+    ):
+        self.api_key = api_key
+        self.url = url
+        self.model = model
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self._runner = _get_loop_thread()
+        self._session = None
+        self._semaphore = None
+
+    @staticmethod
+    def model_name(**settings):
+        return os.getenv("LLM_MODEL", settings.get("model", DEFAULT_MODEL))
+
+    @classmethod
+    def from_env(cls, api_key=None, **settings):
+        """Settings from the environment, falling back to `settings` (endpoints.yml)."""
+        return cls(
+            api_key=api_key or os.getenv("TOGETHER_API_KEY"),
+            url=os.getenv("LLM_COMPLETIONS_URL", settings.get("url", TOGETHER_COMPLETIONS_URL)),
+            model=cls.model_name(**settings),
+            timeout=float(os.getenv("LLM_TIMEOUT_SECONDS", settings.get("timeout", 30))),
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", settings.get("max_concurrency", 8))),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", settings.get("max_retries", 3))),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+                reset_timeout=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30")),
+            ),
+        )
+
+    @property
+    def ready(self):
+        return bool(self.api_key)
+
+    # -- public API ----------------------------------------------------------
+
+    async def acomplete(self, prompt, max_tokens=100, temperature=0.7, top_p=0.7, timeout=None, **params):
+        """Return the completion text for `prompt`."""
+        future = self._runner.submit(self._complete(prompt, max_tokens, temperature, top_p, timeout, params))
+        return await asyncio.wrap_future(future)
+
+    async def astream(self, prompt, max_tokens=100, temperature=0.7, top_p=0.7, timeout=None, **params):
+        """Yield the completion for `prompt` as it is generated (server-sent events)."""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def emit(item):
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+
+        future = self._runner.submit(self._stream(prompt, max_tokens, temperature, top_p, timeout, params, emit))
+        future.add_done_callback(lambda _: emit(_STREAM_END))
+        while True:
+            item = await queue.get()
+            if item is _STREAM_END:
+                break
+            yield item
+        # Surfaces any error raised by the stream.
+        await asyncio.wrap_future(future)
+
+    def complete(self, prompt, max_tokens=100, temperature=0.7, top_p=0.7, timeout=None, **params):
+        """Blocking shim around `acomplete` for synchronous callers."""
+        future = self._runner.submit(self._complete(prompt, max_tokens, temperature, top_p, timeout, params))
+        return future.result()
+
+    def complete_many(self, prompts, max_parallel=None, max_tokens=100, temperature=0.7, top_p=0.7, timeout=None, **params):
+        """Complete several prompts concurrently, at most `max_parallel` at a time.
+
+        Results are returned in prompt order; a failed prompt yields its
+        exception instead of a string so one error does not sink the batch.
+        """
+        future = self._runner.submit(
+            self._complete_many(prompts, max_parallel, (max_tokens, temperature, top_p, timeout, params))
+        )
+        return future.result()
+
+    def close(self):
+        if self._session is not None:
+            self._runner.submit(self._session.close()).result()
+            self._session = None
+
+    # -- internals (run on the client loop) ----------------------------------
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"},
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        # Full jitter: uniform in [0, base * 2^attempt], capped.
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _complete_many(self, prompts, max_parallel, args):
+        limit = asyncio.Semaphore(max_parallel or self.max_concurrency)
+
+        async def one(prompt):
+            async with limit:
+                return await self._complete(prompt, *args)
+
+        return await asyncio.gather(*(one(prompt) for prompt in prompts), return_exceptions=True)
+
+    async def _complete(self, prompt, max_tokens, temperature, top_p, timeout, params):
+        async def consume(response):
+            body = await response.json()
+            return body["choices"][0]["text"].strip()
+
+        data = self._payload(prompt, max_tokens, temperature, top_p, params)
+        return await self._request(data, timeout, consume)
+
+    async def _stream(self, prompt, max_tokens, temperature, top_p, timeout, params, emit):
+        async def consume(response):
+            emitted = False
+            try:
+                async for raw in response.content:
+                    line = raw.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    payload = line[len("data:"):].strip()
+                    if payload == "[DONE]":
+                        break
+                    text = json.loads(payload)["choices"][0].get("text") or ""
+                    if text:
+                        emitted = True
+                        emit(text)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if not emitted:
+                    raise
+                # Part of the answer is already out; retrying would repeat it.
+                self.breaker.record_failure()
+                raise LLMError(f"LLM stream interrupted: {e!r}") from e
+
+        data = self._payload(prompt, max_tokens, temperature, top_p, params)
+        data["stream"] = True
+        await self._request(data, timeout, consume)
+
+    def _payload(self, prompt, max_tokens, temperature, top_p, params):
+        return {
+            "model": self.model,
+            "prompt": prompt,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "top_p": top_p,
+            **params,
+        }
+
+    async def _request(self, data, timeout, consume):
+        if not self.breaker.allow():
+            raise CircuitOpenError("LLM circuit breaker is open")
+        try:
+            return await self._attempt(data, timeout, consume)
+        finally:
+            # A cancelled half-open trial records neither outcome; without this
+            # the breaker would refuse every later call.
+            self.breaker.release()
+
+    async def _attempt(self, data, timeout, consume):
+        session = self._get_session()
+        client_timeout = aiohttp.ClientTimeout(total=timeout or self.timeout)
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                async with self._semaphore:
+                    async with session.post(self.url, json=data, timeout=client_timeout) as response:
+                        if response.status in RETRY_STATUSES and attempt < self.max_retries:
+                            retry_after = response.headers.get("Retry-After")
+                            error = LLMError(f"HTTP {response.status}")
+                        else:
+                            response.raise_for_status()
+                            result = await consume(response)
+                            self.breaker.record_success()
+                            return result
+            except (aiohttp.ClientResponseError, KeyError, IndexError, ValueError) as e:
+                # Non-retryable status or malformed body.
+                self.breaker.record_failure()
+                raise LLMError(str(e)) from e
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries:
+                    self.breaker.record_failure()
+                    raise LLMError(f"LLM request failed after {attempt + 1} attempts: {e!r}") from e
+                error = e
+            delay = self._backoff(attempt, retry_after)
+            logger.warning("LLM call failed (%s), retrying in %.2fs", error, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+def endpoint_settings(path=None):
+    """The `llm:` section of endpoints.yml (LLM_ENDPOINTS_FILE), or {}.
+
+    It names the default `backend` and holds one settings block per backend.
+    """
+    path = path or os.getenv("LLM_ENDPOINTS_FILE", "endpoints.yml")
+    try:
+        with open(path, encoding="utf-8") as f:
+            endpoints = yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError):
+        return {}
+    return dict(endpoints.get("llm") or {})
+
+
+def _llama_cpp_backend(api_key, settings):
+    from actions.llama_cpp_backend import LlamaCppBackend
+
+    return LlamaCppBackend.from_env(**settings)
+
+
+def _llama_cpp_model(settings):
+    from actions.llama_cpp_backend import LlamaCppBackend
+
+    return LlamaCppBackend.model_name(**settings)
+
+
+BACKENDS = {
+    "together": lambda api_key, settings: LLMClient.from_env(api_key, **settings),
+    "llama_cpp": _llama_cpp_backend,
+}
+# What each backend reports as `.model`, worked out without constructing it.
+MODEL_NAMES = {
+    "together": lambda settings: LLMClient.model_name(**settings),
+    "llama_cpp": _llama_cpp_model,
+}
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def backend_settings(backend=None, **overrides):
+    """`(name, settings)` of the backend get_llm_client(backend=..., **overrides) builds."""
+    config = endpoint_settings()
+    name = backend or os.getenv("LLM_BACKEND") or config.get("backend") or "together"
+    return name, {**(config.get(name) or {}), **overrides}
+
+
+def backend_model(backend=None, **overrides):
+    """The `.model` of that backend, without loading it (cache namespaces key on it)."""
+    name, settings = backend_settings(backend, **overrides)
+    model_name = MODEL_NAMES.get(name)
+    return model_name(settings) if model_name else name
+
+
+def get_llm_client(api_key=None, backend=None, **overrides):
+    """Process-wide backend per (backend, API key, overrides).
+
+    The backend defaults to LLM_BACKEND, then `llm.backend` in endpoints.yml,
+    then `together`; its settings come from the matching block of the `llm:`
+    section, updated with `overrides` (components pass theirs from
+    config.yml). A backend that fails to construct is replaced by an
+    UnavailableBackend, cached like any other, so the error is logged once
+    and not retried on every turn.
+    """
+    api_key = api_key or os.getenv("TOGETHER_API_KEY")
+    key = (backend, api_key, tuple(sorted(overrides.items())))
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                name, settings = backend_settings(backend, **overrides)
+                try:
+                    if name not in BACKENDS:
+                        raise LLMError(f"Unknown LLM backend {name!r}, expected one of {sorted(BACKENDS)}")
+                    client = BACKENDS[name](api_key, settings)
+                except LLMError as e:
+                    logger.error("LLM backend %s unavailable: %s", name, e)
+                    client = UnavailableBackend(name, str(e))
+                _clients[key] = client
+    return client
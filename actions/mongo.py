@@ -0,0 +1,223 @@
+# Process-wide MongoDB connection management for the action server.
+#
+# Every action shares a single MongoClient (and therefore a single connection
+# pool per server) instead of opening a new client per turn. Pool behaviour is
+# configured through environment variables so it can be sized per deployment.
+# Async actions use PyMongo's AsyncMongoClient, one per event loop, with the
+# same pool options and metrics.
+
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import deque
+
+from dotenv import load_dotenv
+from pymongo import AsyncMongoClient, MongoClient, monitoring
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return int(value)
+
+
+def client_options():
+    """Connection pool options read from the environment."""
+    return {
+        "maxPoolSize": _env_int("MONGODB_MAX_POOL_SIZE", 50),
+        "minPoolSize": _env_int("MONGODB_MIN_POOL_SIZE", 0),
+        "maxIdleTimeMS": _env_int("MONGODB_MAX_IDLE_TIME_MS", 60000),
+        "waitQueueTimeoutMS": _env_int("MONGODB_WAIT_QUEUE_TIMEOUT_MS", 5000),
+        "heartbeatFrequencyMS": _env_int("MONGODB_HEARTBEAT_FREQUENCY_MS", 10000),
+        "serverSelectionTimeoutMS": _env_int("MONGODB_SERVER_SELECTION_TIMEOUT_MS", 5000),
+        "connectTimeoutMS": _env_int("MONGODB_CONNECT_TIMEOUT_MS", 5000),
+    }
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Counts connection pool events so the pool can be sized against traffic.
+
+    Every checkout's wait (start to checked out, as reported by the driver)
+    goes into a window of the most recent `window` waits, summarized as
+    avg/p95/max. Waits over `contended_ms` (MONGODB_CONTENDED_WAIT_MS) count
+    as contended: the checkout had to wait for a connection to free up or be
+    opened.
+    """
+
+    def __init__(self, contended_ms=None, window=1024):
+        self.contended_ms = contended_ms if contended_ms is not None else _env_int("MONGODB_CONTENDED_WAIT_MS", 5)
+        self.window = window
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.checkins = 0
+            self.waiting = 0
+            self.max_waiting = 0
+            self.contended = 0
+            self.wait_times_ms = deque(maxlen=self.window)
+            self.connections_created = 0
+            self.connections_closed = 0
+            self.pool_clears = 0
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "in_use": self.checkouts - self.checkins,
+                "waiting": self.waiting,
+                "max_waiting": self.max_waiting,
+                "contended_checkouts": self.contended,
+                "checkout_wait_ms": self._wait_summary(),
+                "open_sockets": self.connections_created - self.connections_closed,
+                "connections_created": self.connections_created,
+                "connections_closed": self.connections_closed,
+                "pool_clears": self.pool_clears,
+            }
+
+    def _wait_summary(self):
+        waits = sorted(self.wait_times_ms)
+        if not waits:
+            return {"count": 0, "avg": 0.0, "p95": 0.0, "max": 0.0}
+        return {
+            "count": len(waits),
+            "avg": sum(waits) / len(waits),
+            "p95": waits[min(len(waits) - 1, int(len(waits) * 0.95))],
+            "max": waits[-1],
+        }
+
+    def _checkout_finished(self, event):
+        self.waiting = max(0, self.waiting - 1)
+        # `duration` (seconds) is only reported by newer drivers.
+        duration = getattr(event, "duration", None)
+        if duration is not None:
+            wait_ms = duration * 1000.0
+            self.wait_times_ms.append(wait_ms)
+            if wait_ms > self.contended_ms:
+                self.contended += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed += 1
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+            self._checkout_finished(event)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checkouts += 1
+            self._checkout_finished(event)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checkins += 1
+
+
+pool_metrics = PoolMetrics()
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_mongo_client():
+    """Return the shared MongoClient, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                mongo_uri = os.getenv("MONGODB_URI")
+                options = client_options()
+                logger.info("Creating shared MongoClient with pool options %s", options)
+                _client = MongoClient(mongo_uri, event_listeners=[pool_metrics], **options)
+    return _client
+
+
+def get_db(name=None):
+    return get_mongo_client()[name or os.getenv("MONGODB_DB", "homelead")]
+
+
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_mongo_client():
+    """Return the AsyncMongoClient for the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        options = client_options()
+        logger.info("Creating shared AsyncMongoClient with pool options %s", options)
+        client = AsyncMongoClient(os.getenv("MONGODB_URI"), event_listeners=[pool_metrics], **options)
+        _async_clients[loop] = client
+    return client
+
+
+def get_async_db(name=None):
+    return get_async_mongo_client()[name or os.getenv("MONGODB_DB", "homelead")]
+
+
+def ping():
+    """Health check against the shared client. Returns the round trip in seconds or None."""
+    start = time.perf_counter()
+    try:
+        get_mongo_client().admin.command("ping")
+    except Exception as e:
+        logger.warning("MongoDB health check failed: %s", e)
+        return None
+    return time.perf_counter() - start
+
+
+def close_mongo_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+atexit.register(close_mongo_client)
+
+
+if __name__ == "__main__":
+    rtt = ping()
+    print("MongoDB ping:", "failed" if rtt is None else f"{rtt * 1000:.1f} ms")
+    print("Pool metrics:", pool_metrics.snapshot())
@@ -0,0 +1,138 @@
+# Keyset pagination for "list" questions.
+#
+# A page is read with a projection to the fields `display_name` needs,
+# sorted by _id and resumed with `_id > last seen id`, so page N costs the
+# same as page 1 and the server never returns more than a page (plus one
+# document to tell whether another page exists). The cursor is consumed in
+# batches with `async for` instead of being materialized.
+#
+# The position is kept in the `list_cursor` slot as an opaque resume token
+# (collection, filter, last _id, documents shown so far), so a "show more"
+# follow-up continues exactly where the previous page stopped. The slot can be
+# set by the client, so a token is only used when its collection is listable
+# and its filter holds nothing but list fields compared by equality or $in.
+#
+# Settings: LIST_PAGE_SIZE (20), LIST_BATCH_SIZE (100).
+
+import base64
+import os
+import re
+
+from bson import json_util
+
+from actions.schema import get_schema
+
+RESUME_SLOT = "list_cursor"
+
+# Fields display_name() reads, per collection.
+DISPLAY_FIELDS = get_schema().fields("display")
+# Fields a list filter (and so a resume token) may use, per collection.
+LIST_FILTER_FIELDS = get_schema().fields("list")
+
+_SCALARS = (str, int, float, bool)
+
+# "show more", "next page", "give me the rest", ...
+SHOW_MORE = re.compile(
+    r"^(?:please )?(?:(?:show|list|give|load|see)(?: me)? )?(?:some )?(?:more|next(?: page)?|the rest)"
+    r"(?: (?:results|items|of them|please))?$"
+)
+
+
+def recognised_filter(collection, recognised):
+    """List filter of `collection` from the gazetteer's `{collection: {field: [values]}}` for a message."""
+    query = {}
+    for field in LIST_FILTER_FIELDS.get(collection, ()):
+        values = (recognised or {}).get(collection, {}).get(field)
+        if values:
+            query[field] = values[0] if len(values) == 1 else {"$in": values}
+    return query
+
+
+def is_show_more(text):
+    return bool(SHOW_MORE.match(" ".join(re.findall(r"\w+", text.lower()))))
+
+
+def page_settings():
+    return {
+        "page_size": int(os.getenv("LIST_PAGE_SIZE", "20")),
+        "batch_size": int(os.getenv("LIST_BATCH_SIZE", "100")),
+    }
+
+
+class Page:
+    def __init__(self, collection, query, docs, shown, has_more):
+        self.collection = collection
+        self.query = query
+        self.docs = docs
+        self.shown = shown
+        self.has_more = has_more
+
+    @property
+    def start(self):
+        return self.shown - len(self.docs) + 1
+
+    def resume_token(self):
+        """Slot value that resumes after this page, or None on the last page."""
+        if not self.has_more or not self.docs:
+            return None
+        state = {"c": self.collection, "q": self.query, "a": self.docs[-1]["_id"], "n": self.shown}
+        return base64.urlsafe_b64encode(json_util.dumps(state).encode("utf-8")).decode("ascii")
+
+
+def _valid_query(collection, query):
+    """Whether `query` is a list filter of `collection`: list fields, plain values or `$in` lists."""
+    if not isinstance(query, dict):
+        return False
+    allowed = LIST_FILTER_FIELDS.get(collection, ())
+    for field, value in query.items():
+        if field not in allowed:
+            return False
+        if isinstance(value, dict):
+            values = value.get("$in")
+            if list(value) != ["$in"] or not isinstance(values, list) or not all(isinstance(v, _SCALARS) for v in values):
+                return False
+        elif not isinstance(value, _SCALARS):
+            return False
+    return True
+
+
+def decode_token(token):
+    """`(collection, query, after_id, shown)` from a resume token; None if it is unusable or was tampered with."""
+    try:
+        state = json_util.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        collection, query, after, shown = state["c"], state["q"], state["a"], int(state["n"])
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
+    if collection not in LIST_FILTER_FIELDS or not _valid_query(collection, query):
+        return None
+    if isinstance(after, (dict, list)) or shown < 0:
+        return None
+    return collection, query, after, shown
+
+
+async def fetch_page(db, collection, query, after=None, shown=0, page_size=20, batch_size=100):
+    """Read one page of `collection` matching `query`, after `_id` `after`."""
+    selector = query
+    if after is not None:
+        selector = {"$and": [query, {"_id": {"$gt": after}}]} if query else {"_id": {"$gt": after}}
+    cursor = db[collection].find(
+        selector,
+        {field: 1 for field in DISPLAY_FIELDS[collection]},
+        sort=[("_id", 1)],
+        limit=page_size + 1,
+        batch_size=min(batch_size, page_size + 1),
+    )
+    docs = []
+    async for doc in cursor:
+        if len(docs) == page_size:
+            return Page(collection, query, docs, shown + len(docs), True)
+        docs.append(doc)
+    return Page(collection, query, docs, shown + len(docs), False)
+
+
+async def resume_page(db, token, page_size=20, batch_size=100):
+    state = decode_token(token) if token else None
+    if state is None:
+        return None
+    collection, query, after, shown = state
+    return await fetch_page(db, collection, query, after, shown, page_size, batch_size)
@@ -0,0 +1,136 @@
+# Compact, token-budgeted document context for answer prompts.
+#
+# Documents are serialized as short `key: value` lines instead of their full
+# repr: internal and bulky fields are dropped, fields the question mentions
+# come first, the rest follow a per-collection priority, and serialization
+# stops at the token budget. Several documents can share one budget.
+
+import math
+import os
+import re
+import threading
+
+from actions.schema import get_schema
+
+# Never useful to the model, and often large.
+EXCLUDED_FIELDS = {
+    "_id", "__v", "createdAt", "updatedAt", "createdBy", "updatedBy", "isDeleted",
+    "layoutPlanImages", "images", "bankDetails", "realEstateLicenseDetails", "documents",
+}
+
+# Most useful first; unlisted fields come after these in document order.
+FIELD_PRIORITIES = {collection: get_schema()[collection].priority for collection in get_schema()}
+
+# Fields a document must keep to stay identifiable, even over budget.
+IDENTITY_FIELDS = get_schema().fields("display")
+
+MAX_VALUE_CHARS = 160
+MAX_LIST_ITEMS = 5
+
+
+def estimate_tokens(text):
+    """Rough token count for Llama-style tokenizers (about four characters per token)."""
+    return math.ceil(len(text) / 4) if text else 0
+
+
+def _format_value(value):
+    if isinstance(value, dict):
+        value = ", ".join(f"{k}={_format_value(v)}" for k, v in value.items() if k not in EXCLUDED_FIELDS)
+    elif isinstance(value, (list, tuple)):
+        shown = [_format_value(v) for v in value[:MAX_LIST_ITEMS]]
+        if len(value) > MAX_LIST_ITEMS:
+            shown.append(f"+{len(value) - MAX_LIST_ITEMS} more")
+        value = "; ".join(shown)
+    else:
+        value = str(value)
+    if len(value) > MAX_VALUE_CHARS:
+        value = value[:MAX_VALUE_CHARS - 3] + "..."
+    return value
+
+
+def _words(field):
+    return re.sub(r"(?<!^)(?=[A-Z])", " ", field).lower()
+
+
+def mentioned_fields(doc, question):
+    question = (question or "").lower()
+    return [f for f in doc if f.lower() in question or _words(f) in question]
+
+
+def field_order(collection, doc, question=""):
+    present = [f for f in doc if f not in EXCLUDED_FIELDS and doc[f] not in (None, "", [], {})]
+    ranked = []
+    for group in (IDENTITY_FIELDS.get(collection, []), mentioned_fields(doc, question),
+                  FIELD_PRIORITIES.get(collection, []), present):
+        for field in group:
+            if field in present and field not in ranked:
+                ranked.append(field)
+    return ranked
+
+
+def serialize_document(collection, doc, question="", budget_tokens=None):
+    lines = []
+    used = 0
+    identity = set(IDENTITY_FIELDS.get(collection, []))
+    for field in field_order(collection, doc, question):
+        line = f"{field}: {_format_value(doc[field])}"
+        cost = estimate_tokens(line) + 1
+        if budget_tokens is not None and used + cost > budget_tokens and field not in identity:
+            continue
+        lines.append(line)
+        used += cost
+    return "\n".join(lines)
+
+
+class ContextMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.context_tokens = 0
+        self.baseline_tokens = 0
+
+    def record(self, context_tokens, baseline_tokens):
+        with self._lock:
+            self.requests += 1
+            self.context_tokens += context_tokens
+            self.baseline_tokens += baseline_tokens
+
+    def snapshot(self):
+        with self._lock:
+            saved = self.baseline_tokens - self.context_tokens
+            return {
+                "requests": self.requests,
+                "tokens_saved": saved,
+                "avg_tokens_saved": saved / self.requests if self.requests else 0.0,
+            }
+
+
+context_metrics = ContextMetrics()
+
+
+def build_context(collection, docs, question="", budget_tokens=None):
+    """Serialize up to the token budget; returns `(context, tokens, tokens_saved)`.
+
+    `tokens_saved` compares against interpolating the raw documents.
+    """
+    if budget_tokens is None:
+        budget_tokens = int(os.getenv("PROMPT_CONTEXT_TOKENS", "400"))
+    docs = list(docs)
+    blocks = []
+    used = 0
+    for i, doc in enumerate(docs):
+        remaining = budget_tokens - used
+        if remaining <= 0:
+            break
+        # Split what is left evenly across the documents still to come.
+        share = remaining // (len(docs) - i)
+        text = serialize_document(collection, doc, question, share)
+        if len(docs) > 1:
+            text = f"[{i + 1}]\n{text}"
+        blocks.append(text)
+        used += estimate_tokens(text)
+    context = "\n".join(blocks)
+    tokens = estimate_tokens(context)
+    baseline = sum(estimate_tokens(str(doc)) for doc in docs)
+    context_metrics.record(tokens, baseline)
+    return context, tokens, baseline - tokens
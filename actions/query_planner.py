@@ -0,0 +1,227 @@
+# Turns extracted entities into server-side MongoDB filters.
+#
+# Instead of scanning every document in Python for a substring, the action
+# asks MongoDB for the matching document directly. Categorical and name
+# fields are compared with a case-insensitive collation so the supporting
+# indexes (created with the same collation) can serve them; budgets become
+# range filters; projections keep only the fields the answer prompt needs.
+#
+#     python -m actions.query_planner ensure   # create the supporting indexes
+#     python -m actions.query_planner verify   # report missing indexes
+
+import argparse
+import re
+
+from pymongo import ASCENDING, TEXT, IndexModel
+
+from actions.schema import get_schema
+
+# Case-insensitive, accent-sensitive comparisons. Queries and indexes must use
+# the same collation for the index to be eligible.
+CASE_INSENSITIVE = {"locale": "en", "strength": 2}
+
+# Entities that on their own say which collection the user is asking about.
+IDENTIFYING_ENTITIES = {
+    "property_name": "properties",
+    "propertyType": "properties",
+    "blockName": "properties",
+    "floorName": "properties",
+    "shopNo": "properties",
+    "project_name": "projects",
+    "broker_name": "brokers",
+    "company": "brokers",
+}
+COLLECTION_KEYWORDS = {"properties": "propert", "projects": "project", "brokers": "broker"}
+
+# Fields the answer prompt needs; everything else stays on the server.
+PROJECTIONS = get_schema().fields("answer")
+
+INDEXES = {
+    "properties": [
+        IndexModel([("blockName", ASCENDING), ("floorName", ASCENDING), ("shopNo", ASCENDING)],
+                   name="block_floor_shop", collation=CASE_INSENSITIVE),
+        IndexModel([("city", ASCENDING), ("propertyType", ASCENDING), ("minBudget", ASCENDING)],
+                   name="city_type_budget", collation=CASE_INSENSITIVE),
+        IndexModel([("propertyType", ASCENDING), ("minBudget", ASCENDING)],
+                   name="type_budget", collation=CASE_INSENSITIVE),
+    ],
+    "projects": [
+        IndexModel([("name", ASCENDING)], name="name", collation=CASE_INSENSITIVE),
+        IndexModel([("city", ASCENDING), ("projectStatus", ASCENDING)],
+                   name="city_status", collation=CASE_INSENSITIVE),
+        IndexModel([("name", TEXT), ("address", TEXT)], name="text_search"),
+    ],
+    "brokers": [
+        IndexModel([("name", ASCENDING)], name="name", collation=CASE_INSENSITIVE),
+        IndexModel([("city", ASCENDING), ("company", ASCENDING)],
+                   name="city_company", collation=CASE_INSENSITIVE),
+        IndexModel([("name", TEXT), ("company", TEXT), ("address", TEXT)], name="text_search"),
+    ],
+}
+
+# "BLOCK B Floor 4 Shop 179" -> blockName / floorName / shopNo
+_PROPERTY_PARTS = [
+    ("blockName", re.compile(r"\b(block\s+\w+)", re.I)),
+    ("floorName", re.compile(r"\b(floor\s+\w+)", re.I)),
+    ("shopNo", re.compile(r"\bshop\s*(?:no\.?\s*)?(\d+)", re.I)),
+]
+
+_AMOUNT = re.compile(r"(\d+(?:[.,]\d+)*)\s*(crore|cr|lakhs?|lacs?|l|million|mn|k|thousand)?\b", re.I)
+_MULTIPLIERS = {
+    "crore": 10 ** 7, "cr": 10 ** 7,
+    "lakh": 10 ** 5, "lakhs": 10 ** 5, "lac": 10 ** 5, "lacs": 10 ** 5, "l": 10 ** 5,
+    "million": 10 ** 6, "mn": 10 ** 6,
+    "k": 10 ** 3, "thousand": 10 ** 3,
+}
+
+
+def parse_amount(value):
+    """'1.2 crore' -> 12000000, '50 lakh' -> 5000000, '1500000' -> 1500000."""
+    if isinstance(value, (int, float)):
+        return value
+    match = _AMOUNT.search(str(value))
+    if not match:
+        return None
+    number = float(match.group(1).replace(",", ""))
+    unit = (match.group(2) or "").lower()
+    amount = number * _MULTIPLIERS.get(unit, 1)
+    return int(amount) if amount.is_integer() else amount
+
+
+def _coerce(collection, field, value):
+    if field in get_schema()[collection].numeric_entity_fields:
+        try:
+            return int(str(value).strip())
+        except ValueError:
+            return None
+    value = str(value).strip()
+    return value or None
+
+
+class QueryPlan:
+    def __init__(self, collection, filter, projection=None, collation=CASE_INSENSITIVE, limit=1):
+        self.collection = collection
+        self.filter = filter
+        self.projection = projection
+        self.collation = collation
+        self.limit = limit
+
+    def __repr__(self):
+        return f"QueryPlan({self.collection!r}, {self.filter!r}, limit={self.limit})"
+
+    def find_one(self, db):
+        return db[self.collection].find_one(self.filter, self.projection, collation=self.collation)
+
+    def find(self, db):
+        return db[self.collection].find(self.filter, self.projection, collation=self.collation, limit=self.limit)
+
+    async def afind_one(self, db):
+        return await db[self.collection].find_one(self.filter, self.projection, collation=self.collation)
+
+    async def afind(self, db):
+        cursor = db[self.collection].find(self.filter, self.projection, collation=self.collation, limit=self.limit)
+        return await cursor.to_list(None)
+
+
+def structured_filter(collection, entities):
+    """Equality and range conditions for the entities that map onto `collection` fields."""
+    mapping = get_schema()[collection].entity_fields
+    conditions = {}
+    for ent in entities or []:
+        name, value = ent.get("entity"), ent.get("value")
+        if value in (None, ""):
+            continue
+        if collection == "properties" and name == "property_name":
+            for field, pattern in _PROPERTY_PARTS:
+                match = pattern.search(str(value))
+                if match:
+                    conditions.setdefault(field, _coerce(collection, field, match.group(1)))
+            continue
+        if name in ("budget", "max_budget", "maxBudget") and collection in ("properties", "projects"):
+            amount = parse_amount(value)
+            if amount is not None:
+                # The listing's starting price must fit within the user's budget.
+                conditions["minBudget"] = {"$lte": amount}
+            continue
+        if name in ("min_budget", "minBudget") and collection in ("properties", "projects"):
+            amount = parse_amount(value)
+            if amount is not None:
+                conditions["maxBudget"] = {"$gte": amount}
+            continue
+        field = mapping.get(name)
+        if field:
+            coerced = _coerce(collection, field, value)
+            if coerced is not None:
+                conditions[field] = coerced
+    return conditions
+
+
+def target_collections(entities, message=""):
+    """Collections the entities (or, failing that, the message wording) point at, in lookup order."""
+    targets = []
+    for ent in entities or []:
+        collection = IDENTIFYING_ENTITIES.get(ent.get("entity"))
+        if collection and collection not in targets:
+            targets.append(collection)
+    if not targets:
+        message = (message or "").lower()
+        targets = [c for c, keyword in COLLECTION_KEYWORDS.items() if keyword in message]
+    return targets
+
+
+def plan_query(collection, entities, limit=1):
+    """A QueryPlan for `collection`, or None when the entities give no structured filter."""
+    conditions = structured_filter(collection, entities)
+    if not conditions:
+        return None
+    projection = {field: 1 for field in PROJECTIONS[collection]}
+    return QueryPlan(collection, conditions, projection, limit=limit)
+
+
+def ensure_indexes(db):
+    created = {}
+    for collection, indexes in INDEXES.items():
+        created[collection] = db[collection].create_indexes(indexes)
+    return created
+
+
+def missing_indexes(db):
+    missing = []
+    for collection, indexes in INDEXES.items():
+        existing = db[collection].index_information()
+        for index in indexes:
+            spec = index.document
+            found = existing.get(spec["name"])
+            if found is None:
+                missing.append((collection, spec["name"]))
+                continue
+            # Text indexes are stored under internal _fts keys; their name is enough.
+            if TEXT in spec["key"].values():
+                continue
+            same_keys = list(found["key"]) == list(spec["key"].items())
+            same_collation = found.get("collation", {}).get("strength") == spec.get("collation", {}).get("strength")
+            if not (same_keys and same_collation):
+                missing.append((collection, spec["name"]))
+    return missing
+
+
+def main():
+    from actions.mongo import get_db
+
+    parser = argparse.ArgumentParser(description="Manage the indexes behind the query planner.")
+    parser.add_argument("command", choices=["ensure", "verify"])
+    args = parser.parse_args()
+    db = get_db()
+    if args.command == "ensure":
+        for collection, names in ensure_indexes(db).items():
+            print(f"{collection}: {', '.join(names)}")
+    missing = missing_indexes(db)
+    for collection, name in missing:
+        print(f"missing index {collection}.{name}")
+    if not missing:
+        print("All planner indexes present.")
+    raise SystemExit(1 if missing else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# Cache of generated answers about a single document.
+#
+# Entries are keyed on the document id, a hash of the document's content and
+# the normalized question, so an edited document can never be answered from
+# an old entry. Near-duplicate phrasings of a question about the same
+# document also hit: the words that merely identify the document ("BLOCK B
+# Floor 4 Shop 179") are dropped and the rest is compared by cosine
+# similarity of local embeddings. Entries expire after a TTL, the cache is
+# bounded LRU, and catalog change notifications drop a document's entries as
+# soon as it changes.
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from actions.embeddings import DEFAULT_DIMENSIONS, embed
+from actions.prompt_context import EXCLUDED_FIELDS
+from custom_components.nlu_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Words that carry no meaning for which attribute is being asked about.
+STOPWORDS = {
+    "a", "about", "an", "are", "can", "do", "does", "for", "give", "i", "in", "is", "it", "its", "know",
+    "me", "of", "please", "s", "show", "tell", "that", "the", "this", "to", "want", "what", "whats",
+    "you",
+}
+
+_WORD = re.compile(r"\w+")
+
+
+def content_hash(doc):
+    body = {k: v for k, v in doc.items() if k not in EXCLUDED_FIELDS}
+    raw = json.dumps(body, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def question_focus(question, doc):
+    """The words of `question` that are neither stopwords nor part of the document's own values."""
+    identifying = set()
+    for value in doc.values():
+        if isinstance(value, (str, int, float)):
+            identifying.update(_WORD.findall(str(value).lower()))
+    words = _WORD.findall(normalize_text(question))
+    return " ".join(w for w in words if w not in STOPWORDS and w not in identifying)
+
+
+class _Entry:
+    __slots__ = ("expires_at", "vector", "answer")
+
+    def __init__(self, expires_at, vector, answer):
+        self.expires_at = expires_at
+        self.vector = vector
+        self.answer = answer
+
+
+class ResponseCache:
+    def __init__(self, max_entries=5000, ttl_seconds=3600.0, similarity=0.93, dimensions=DEFAULT_DIMENSIONS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # 0 turns similarity matching off; only identical questions hit.
+        self.similarity = similarity
+        self.dimensions = dimensions
+        self._entries = OrderedDict()
+        self._by_doc = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000")),
+            ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600")),
+            similarity=float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.93")),
+        )
+
+    def attach(self, catalog):
+        """Drop entries when the catalog reports a changed document."""
+        catalog.subscribe(self.invalidate)
+        return self
+
+    def _doc_key(self, collection, doc):
+        doc_id = doc.get("_id")
+        if doc_id is None:
+            return None
+        return (collection, str(doc_id), content_hash(doc))
+
+    def get(self, collection, doc, question):
+        """The cached answer for `question` about `doc`, or None."""
+        doc_key = self._doc_key(collection, doc)
+        if doc_key is None:
+            return None
+        focus = question_focus(question, doc)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(doc_key + (focus,))
+            if entry is not None and entry.expires_at >= now:
+                self._entries.move_to_end(doc_key + (focus,))
+                self.hits += 1
+                return entry.answer
+            if self.similarity > 0:
+                candidates = [
+                    key for key in self._by_doc.get(doc_key, ())
+                    if self._entries[key].expires_at >= now
+                ]
+                if candidates:
+                    vectors = np.stack([self._entries[key].vector for key in candidates])
+                    scores = vectors @ embed(focus, self.dimensions)
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.similarity:
+                        self._entries.move_to_end(candidates[best])
+                        self.similar_hits += 1
+                        return self._entries[candidates[best]].answer
+            self.misses += 1
+            return None
+
+    def set(self, collection, doc, question, answer):
+        doc_key = self._doc_key(collection, doc)
+        if doc_key is None or not answer:
+            return
+        focus = question_focus(question, doc)
+        key = doc_key + (focus,)
+        entry = _Entry(time.time() + self.ttl_seconds, embed(focus, self.dimensions), answer)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._by_doc.setdefault(doc_key, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._forget(next(iter(self._entries)))
+
+    def invalidate(self, collection, doc_id=None):
+        """Drop the entries of one document, or of the whole collection when `doc_id` is None."""
+        doc_id = None if doc_id is None else str(doc_id)
+        with self._lock:
+            stale = [
+                key for key in self._entries
+                if key[0] == collection and (doc_id is None or key[1] == doc_id)
+            ]
+            for key in stale:
+                self._forget(key)
+        if stale:
+            logger.debug("Dropped %d cached answers for %s %s", len(stale), collection, doc_id or "*")
+
+    def _forget(self, key):
+        del self._entries[key]
+        doc_key = key[:3]
+        keys = self._by_doc.get(doc_key)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_doc[doc_key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.similar_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.similar_hits) / lookups if lookups else 0.0,
+            }
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache(catalog=None):
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache.from_env()
+            if catalog is not None:
+                _response_cache.attach(catalog)
+        return _response_cache
@@ -0,0 +1,147 @@
+# One ranked retrieval stage across brokers, properties and projects.
+#
+# Candidates from every collection are scored by the same function, so a
+# weak property match can no longer win over an exact broker name just
+# because properties are looked at first. The score combines three signals,
+# all computed with NumPy over the whole candidate set at once:
+#
+# * cosine similarity of the hashing-vectorizer embeddings,
+# * trigram Dice overlap with the document's searchable text,
+# * name coverage: how much of the question's name-like wording (IDF
+#   weighted) a document's identifying fields (name, company, block/floor/
+#   shop) account for, read from fields tokenized once per catalog version.
+#
+# Collections are scanned in the order the question points at them, and the
+# scan stops early once a candidate scores above RETRIEVAL_EXIT_SCORE.
+
+import os
+import re
+import threading
+
+import numpy as np
+
+from actions.schema import get_schema
+from actions.vector_index import get_retriever
+
+# Fields that name a document.
+IDENTITY_FIELDS = get_schema().fields("key")
+
+WEIGHTS = np.array([0.35, 0.25, 0.4], dtype=np.float32)  # cosine, dice, name coverage
+
+_TOKEN = re.compile(r"\w+")
+_IGNORED = {"a", "an", "and", "by", "for", "in", "of", "on", "the", "to"}
+
+
+def tokenize(text):
+    return [t for t in _TOKEN.findall(str(text).lower()) if t not in _IGNORED]
+
+
+def combine_scores(cosine, dice, coverage):
+    """The shared ranking score for aligned float32 arrays of the three signals."""
+    return np.stack([cosine, dice, coverage], axis=1) @ WEIGHTS
+
+
+class NameIndex:
+    """Identifying tokens of every document, tokenized once, with postings as NumPy arrays."""
+
+    def __init__(self, docs, fields, max_doc_frequency=0.05):
+        self.ids = list(docs)
+        self.position = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        postings = {}
+        for i, doc in enumerate(docs.values()):
+            tokens = set()
+            for field in fields:
+                value = doc.get(field)
+                if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+                    tokens.update(tokenize(value))
+            for token in tokens:
+                postings.setdefault(token, []).append(i)
+        self.postings = {token: np.array(rows, dtype=np.int32) for token, rows in postings.items()}
+        self.idf = {token: float(np.log1p(len(self.ids) / len(rows))) for token, rows in self.postings.items()}
+        self.max_df = max(1, int(len(self.ids) * max_doc_frequency))
+
+    def candidates(self, tokens, limit):
+        """Ids of documents sharing a selective identifying token with the question."""
+        lists = [self.postings[t] for t in set(tokens) if t in self.postings and len(self.postings[t]) <= self.max_df]
+        if not lists:
+            return []
+        unique, shared = np.unique(np.concatenate(lists), return_counts=True)
+        top = unique[np.argsort(-shared, kind="stable")[:limit]]
+        return [self.ids[i] for i in top]
+
+    def coverage(self, tokens, ids):
+        """Share of the question's name-like tokens, weighted by IDF, that each document carries."""
+        rows = np.fromiter((self.position.get(doc_id, -1) for doc_id in ids), dtype=np.int32, count=len(ids))
+        matched = np.zeros(len(ids), dtype=np.float32)
+        total = 0.0
+        for token in set(tokens):
+            postings = self.postings.get(token)
+            if postings is None:
+                continue
+            weight = self.idf[token]
+            matched += weight * np.isin(rows, postings)
+            total += weight
+        return matched / total if total else matched
+
+
+_name_indexes = {}
+_name_indexes_lock = threading.Lock()
+
+
+def get_name_index(catalog, collection):
+    version = catalog.version(collection)
+    cached = _name_indexes.get(collection)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    with _name_indexes_lock:
+        cached = _name_indexes.get(collection)
+        if cached is None or cached[0] != version:
+            docs = get_retriever(catalog, collection).documents()
+            cached = (version, NameIndex(docs, IDENTITY_FIELDS[collection]))
+            _name_indexes[collection] = cached
+    return cached[1]
+
+
+def score_collection(catalog, collection, query, pool=20):
+    """`(ids, scores)` for the candidates of one collection."""
+    retriever = get_retriever(catalog, collection)
+    names = get_name_index(catalog, collection)
+    tokens = tokenize(query)
+    ids, cosine, dice = retriever.candidates(query, pool, extra_ids=names.candidates(tokens, pool))
+    return ids, combine_scores(cosine, dice, names.coverage(tokens, ids))
+
+
+def search_catalog(catalog, queries, k=5, min_score=0.0, exit_score=None, pool=20):
+    """Ranked `(score, collection, doc)` hits across collections.
+
+    `queries` maps each collection to the text to search it with, in scan
+    order. Scanning stops after a collection that produced a hit scoring at
+    least `exit_score`.
+    """
+    hits = []
+    for collection, query in queries.items():
+        if not query:
+            continue
+        ids, scores = score_collection(catalog, collection, query, pool)
+        if not ids:
+            continue
+        docs = get_retriever(catalog, collection).documents()
+        keep = np.nonzero(scores >= min_score)[0]
+        hits.extend((float(scores[i]), collection, docs[ids[i]]) for i in keep)
+        if exit_score is not None and len(keep) and float(scores[keep].max()) >= exit_score:
+            break
+    hits.sort(key=lambda hit: hit[0], reverse=True)
+    return hits[:k]
+
+
+def retrieve(catalog, collection, query, k=5, min_score=0.0):
+    """Top-k `(score, doc)` pairs from a single collection."""
+    return [(score, doc) for score, _, doc in search_catalog(catalog, {collection: query}, k, min_score)]
+
+
+def retrieval_settings():
+    return {
+        "k": int(os.getenv("RETRIEVAL_TOP_K", "5")),
+        "min_score": float(os.getenv("RETRIEVAL_MIN_SCORE", "0.2")),
+        "exit_score": float(os.getenv("RETRIEVAL_EXIT_SCORE", "0.65")),
+    }
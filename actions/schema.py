@@ -0,0 +1,398 @@
+# Schema registry: the one place that knows the catalog's fields.
+#
+# Every field list the actions use (what retrieval embeds, which fields name
+# a document, what the answer prompt gets and in which order, what list
+# questions and LLM-written filters may filter on, what analytics may
+# aggregate, what the gazetteer recognises) is a flag on a field here. The
+# registry is compiled once per process:
+#
+# * declared fields and flags (FIELDS below, in prompt priority order),
+# * entity aliases, extended with the entities and slots of domain.yml that
+#   share a field's name,
+# * how answers label a field and which phrases ask for it (WORDING), which
+#   analytics and attribute answers both match questions against,
+# * optionally, statistics from a $sample of each collection: the stored
+#   types, presence, distinct values and which indexes cover a field.
+#
+# Consumers read precomputed tuples and dicts (`fields("search")`,
+# `schema["brokers"].filter_types`), so no request re-derives field
+# metadata. When sampling shows a filterable field consistently stored as
+# text where a number was declared (or the reverse), filters are validated
+# against the stored type so they can match.
+#
+#     python -m actions.schema            # registry with sampled statistics, as JSON
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import re
+import threading
+from collections import Counter
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+# Flags:
+#   search   text embedded and trigram-indexed for retrieval
+#   key      identifying tokens for name matching
+#   display  names the document in lists and keeps it identifiable in prompts
+#   answer   projected for answers; declaration order is prompt priority
+#   filter   may appear in filters (LLM-written or structured)
+#   list     filters "list ..." questions
+#   metric   may be aggregated (count/avg/min/max/sum)
+#   gazetteer  values recognised in messages
+#   attribute  asked for on its own; answered from a response template
+#
+# collection -> [(field, type, flags, entity aliases)]
+FIELDS = {
+    "properties": [
+        ("name", str, "search key display answer filter gazetteer", ()),
+        ("propertyType", str, "search display answer filter gazetteer", ("propertyType", "property_type")),
+        ("blockName", str, "search key display answer filter gazetteer", ("blockName", "block_name")),
+        ("floorName", str, "search key display answer filter", ("floorName", "floor_name")),
+        ("shopNo", int, "search key display answer filter", ("shopNo", "shop_no")),
+        ("series", str, "search answer filter", ()),
+        ("city", str, "search answer filter list gazetteer attribute", ("city",)),
+        ("minBudget", float, "answer filter metric attribute", ()),
+        ("maxBudget", float, "answer filter metric attribute", ()),
+        ("facing", str, "search answer filter attribute", ("facing",)),
+        ("furnishedStatus", str, "search answer filter attribute", ("furnishedStatus",)),
+        ("carpetArea", float, "answer filter metric attribute", ()),
+        ("carpetAreaType", str, "answer", ()),
+        ("builtUpArea", float, "answer filter metric attribute", ()),
+        ("builtUpAreaType", str, "answer", ()),
+        ("superBuiltUpArea", float, "answer metric attribute", ()),
+        ("superBuiltUpAreaType", str, "answer", ()),
+        ("noOfBedRooms", int, "answer filter metric attribute", ()),
+        ("noOfBathRooms", int, "answer filter metric attribute", ()),
+        ("noOfBalconies", int, "answer filter metric attribute", ()),
+        ("noOfKitchens", int, "answer metric", ()),
+        ("noOfDrawingRooms", int, "answer metric", ()),
+        ("noOfParkingLots", int, "answer filter metric attribute", ()),
+        ("vastuCompliant", bool, "answer attribute", ()),
+        ("category", str, "search answer filter list gazetteer", ()),
+        ("projectStatus", str, "search answer filter list gazetteer attribute", ()),
+        ("address", str, "search", ()),
+    ],
+    "projects": [
+        ("name", str, "search key display answer filter gazetteer", ("project_name",)),
+        ("category", str, "search answer filter list gazetteer", ("category",)),
+        ("projectStatus", str, "search answer filter list gazetteer attribute", ("projectStatus",)),
+        ("city", str, "search answer filter list gazetteer attribute", ("city",)),
+        ("address", str, "search answer attribute", ()),
+        ("minBudget", float, "answer filter metric attribute", ()),
+        ("maxBudget", float, "answer filter metric attribute", ()),
+        ("projectType", str, "search answer filter", ()),
+        ("projectUnitSubType", str, "search answer", ()),
+        ("startDate", datetime.datetime, "answer attribute", ()),
+        ("completionDate", datetime.datetime, "answer attribute", ()),
+        ("reraRegistrationNumber", str, "search key answer filter attribute", ()),
+        ("projectRegistrationNumber", str, "answer attribute", ()),
+        ("phone", str, "answer attribute", ()),
+        ("email", str, "answer attribute", ()),
+        ("zipCode", str, "answer attribute", ()),
+    ],
+    "brokers": [
+        ("name", str, "search key display answer filter gazetteer", ("broker_name",)),
+        ("company", str, "search key display answer filter list gazetteer attribute", ("company",)),
+        ("city", str, "search answer filter list gazetteer attribute", ("city",)),
+        ("state", str, "search answer filter", ()),
+        ("phone", str, "answer filter attribute", ()),
+        ("address", str, "search answer attribute", ()),
+        ("commissionPercent", float, "answer filter metric attribute", ()),
+        ("yearStartedInRealEstate", int, "answer filter metric attribute", ()),
+        ("status", str, "answer filter", ()),
+        ("zipCode", str, "answer attribute", ()),
+    ],
+}
+
+# How answers name a field and questions ask for it, besides the field's own
+# words ("carpet area" for carpetArea): field -> (label, unit, phrases).
+# Metric phrases name what analytics aggregates; attribute phrases what an
+# attribute answer reads. The unit is appended to numbers; areas take theirs
+# from the document's `<field>Type` ("sqft").
+WORDING = {
+    "phone": ("phone number", None, ("phone", "phone number", "contact number", "mobile", "mobile number")),
+    "email": ("email address", None, ("email", "email address", "mail id", "email id")),
+    "address": ("address", None, ("address", "located", "location")),
+    "zipCode": ("pin code", None, ("zip", "zip code", "zipcode", "pin code", "pincode")),
+    "city": ("city", None, ("city", "which city")),
+    "company": ("company", None, ("company", "agency", "firm")),
+    "commissionPercent": ("commission", "%", ("commission", "commission percent", "commission rate")),
+    "yearStartedInRealEstate": ("year started in real estate", None, (
+        "year started", "start year", "started in real estate", "since when",
+    )),
+    "reraRegistrationNumber": ("RERA registration number", None, (
+        "rera", "rera number", "rera no", "rera id", "rera registration", "rera registration number",
+    )),
+    "projectRegistrationNumber": ("project registration number", None, (
+        "registration number", "project registration number", "registration no",
+    )),
+    "startDate": ("start date", None, ("start date", "launch date", "started on")),
+    "completionDate": ("completion date", None, ("completion date", "possession date", "possession", "completion")),
+    "projectStatus": ("status", None, ("status", "project status", "construction status")),
+    "facing": ("facing", None, ("facing", "direction", "which side")),
+    "furnishedStatus": ("furnishing", None, ("furnished", "furnishing", "furnished status", "furnishing status")),
+    "vastuCompliant": ("Vastu compliance", None, ("vastu", "vastu compliant", "vaastu")),
+    "minBudget": ("minimum budget", None, (
+        "min budget", "minimum budget", "starting price", "minimum price", "price", "budget", "cost",
+    )),
+    "maxBudget": ("maximum budget", None, ("max budget", "maximum budget", "maximum price")),
+    "carpetArea": ("carpet area", None, ("carpet area", "carpet")),
+    "builtUpArea": ("built-up area", None, ("built up area", "builtup area", "built up")),
+    "superBuiltUpArea": ("super built-up area", None, ("super built up area", "super built up", "super area")),
+    "noOfBedRooms": ("number of bedrooms", None, ("bedrooms", "bedroom", "bhk")),
+    "noOfBathRooms": ("number of bathrooms", None, ("bathrooms", "bathroom")),
+    "noOfBalconies": ("number of balconies", None, ("balconies", "balcony")),
+    "noOfKitchens": ("number of kitchens", None, ("kitchens", "kitchen")),
+    "noOfDrawingRooms": ("number of drawing rooms", None, ("drawing rooms", "drawing room")),
+    "noOfParkingLots": ("number of parking lots", None, ("parking", "parking lots", "parking spaces")),
+}
+
+_TYPE_NAMES = {str: "string", int: "int", float: "double", bool: "bool", datetime.datetime: "date"}
+_SCALARS = {"string": str, "int": int, "double": float, "bool": bool, "date": datetime.datetime}
+# Share of sampled values that must agree before the stored type overrides the declared one.
+_TYPE_AGREEMENT = 0.95
+
+
+def _camel_words(name):
+    return re.sub(r"(?<!^)(?=[A-Z])", " ", name).lower()
+
+
+def _type_name(value):
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "double"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, datetime.datetime):
+        return "date"
+    if isinstance(value, list):
+        return "array"
+    if isinstance(value, dict):
+        return "object"
+    return type(value).__name__
+
+
+class Field:
+    __slots__ = (
+        "name", "type", "flags", "entities", "label", "unit", "phrases", "stored_type", "presence", "distinct", "index",
+    )
+
+    def __init__(self, name, type, flags, entities=()):
+        self.name = name
+        self.type = type
+        self.flags = frozenset(flags.split())
+        self.entities = tuple(entities)
+        label, self.unit, phrases = WORDING.get(name, (_camel_words(name), None, ()))
+        self.label = label
+        # The field name and its words, then WORDING's phrases.
+        self.phrases = tuple(dict.fromkeys((name.lower(), _camel_words(name)) + phrases))
+        self.stored_type = None  # dominant type in the sample
+        self.presence = None     # share of sampled documents that have the field
+        self.distinct = None     # distinct values in the sample
+        self.index = None        # "leading", "compound" or "text" when an index covers the field
+
+    @property
+    def filter_type(self):
+        """The type filter values are validated and coerced to."""
+        stored = _SCALARS.get(self.stored_type)
+        # MongoDB compares ints and doubles with each other; only text vs number matters.
+        if stored in (str, int, float) and self.type in (str, int, float) and (stored is str) != (self.type is str):
+            return stored
+        return self.type
+
+    def describe(self):
+        return {
+            "type": _TYPE_NAMES.get(self.type, self.type.__name__),
+            "flags": sorted(self.flags),
+            "entities": list(self.entities),
+            "label": self.label,
+            "unit": self.unit,
+            "phrases": list(self.phrases),
+            "stored_type": self.stored_type,
+            "presence": self.presence,
+            "distinct": self.distinct,
+            "index": self.index,
+        }
+
+
+class CollectionSchema:
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = {field.name: field for field in fields}
+        self._compile()
+
+    def _compile(self):
+        flags = {flag for field in self.fields.values() for flag in field.flags}
+        self._flagged = {flag: tuple(f.name for f in self.fields.values() if flag in f.flags) for flag in flags}
+        self.priority = tuple(self.fields)
+        self.filter_types = {f.name: f.filter_type for f in self.fields.values() if "filter" in f.flags}
+        self.entity_fields = {alias: f.name for f in self.fields.values() for alias in f.entities}
+        self.numeric_entity_fields = frozenset(
+            f.name for f in self.fields.values() if f.entities and self.filter_types.get(f.name) in (int, float)
+        )
+        # phrase -> field, for the fields questions may name
+        self.metric_phrases = self._phrases("metric")
+        self.attribute_phrases = self._phrases("attribute")
+
+    def _phrases(self, flag):
+        phrases = {}
+        for name in self.with_flag(flag):
+            for phrase in self.fields[name].phrases:
+                phrases.setdefault(phrase, name)
+        return phrases
+
+    def __getitem__(self, field):
+        return self.fields[field]
+
+    def __contains__(self, field):
+        return field in self.fields
+
+    def with_flag(self, flag):
+        return self._flagged.get(flag, ())
+
+    def signature(self, flag="filter"):
+        """`brokers(name, company, ...)`, for prompts that ask the LLM to write queries."""
+        return f"{self.name}({', '.join(self.with_flag(flag))})"
+
+    def observe(self, docs, index_information):
+        """Record types, presence and distinct counts from sampled docs, and index coverage."""
+        docs = list(docs)
+        coverage = {}
+        for spec in index_information.values():
+            keys = [key for key, _ in spec.get("key", [])]
+            for position, key in enumerate(keys):
+                if key == "_fts":
+                    continue
+                kind = "leading" if position == 0 else "compound"
+                if coverage.get(key) != "leading":
+                    coverage[key] = kind
+            for key in spec.get("weights", {}):
+                coverage.setdefault(key, "text")
+        for field in self.fields.values():
+            values = [doc[field.name] for doc in docs if doc.get(field.name) is not None]
+            types = Counter(_type_name(v) for v in values)
+            if types:
+                name, count = types.most_common(1)[0]
+                field.stored_type = name if count / len(values) >= _TYPE_AGREEMENT else "mixed"
+            field.presence = round(len(values) / len(docs), 3) if docs else None
+            field.distinct = len({json.dumps(v, sort_keys=True, default=str) for v in values}) if values else 0
+            field.index = coverage.get(field.name)
+        self._compile()
+
+    def describe(self):
+        return {name: field.describe() for name, field in self.fields.items()}
+
+
+def _domain_entities(domain_path):
+    try:
+        with open(domain_path, encoding="utf-8") as f:
+            domain = yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError) as e:
+        logger.warning("Could not read %s: %s", domain_path, e)
+        return set()
+    entities = {e if isinstance(e, str) else next(iter(e)) for e in domain.get("entities", [])}
+    for slot in (domain.get("slots") or {}).values():
+        for mapping in slot.get("mappings", []):
+            if mapping.get("type") == "from_entity" and mapping.get("entity"):
+                entities.add(mapping["entity"])
+    return entities
+
+
+class SchemaRegistry:
+    def __init__(self, declared=FIELDS, domain_path="domain.yml"):
+        self.domain_entities = _domain_entities(domain_path) if domain_path else set()
+        self.collections = {}
+        mapped = set()
+        for collection, specs in declared.items():
+            fields = []
+            for name, type_, flags, aliases in specs:
+                aliases = list(aliases)
+                # A domain entity named like a field maps onto it.
+                if name in self.domain_entities and name not in aliases:
+                    aliases.append(name)
+                mapped.update(aliases)
+                fields.append(Field(name, type_, flags, aliases))
+            self.collections[collection] = CollectionSchema(collection, fields)
+        self.unmapped_entities = sorted(self.domain_entities - mapped)
+        self.sampled = False
+        self._fields = {}
+
+    def __getitem__(self, collection):
+        return self.collections[collection]
+
+    def __iter__(self):
+        return iter(self.collections)
+
+    def fields(self, flag):
+        """`{collection: (field, ...)}` of the fields carrying `flag`."""
+        cached = self._fields.get(flag)
+        if cached is None:
+            cached = self._fields[flag] = {c: schema.with_flag(flag) for c, schema in self.collections.items()}
+        return cached
+
+    def observe(self, db, sample_size=500):
+        """Fill in stored types, cardinality and index coverage from a $sample of each collection."""
+        for collection, schema in self.collections.items():
+            docs = db[collection].aggregate([{"$sample": {"size": sample_size}}])
+            schema.observe(docs, db[collection].index_information())
+        self.sampled = True
+        self._fields.clear()
+        return self
+
+    def describe(self):
+        return {
+            "sampled": self.sampled,
+            "domain_entities": sorted(self.domain_entities),
+            "unmapped_entities": self.unmapped_entities,
+            "collections": {c: schema.describe() for c, schema in self.collections.items()},
+        }
+
+
+_schema = None
+_schema_lock = threading.Lock()
+
+
+def get_schema():
+    """The process-wide registry (declared fields plus domain.yml, from SCHEMA_DOMAIN_PATH)."""
+    global _schema
+    if _schema is None:
+        with _schema_lock:
+            if _schema is None:
+                _schema = SchemaRegistry(domain_path=os.getenv("SCHEMA_DOMAIN_PATH", "domain.yml"))
+    return _schema
+
+
+def observe_catalog(db=None, sample_size=None):
+    """Sample the collections into the registry once; failures leave the declared schema in place."""
+    from pymongo.errors import PyMongoError
+
+    from actions.mongo import get_db
+
+    schema = get_schema()
+    if schema.sampled:
+        return schema
+    try:
+        schema.observe(db if db is not None else get_db(), sample_size or int(os.getenv("SCHEMA_SAMPLE_SIZE", "500")))
+    except PyMongoError as e:
+        logger.warning("Schema sampling failed, using declared types: %s", e)
+    return schema
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the schema registry.")
+    parser.add_argument("--sample", type=int, default=500, help="Documents sampled per collection (0 skips sampling).")
+    args = parser.parse_args()
+    schema = observe_catalog(sample_size=args.sample) if args.sample else get_schema()
+    print(json.dumps(schema.describe(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
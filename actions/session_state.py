@@ -0,0 +1,164 @@
+# Per-conversation state kept by the action server between turns.
+#
+# After a turn resolves a document, the action records which one (and the
+# ranked retrieval hits) under the conversation's sender_id. A follow-up such
+# as "what about its budget?" is then answered from that document without
+# running the fetch and match stages again.
+#
+# Sessions live in a bounded in-process LRU and expire after a TTL of
+# inactivity. Writes are write-behind: `set` only updates memory and marks
+# the session dirty, and a background thread persists dirty sessions to a
+# SQLite file in one transaction every SESSION_STATE_FLUSH_SECONDS, so a
+# restarted action server picks conversations up where they were.
+#
+# Settings: SESSION_STATE_PATH (.rasa/cache/session_state.db, empty for
+# memory only), SESSION_STATE_MAX_SESSIONS (10000), SESSION_STATE_TTL_SECONDS
+# (1800), SESSION_STATE_FLUSH_SECONDS (1.0).
+
+import atexit
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATE_PATH = os.path.join(".rasa", "cache", "session_state.db")
+
+# "what about its budget?", "is it furnished?", "their phone number"
+_REFERENCE = re.compile(r"\b(?:it|its|it's|this one|that one|the same|they|them|their|his|her)\b", re.I)
+
+
+def is_follow_up(text):
+    """Whether the message refers back to something instead of naming it."""
+    return bool(_REFERENCE.search(text))
+
+
+class SessionStore:
+    def __init__(self, path=DEFAULT_STATE_PATH, max_sessions=10000, ttl_seconds=1800.0, flush_seconds=1.0):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.flush_seconds = flush_seconds
+        self._sessions = OrderedDict()  # sender_id -> (expires_at, state)
+        self._pending = {}  # written since the last flush
+        self._lock = threading.Lock()
+        self._conn = None
+        self._stop = threading.Event()
+        self._thread = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_state ("
+                " sender_id TEXT PRIMARY KEY, state TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_session_state_expires_at ON session_state (expires_at)")
+            self._thread = threading.Thread(target=self._run, name="session-state-writer", daemon=True)
+            self._thread.start()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            path=os.getenv("SESSION_STATE_PATH", DEFAULT_STATE_PATH),
+            max_sessions=int(os.getenv("SESSION_STATE_MAX_SESSIONS", "10000")),
+            ttl_seconds=float(os.getenv("SESSION_STATE_TTL_SECONDS", "1800")),
+            flush_seconds=float(os.getenv("SESSION_STATE_FLUSH_SECONDS", "1.0")),
+        )
+
+    def get(self, sender_id):
+        """The conversation's state, or None when it has none or it expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(sender_id)
+            if entry is not None:
+                expires_at, state = entry
+                if expires_at >= now:
+                    self._sessions.move_to_end(sender_id)
+                    return state
+                del self._sessions[sender_id]
+                return None
+            if self._conn is None:
+                return None
+            row = self._conn.execute(
+                "SELECT state, expires_at FROM session_state WHERE sender_id = ?", (sender_id,)
+            ).fetchone()
+            if row is None or row[1] < now:
+                return None
+            state = json.loads(row[0])
+            self._remember(sender_id, row[1], state)
+            return state
+
+    def set(self, sender_id, state):
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._remember(sender_id, expires_at, state)
+            if self._conn is not None:
+                self._pending[sender_id] = (expires_at, state)
+
+    def clear(self, sender_id):
+        with self._lock:
+            self._sessions.pop(sender_id, None)
+            self._pending.pop(sender_id, None)
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM session_state WHERE sender_id = ?", (sender_id,))
+
+    def _remember(self, sender_id, expires_at, state):
+        self._sessions[sender_id] = (expires_at, state)
+        self._sessions.move_to_end(sender_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def flush(self):
+        """Write dirty sessions and drop expired rows, in one transaction."""
+        if self._conn is None:
+            return
+        with self._lock:
+            rows = [(sender_id, json.dumps(state), expires_at) for sender_id, (expires_at, state) in self._pending.items()]
+            self._pending.clear()
+            if not rows:
+                return
+            try:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO session_state (sender_id, state, expires_at) VALUES (?, ?, ?)", rows
+                )
+                self._conn.execute("DELETE FROM session_state WHERE expires_at < ?", (time.time(),))
+                self._conn.execute("COMMIT")
+            except sqlite3.Error as e:
+                self._conn.execute("ROLLBACK")
+                logger.warning("Could not persist %d sessions: %s", len(rows), e)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_seconds):
+            self.flush()
+
+    def close(self):
+        self._stop.set()
+        if self._conn is not None:
+            self.flush()
+            with self._lock:
+                self._conn.close()
+                self._conn = None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SessionStore.from_env()
+                atexit.register(_store.close)
+    return _store
@@ -0,0 +1,120 @@
+# Streams generated answers to channels that can show partial text.
+#
+# A Rasa SDK action can only return its messages once `run` finishes, so
+# partial text is pushed out of band while the completion is generated: each
+# delta is POSTed to STREAM_PUSH_URL in the same shape the `callback` channel
+# uses (`recipient_id`, `text`) plus `metadata.partial`. When the answer is
+# complete, the full text is uttered as usual, tagged with the same
+# `stream_id`, so a streaming client replaces its partial bubble and every
+# other client simply sees one message. Conversations on channels outside
+# STREAM_CHANNELS, or with no push URL configured, get the single message
+# only.
+
+import logging
+import os
+import time
+import uuid
+
+import aiohttp
+
+from actions.llm_client import get_llm_client
+from actions.tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+def streaming_config():
+    return {
+        "push_url": os.getenv("STREAM_PUSH_URL"),
+        "channels": {c.strip() for c in os.getenv("STREAM_CHANNELS", "callback,socketio").split(",") if c.strip()},
+        "flush_chars": int(os.getenv("STREAM_FLUSH_CHARS", "24")),
+        "flush_seconds": float(os.getenv("STREAM_FLUSH_SECONDS", "0.25")),
+    }
+
+
+class ChannelPusher:
+    """Sends partial messages to the streaming gateway over a keep-alive session."""
+
+    def __init__(self, url, timeout=2.0):
+        self.url = url
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session = None
+
+    async def push(self, recipient_id, text, metadata):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+        payload = {"recipient_id": recipient_id, "text": text, "metadata": metadata}
+        async with self._session.post(self.url, json=payload) as response:
+            response.raise_for_status()
+
+
+_pushers = {}
+
+
+def _get_pusher(url):
+    pusher = _pushers.get(url)
+    if pusher is None:
+        pusher = _pushers[url] = ChannelPusher(url)
+    return pusher
+
+
+def can_stream(tracker, config=None):
+    config = config or streaming_config()
+    return bool(config["push_url"]) and tracker.get_latest_input_channel() in config["channels"]
+
+
+async def stream_answer(dispatcher, tracker, prompt, api_key, max_tokens=100, temperature=0.7, top_p=0.7):
+    """Generate an answer for `prompt`, streaming it when the channel allows.
+
+    The complete answer is always uttered through `dispatcher` at the end and
+    also returned.
+    """
+    config = streaming_config()
+    streaming = can_stream(tracker, config)
+    with span("generation", streamed=streaming, prompt_chars=len(prompt)) as stage:
+        text = await _generate(dispatcher, tracker, prompt, api_key, config, streaming, max_tokens, temperature, top_p)
+        stage.set(answer_chars=len(text))
+    return text
+
+
+async def _generate(dispatcher, tracker, prompt, api_key, config, streaming, max_tokens, temperature, top_p):
+    client = get_llm_client(api_key)
+    if not streaming:
+        text = await client.acomplete(prompt, max_tokens=max_tokens, temperature=temperature, top_p=top_p)
+        dispatcher.utter_message(text=text)
+        return text
+
+    pusher = _get_pusher(config["push_url"])
+    stream_id = uuid.uuid4().hex
+    parts = []
+    pending = ""
+    seq = 0
+    pushing = True
+    last_flush = time.monotonic()
+
+    async def flush(text):
+        nonlocal seq, pushing
+        try:
+            await pusher.push(tracker.sender_id, text, {"stream_id": stream_id, "partial": True, "seq": seq})
+            seq += 1
+        except (aiohttp.ClientError, OSError) as e:
+            # The final message still carries the whole answer.
+            logger.warning("Stopped streaming %s: %s", stream_id, e)
+            pushing = False
+
+    async for delta in client.astream(prompt, max_tokens=max_tokens, temperature=temperature, top_p=top_p):
+        parts.append(delta)
+        if not pushing:
+            continue
+        pending += delta
+        due = time.monotonic() - last_flush >= config["flush_seconds"]
+        if len(pending) >= config["flush_chars"] or (due and pending.strip()):
+            await flush(pending)
+            pending = ""
+            last_flush = time.monotonic()
+    if pushing and pending:
+        await flush(pending)
+
+    text = "".join(parts).strip()
+    dispatcher.utter_message(text=text, stream_id=stream_id, streamed=seq > 0)
+    return text
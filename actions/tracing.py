@@ -0,0 +1,292 @@
+# Structured logging and per-stage tracing for the action server and NLU.
+#
+# Log records go through a QueueHandler, so the request path only enqueues
+# them; a QueueListener thread does the actual (blocking) writes. DEBUG
+# records are sampled per trace: either every debug line of a request is
+# kept or none is, so sampled requests can still be read end to end.
+#
+# `span(name, **attributes)` times one stage of a request (NLU LLM call,
+# Mongo fetch, fuzzy match, prompt build, generation). Spans nest through
+# contextvars, so they follow awaits and `asyncio.to_thread`. Finished spans
+# of sampled traces are queued and exported in batches by a background
+# thread as OTLP/JSON: one `{"resourceSpans": ...}` object per line to
+# TRACE_EXPORT_FILE, and/or POSTed to an OTLP/HTTP collector at
+# TRACE_EXPORT_URL (e.g. http://localhost:4318/v1/traces).
+#
+# Settings: LOG_LEVEL (INFO), LOG_FORMAT (text|json), LOG_DEBUG_SAMPLE_RATE
+# (0.1), TRACE_SAMPLE_RATE (1.0), TRACE_EXPORT_FILE, TRACE_EXPORT_URL,
+# TRACE_SERVICE_NAME (homelead-assistant).
+
+import atexit
+import contextlib
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "sampled", "attributes", "start_ns", "end_ns", "error")
+
+    def __init__(self, name, trace_id, parent_id, sampled, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes = dict(attributes)
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    @property
+    def duration_ms(self):
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_attribute(k, v) for k, v in self.attributes.items() if v is not None],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class SpanExporter:
+    """Batches finished spans off the request path; drops them when the queue is full."""
+
+    def __init__(self, path=None, url=None, service_name="homelead-assistant", batch_size=256,
+                 flush_seconds=2.0, max_queue=10000):
+        self.path = path
+        self.url = url
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_seconds
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                self._write(batch)
+                return
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= self.batch_size or (batch and time.monotonic() >= deadline):
+                self._write(batch)
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_seconds
+
+    def _payload(self, spans):
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_attribute("service.name", self.service_name)]},
+                "scopeSpans": [{"scope": {"name": "homelead.tracing"}, "spans": [s.to_otlp() for s in spans]}],
+            }]
+        }
+
+    def _write(self, spans):
+        if not spans:
+            return
+        body = json.dumps(self._payload(spans), separators=(",", ":"))
+        if self.path:
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(body + "\n")
+            except OSError as e:
+                logger.warning("Could not write spans to %s: %s", self.path, e)
+        if self.url:
+            request = urllib.request.Request(
+                self.url, data=body.encode("utf-8"), headers={"Content-Type": "application/json"}, method="POST"
+            )
+            try:
+                urllib.request.urlopen(request, timeout=5).close()
+            except OSError as e:
+                logger.warning("Could not send spans to %s: %s", self.url, e)
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join(timeout=5)
+
+
+_STOP = object()
+
+
+class Tracer:
+    def __init__(self, sample_rate=1.0, exporter=None):
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        parent = _current_span.get()
+        if parent is None:
+            trace_id = f"{random.getrandbits(128):032x}"
+            sampled = self.exporter is not None and random.random() < self.sample_rate
+        else:
+            trace_id, sampled = parent.trace_id, parent.sampled
+        span = Span(name, trace_id, parent.span_id if parent else None, sampled, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            logger.debug("span %s %.1f ms", name, span.duration_ms)
+            _current_span.reset(token)
+            if span.sampled:
+                self.exporter.export(span)
+
+
+class DebugSampler(logging.Filter):
+    """Keeps every record at INFO and above, and DEBUG records for a sample of traces."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        span = _current_span.get()
+        if span is None:
+            return random.random() < self.rate
+        # One decision per trace, derived from the trace id.
+        return int(span.trace_id[:8], 16) / 0xFFFFFFFF < self.rate
+
+
+class TraceContextFilter(logging.Filter):
+    def filter(self, record):
+        span = _current_span.get()
+        record.trace_id = span.trace_id if span else ""
+        record.span_id = span.span_id if span else ""
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "trace_id", ""):
+            entry["trace_id"] = record.trace_id
+            entry["span_id"] = record.span_id
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+_tracer = Tracer(sample_rate=0.0)
+_listener = None
+_configure_lock = threading.Lock()
+
+
+def configure(loggers=("actions", "custom_components", "action_llama_query")):
+    """Install the queue-backed handlers and the span exporter once per process."""
+    global _tracer, _listener
+    with _configure_lock:
+        if _listener is not None:
+            return _tracer
+        level = getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO)
+        target = logging.StreamHandler()
+        if os.getenv("LOG_FORMAT", "text") == "json":
+            target.setFormatter(JSONFormatter())
+        else:
+            target.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(trace_id)s] %(message)s"))
+        log_queue = queue.Queue(-1)
+        handler = logging.handlers.QueueHandler(log_queue)
+        handler.addFilter(TraceContextFilter())
+        handler.addFilter(DebugSampler(float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1"))))
+        for name in loggers:
+            named = logging.getLogger(name)
+            named.setLevel(level)
+            named.addHandler(handler)
+            named.propagate = False
+        _listener = logging.handlers.QueueListener(log_queue, target, respect_handler_level=True)
+        _listener.start()
+
+        path, url = os.getenv("TRACE_EXPORT_FILE"), os.getenv("TRACE_EXPORT_URL")
+        exporter = None
+        if path or url:
+            exporter = SpanExporter(path, url, os.getenv("TRACE_SERVICE_NAME", "homelead-assistant"))
+        _tracer = Tracer(float(os.getenv("TRACE_SAMPLE_RATE", "1.0")), exporter)
+        return _tracer
+
+
+def set_exporter(exporter, sample_rate=1.0):
+    """Send spans to `exporter` (anything with `export(span)`), e.g. an in-memory collector."""
+    global _tracer
+    _tracer = Tracer(sample_rate, exporter)
+    return _tracer
+
+
+def span(name, **attributes):
+    """Context manager timing one stage of the current request."""
+    return _tracer.span(name, **attributes)
+
+
+def current_span():
+    return _current_span.get()
+
+
+@atexit.register
+def shutdown():
+    global _listener
+    if _tracer.exporter is not None:
+        _tracer.exporter.close()
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
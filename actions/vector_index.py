@@ -0,0 +1,314 @@
+# Local vector index over the catalog for document retrieval.
+#
+# Every document's searchable fields are embedded with the hashing vectorizer
+# from actions.embeddings and stored in a NumPy memory-mapped matrix under
+# .rasa/cache/vectors, one file per collection, so a restart reuses the
+# stored vectors and only re-embeds documents whose text changed. Catalog
+# change notifications upsert or delete single rows in place.
+#
+# Retrieval is hybrid: the best vector matches (exact inner product over the
+# matrix, done blockwise) and the best lexical matches from the trigram index
+# are merged into one candidate set with both scores; actions.retrieval ranks
+# them. At catalog sizes a flat scan is a few milliseconds, so no approximate
+# structure is kept.
+#
+#     python -m actions.vector_index build   # embed every collection and flush
+
+import argparse
+import atexit
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+from actions.embeddings import embed
+from actions.fuzzy_index import document_blob, get_fuzzy_index
+from actions.schema import get_schema
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_DIR = os.path.join(".rasa", "cache", "vectors")
+DEFAULT_DIMENSIONS = 256
+
+# Fields whose text describes a document for retrieval.
+SEARCH_FIELDS = get_schema().fields("search")
+
+_BLOCK_ROWS = 65536
+
+
+def _text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+class VectorStore:
+    """Append-mostly float32 matrix in a memory-mapped file, addressed by document id."""
+
+    def __init__(self, path, dimensions=DEFAULT_DIMENSIONS, flush_every=200):
+        self.path = path
+        self.dimensions = dimensions
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.ids = []
+        self.hashes = []
+        self.row_of = {}
+        self._free = []
+        self._vectors = None
+        self._load()
+
+    def __len__(self):
+        return len(self.row_of)
+
+    @property
+    def _meta_path(self):
+        return self.path + ".json"
+
+    def _load(self):
+        try:
+            with open(self._meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = None
+        if meta and meta.get("dimensions") == self.dimensions and os.path.exists(self.path):
+            self.ids = meta["ids"]
+            self.hashes = meta["hashes"]
+            capacity = os.path.getsize(self.path) // (4 * self.dimensions)
+            if capacity >= len(self.ids):
+                self._vectors = np.memmap(self.path, dtype=np.float32, mode="r+", shape=(capacity, self.dimensions))
+                self.row_of = {doc_id: row for row, doc_id in enumerate(self.ids) if doc_id is not None}
+                self._free = [row for row, doc_id in enumerate(self.ids) if doc_id is None]
+                return
+            logger.warning("Vector file %s is shorter than its metadata; rebuilding", self.path)
+        self.ids, self.hashes = [], []
+        self._allocate(1024)
+
+    def _allocate(self, capacity):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        old = self._vectors
+        tmp = self.path + ".tmp"
+        vectors = np.memmap(tmp, dtype=np.float32, mode="w+", shape=(capacity, self.dimensions))
+        if old is not None:
+            vectors[:len(self.ids)] = old[:len(self.ids)]
+            del old
+        vectors.flush()
+        del vectors
+        os.replace(tmp, self.path)
+        self._vectors = np.memmap(self.path, dtype=np.float32, mode="r+", shape=(capacity, self.dimensions))
+
+    def upsert(self, doc_id, text):
+        """Embed `text` for `doc_id` unless the stored vector already has the same text."""
+        digest = _text_hash(text)
+        with self._lock:
+            row = self.row_of.get(doc_id)
+            if row is not None and self.hashes[row] == digest:
+                return False
+            if row is None:
+                if self._free:
+                    row = self._free.pop()
+                else:
+                    row = len(self.ids)
+                    if row >= self._vectors.shape[0]:
+                        self._allocate(self._vectors.shape[0] * 2)
+                    self.ids.append(None)
+                    self.hashes.append(None)
+                self.ids[row] = doc_id
+                self.row_of[doc_id] = row
+            self._vectors[row] = embed(text, self.dimensions)
+            self.hashes[row] = digest
+            self._written()
+            return True
+
+    def delete(self, doc_id):
+        with self._lock:
+            row = self.row_of.pop(doc_id, None)
+            if row is None:
+                return False
+            self._vectors[row] = 0.0
+            self.ids[row] = None
+            self.hashes[row] = None
+            self._free.append(row)
+            self._written()
+            return True
+
+    def sync(self, texts):
+        """Make the store match `texts` (doc id -> text); returns (embedded, deleted)."""
+        embedded = sum(1 for doc_id, text in texts.items() if self.upsert(doc_id, text))
+        deleted = sum(1 for doc_id in list(self.row_of) if doc_id not in texts and self.delete(doc_id))
+        self.flush()
+        return embedded, deleted
+
+    def _written(self):
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        self._vectors.flush()
+        tmp = self._meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"dimensions": self.dimensions, "ids": self.ids, "hashes": self.hashes}, f)
+        os.replace(tmp, self._meta_path)
+        self._pending = 0
+
+    def rows(self, rows):
+        with self._lock:
+            return np.asarray(self._vectors[rows])
+
+    def search(self, query_vector, k):
+        """Top-k `(cosine, doc_id)` pairs by inner product."""
+        with self._lock:
+            n = len(self.ids)
+            best_scores = np.empty(0, dtype=np.float32)
+            best_rows = np.empty(0, dtype=np.int64)
+            for start in range(0, n, _BLOCK_ROWS):
+                scores = self._vectors[start:min(n, start + _BLOCK_ROWS)] @ query_vector
+                take = min(k, len(scores))
+                top = np.argpartition(-scores, take - 1)[:take]
+                best_scores = np.concatenate([best_scores, scores[top]])
+                best_rows = np.concatenate([best_rows, top + start])
+            order = np.argsort(-best_scores)
+            results = []
+            for i in order:
+                doc_id = self.ids[best_rows[i]]
+                if doc_id is not None:
+                    results.append((float(best_scores[i]), doc_id))
+                if len(results) == k:
+                    break
+            return results
+
+
+class HybridRetriever:
+    """Vector and lexical candidates for one collection; actions.retrieval ranks them."""
+
+    def __init__(self, catalog, collection, index_dir=DEFAULT_INDEX_DIR, dimensions=DEFAULT_DIMENSIONS):
+        self.catalog = catalog
+        self.collection = collection
+        self.fields = SEARCH_FIELDS[collection]
+        self.store = VectorStore(os.path.join(index_dir, f"{collection}.f32"), dimensions)
+        self._docs = {}
+        self._docs_version = None
+        self._positions = (None, {})
+        self._lock = threading.Lock()
+        embedded, deleted = self.store.sync(self._texts())
+        logger.info("Vector index %s: %d documents, %d embedded, %d deleted",
+                    collection, len(self.store), embedded, deleted)
+        catalog.subscribe(self._on_change)
+
+    def _texts(self):
+        return {str(doc["_id"]): document_blob(doc, self.fields) for doc in self.catalog.documents(self.collection)}
+
+    def _on_change(self, collection, doc_id):
+        if collection != self.collection:
+            return
+        if doc_id is None:
+            self.store.sync(self._texts())
+            return
+        doc = self.catalog.get(collection, doc_id)
+        if doc is None:
+            self.store.delete(str(doc_id))
+        else:
+            self.store.upsert(str(doc_id), document_blob(doc, self.fields))
+
+    def documents(self):
+        """Current documents of the collection by string id."""
+        version = self.catalog.version(self.collection)
+        with self._lock:
+            if self._docs_version != version:
+                self._docs = {str(doc["_id"]): doc for doc in self.catalog.documents(self.collection)}
+                self._docs_version = version
+            return self._docs
+
+    def _positions_in(self, fuzzy):
+        with self._lock:
+            if self._positions[0] is not fuzzy:
+                self._positions = (fuzzy, {str(doc["_id"]): i for i, doc in enumerate(fuzzy.docs)})
+            return self._positions[1]
+
+    def candidates(self, query, pool=20, extra_ids=()):
+        """Candidate ids with their cosine and trigram Dice scores.
+
+        The candidates are the `pool` best vector matches, the `pool` best
+        lexical matches and `extra_ids`; returns `(ids, cosine, dice)` with
+        the scores as float32 arrays aligned to `ids`.
+        """
+        query = (query or "").lower().strip()
+        if not query:
+            return [], np.empty(0, dtype=np.float32), np.empty(0, dtype=np.float32)
+        docs = self.documents()
+        fuzzy = get_fuzzy_index(self.catalog, self.collection, self.fields)
+        positions = self._positions_in(fuzzy)
+        query_vector = embed(query, self.store.dimensions)
+
+        cosine = {doc_id: score for score, doc_id in self.store.search(query_vector, pool)}
+        dice = {str(fuzzy.docs[i]["_id"]): score for score, i in fuzzy.scored_candidates(query, pool)}
+        ids = [doc_id for doc_id in dict.fromkeys([*cosine, *dice, *extra_ids]) if doc_id in docs]
+        missing = [doc_id for doc_id in ids if doc_id not in cosine]
+        if missing:
+            rows = [self.store.row_of.get(doc_id) for doc_id in missing]
+            known = [(doc_id, row) for doc_id, row in zip(missing, rows) if row is not None]
+            if known:
+                scores = self.store.rows([row for _, row in known]) @ query_vector
+                cosine.update(zip((doc_id for doc_id, _ in known), scores.tolist()))
+        for doc_id in ids:
+            if doc_id not in dice:
+                dice[doc_id] = fuzzy.dice(query, positions[doc_id]) if doc_id in positions else 0.0
+        return (
+            ids,
+            np.fromiter((max(cosine.get(doc_id, 0.0), 0.0) for doc_id in ids), dtype=np.float32, count=len(ids)),
+            np.fromiter((dice[doc_id] for doc_id in ids), dtype=np.float32, count=len(ids)),
+        )
+
+    def close(self):
+        self.store.flush()
+
+
+_retrievers = {}
+_retrievers_lock = threading.Lock()
+
+
+def get_retriever(catalog, collection):
+    retriever = _retrievers.get(collection)
+    if retriever is None:
+        with _retrievers_lock:
+            retriever = _retrievers.get(collection)
+            if retriever is None:
+                retriever = HybridRetriever(
+                    catalog,
+                    collection,
+                    index_dir=os.getenv("VECTOR_INDEX_DIR", DEFAULT_INDEX_DIR),
+                    dimensions=int(os.getenv("VECTOR_DIMENSIONS", str(DEFAULT_DIMENSIONS))),
+                )
+                _retrievers[collection] = retriever
+    return retriever
+
+
+@atexit.register
+def _flush_all():
+    for retriever in list(_retrievers.values()):
+        try:
+            retriever.close()
+        except Exception:
+            logger.exception("Flushing vector index %s failed", retriever.collection)
+
+
+def main():
+    from actions.catalog import COLLECTIONS, get_catalog
+
+    parser = argparse.ArgumentParser(description="Build the local vector index over the catalog.")
+    parser.add_argument("command", choices=["build"])
+    parser.parse_args()
+    catalog = get_catalog()
+    for collection in COLLECTIONS:
+        retriever = get_retriever(catalog, collection)
+        print(f"{collection}: {len(retriever.store)} vectors in {retriever.store.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# Local stand-in for the Together `/v1/completions` endpoint.
+#
+# Extraction prompts from the NLU component are answered with the annotated
+# parse of the same utterance in data/nlu.yml (or a plain search_database
+# parse), everything else with a fixed number of filler tokens. Latency is
+# configurable: `latency_ms` is spread over the tokens, so streamed and
+# non-streamed requests take the same time to finish.
+#
+#     python -m benchmarks.llm_stub --port 8089 --latency-ms 400
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import threading
+
+from aiohttp import web
+
+from custom_components.nlu_cache import normalize_text, training_examples
+
+_SINGLE = re.compile(r'Message: "(?P<text>.*)"\s*$', re.S)
+_NUMBERED = re.compile(r'^\d+\. "(?P<text>.*)"$', re.M)
+
+
+class CompletionStub:
+    def __init__(self, latency_ms=300.0, jitter_ms=50.0, tokens=40, nlu_path="data/nlu.yml"):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tokens = tokens
+        self.requests = 0
+        self.parses = {}
+        if nlu_path:
+            for text, parse in training_examples(nlu_path):
+                self.parses[normalize_text(text)] = parse
+
+    def _parse(self, text):
+        return self.parses.get(normalize_text(text), {"intent": "search_database", "entities": []})
+
+    def _answer(self, prompt):
+        if "Messages:\n" in prompt:
+            return [json.dumps([self._parse(m.group("text")) for m in _NUMBERED.finditer(prompt)])]
+        match = _SINGLE.search(prompt)
+        if prompt.startswith("Extract the intent") and match:
+            return [json.dumps(self._parse(match.group("text")))]
+        return [f"token{i} " for i in range(self.tokens)]
+
+    def _delay(self):
+        return max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000.0
+
+    async def completions(self, request):
+        self.requests += 1
+        body = await request.json()
+        parts = self._answer(body.get("prompt", ""))
+        delay = self._delay()
+        if not body.get("stream"):
+            await asyncio.sleep(delay)
+            return web.json_response({"choices": [{"text": "".join(parts)}]})
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for part in parts:
+            await asyncio.sleep(delay / len(parts))
+            await response.write(f"data: {json.dumps({'choices': [{'text': part}]})}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/v1/completions", self.completions)
+        return app
+
+
+class StubServer:
+    """Runs a CompletionStub on its own event loop thread."""
+
+    def __init__(self, stub, host="127.0.0.1", port=0):
+        self.stub = stub
+        self.host = host
+        self.port = port
+        self._loop = asyncio.new_event_loop()
+        self._runner = None
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-stub", daemon=True)
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/v1/completions"
+
+    async def _start(self):
+        self._runner = web.AppRunner(self.stub.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    def start(self):
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for /v1/completions.")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--tokens", type=int, default=40)
+    parser.add_argument("--nlu", default="data/nlu.yml")
+    args = parser.parse_args()
+    stub = CompletionStub(args.latency_ms, args.jitter_ms, args.tokens, args.nlu)
+    web.run_app(stub.app(), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+# Offline latency/throughput benchmark for the NLU component and ActionSearchDatabase.
+#
+# Seeds a local MongoDB (a running mongod, or mongomock in-process) with a
+# synthetic catalog, starts a local stand-in for the completions API with a
+# configurable latency, and replays the utterances of data/nlu.yml and
+# tests/test_stories.yml through the NLU component and the action, with a
+# number of concurrent conversations. Per-stage timings come from the spans
+# recorded by actions.tracing; the report (p50/p95/p99 per stage, turns per
+# second, and, of the turns that resolved a document, the share answered
+# without a generation call with their latency under
+# `document_turn.without_generation`) is written as JSON named after the
+# commit so runs can be compared:
+#
+#     python -m benchmarks.run --scale 10000 --llm-latency-ms 300 --concurrency 16
+#     python -m benchmarks.run --scale 10000 --compare benchmarks/results/<older>.json
+#
+# The mongomock backend needs `pip install mongomock`; the NLU stage is
+# skipped when Rasa is not installed.
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+import yaml
+
+from benchmarks.llm_stub import CompletionStub, StubServer
+from benchmarks.seed import seed
+from custom_components.nlu_cache import training_examples
+
+RESULTS_DIR = os.path.join("benchmarks", "results")
+# Paths that answer from one resolved document (template, cache or generation).
+DOCUMENT_PATHS = {"planner", "retrieval", "session"}
+
+
+class SpanCollector:
+    """In-memory span exporter: durations per stage name, paths and answer kinds per turn."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.durations = defaultdict(list)
+        self.paths = Counter()
+        self.answers = Counter()
+        self._generated = set()  # traces with a generation span
+
+    def export(self, span):
+        self.durations[span.name].append(span.duration_ms)
+        if span.name == "generation":
+            self._generated.add(span.trace_id)
+        if span.parent_id is None:
+            if "path" in span.attributes:
+                self.paths[span.attributes["path"]] += 1
+            # Children finish before the root, so the trace's generation span (if any) is already here.
+            generated = span.trace_id in self._generated
+            self._generated.discard(span.trace_id)
+            # Greetings, lists, analytics and fallbacks never generate; only document answers are a choice.
+            if span.attributes.get("path") in DOCUMENT_PATHS:
+                self.answers[span.attributes.get("answer", "unknown")] += 1
+                stage = "document_turn.generated" if generated else "document_turn.without_generation"
+                self.durations[stage].append(span.duration_ms)
+
+    def record(self, name, duration_ms):
+        self.durations[name].append(duration_ms)
+
+    def close(self):
+        pass
+
+
+class _AsyncCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    async def to_list(self, length=None):
+        docs = list(self._cursor)
+        return docs if length is None else docs[:length]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._cursor)
+        except StopIteration:
+            raise StopAsyncIteration from None
+
+
+class _AsyncCollection:
+    """Just enough of PyMongo's async collection API over a mongomock collection."""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    async def find_one(self, filter=None, projection=None, collation=None, **kwargs):
+        return self._collection.find_one(filter, projection, **kwargs)
+
+    def find(self, filter=None, projection=None, collation=None, **kwargs):
+        return _AsyncCursor(self._collection.find(filter, projection, **kwargs))
+
+    async def aggregate(self, pipeline, collation=None, **kwargs):
+        return _AsyncCursor(self._collection.aggregate(pipeline, **kwargs))
+
+
+class _AsyncDatabase:
+    def __init__(self, db):
+        self._db = db
+
+    def __getitem__(self, name):
+        return _AsyncCollection(self._db[name])
+
+
+class _AsyncClient:
+    def __init__(self, client):
+        self._client = client
+
+    def __getitem__(self, name):
+        return _AsyncDatabase(self._client[name])
+
+
+def utterances(nlu_path, stories_path):
+    """`(text, parse)` pairs from the NLU examples and the test stories."""
+    turns = list(training_examples(nlu_path))
+    if stories_path and os.path.exists(stories_path):
+        with open(stories_path, encoding="utf-8") as f:
+            stories = yaml.safe_load(f) or {}
+        for story in stories.get("stories", []):
+            for step in story.get("steps", []):
+                if "user" in step:
+                    turns.append((step["user"].strip(), {"intent": step.get("intent"), "entities": []}))
+    return turns
+
+
+def summarize(values):
+    values = np.asarray(values, dtype=np.float64)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "count": int(values.size),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+    }
+
+
+def git_revision():
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return sha, dirty
+
+
+def setup_backend(args):
+    """Seed the catalog and point actions.mongo at it; returns seed counts and seconds."""
+    start = time.perf_counter()
+    if args.backend == "mongomock":
+        import mongomock
+
+        import actions.mongo
+
+        client = mongomock.MongoClient()
+        counts = seed(client[args.db], args.scale, args.nlu, args.seed)
+        actions.mongo._client = client
+        async_client = _AsyncClient(client)
+        actions.mongo.get_async_mongo_client = lambda: async_client
+    else:
+        from pymongo import MongoClient
+
+        with MongoClient(args.mongodb_uri) as client:
+            counts = seed(client[args.db], args.scale, args.nlu, args.seed)
+    return counts, time.perf_counter() - start
+
+
+def load_nlu(collector, use_cache):
+    try:
+        from rasa.shared.nlu.training_data.message import Message
+
+        from custom_components.llm_nlu_graph_component import LLMIntentEntityGraphComponent
+    except ImportError as e:
+        print(f"NLU stage skipped: {e}", file=sys.stderr)
+        return None
+
+    component = LLMIntentEntityGraphComponent({"cache": use_cache})
+
+    def parse(text):
+        message = Message(data={"text": text})
+        start = time.perf_counter()
+        component.process([message])
+        collector.record("nlu", (time.perf_counter() - start) * 1000)
+        return {"intent": message.get("intent"), "entities": message.get("entities") or []}
+
+    return parse
+
+
+async def replay(action, nlu_parse, turns, concurrency, collector):
+    from rasa_sdk import Tracker
+    from rasa_sdk.executor import CollectingDispatcher
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def turn(index, text, annotated):
+        async with semaphore:
+            start = time.perf_counter()
+            if nlu_parse is not None:
+                parse = await asyncio.to_thread(nlu_parse, text)
+            else:
+                parse = {"intent": {"name": annotated.get("intent"), "confidence": 1.0},
+                         "entities": annotated.get("entities", [])}
+            latest = {"text": text, "intent": parse["intent"] or {}, "entities": parse["entities"]}
+            tracker = Tracker(f"bench-{index % concurrency}", {}, latest, [], False, None, {}, "action_listen")
+            await action.run(CollectingDispatcher(), tracker, {})
+            collector.record("turn", (time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(turn(i, text, parse) for i, (text, parse) in enumerate(turns)))
+    return time.perf_counter() - start
+
+
+def compare(report, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nagainst {baseline['commit']} ({baseline_path}):")
+    for stage, stats in sorted(report["stages"].items()):
+        old = baseline["stages"].get(stage)
+        if not old:
+            print(f"  {stage:<24} new")
+            continue
+        deltas = "  ".join(
+            f"{key[:-3]} {stats[key]:9.2f} ({(stats[key] - old[key]) / old[key] * 100 if old[key] else 0.0:+6.1f}%)"
+            for key in ("p50_ms", "p95_ms", "p99_ms")
+        )
+        print(f"  {stage:<24} {deltas}")
+    old_tps = baseline["throughput_turns_per_s"]
+    new_tps = report["throughput_turns_per_s"]
+    print(f"  {'throughput':<24} {new_tps:.2f} turns/s ({(new_tps - old_tps) / old_tps * 100 if old_tps else 0.0:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline latency/throughput benchmark.")
+    parser.add_argument("--scale", type=int, default=1000, help="Documents per collection (e.g. 1000, 10000, 100000).")
+    parser.add_argument("--backend", choices=["mongomock", "mongod"], default="mongomock")
+    parser.add_argument("--mongodb-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="homelead_bench")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=30.0)
+    parser.add_argument("--llm-tokens", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8, help="Conversations replayed at once.")
+    parser.add_argument("--rounds", type=int, default=3, help="Times the utterance set is replayed.")
+    parser.add_argument("--warmup", type=int, default=1, help="Leading rounds left out of the report.")
+    parser.add_argument("--no-nlu-cache", action="store_true")
+    parser.add_argument("--nlu", default=os.path.join("data", "nlu.yml"))
+    parser.add_argument("--stories", default=os.path.join("tests", "test_stories.yml"))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Report path (default benchmarks/results/<commit>-<backend>-<scale>.json).")
+    parser.add_argument("--compare", default=None, help="Earlier report to diff against.")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="homelead-bench-")
+    stub = StubServer(CompletionStub(args.llm_latency_ms, args.llm_jitter_ms, args.llm_tokens, args.nlu)).start()
+    os.environ.update({
+        "LLM_COMPLETIONS_URL": stub.url,
+        "TOGETHER_API_KEY": "benchmark",
+        "MONGODB_URI": args.mongodb_uri,
+        "MONGODB_DB": args.db,
+        "CATALOG_REFRESH_MODE": "poll",
+        "VECTOR_INDEX_DIR": os.path.join(workdir, "vectors"),
+        "NLU_CACHE_PATH": os.path.join(workdir, "nlu_cache.db"),
+        "SESSION_STATE_PATH": os.path.join(workdir, "session_state.db"),
+    })
+    counts, seed_seconds = setup_backend(args)
+
+    from actions.actions import ActionSearchDatabase
+    from actions.llm_client import get_llm_client
+    from actions.tracing import set_exporter
+
+    collector = SpanCollector()
+    set_exporter(collector)
+    start = time.perf_counter()
+    action = ActionSearchDatabase()
+    catalog_seconds = time.perf_counter() - start
+    nlu_parse = load_nlu(collector, not args.no_nlu_cache)
+
+    turns = utterances(args.nlu, args.stories)
+    loop = asyncio.new_event_loop()
+    wall = 0.0
+    for round_index in range(args.rounds):
+        if round_index == args.warmup:
+            collector.reset()
+            wall = 0.0
+        elapsed = loop.run_until_complete(replay(action, nlu_parse, turns, args.concurrency, collector))
+        if round_index >= args.warmup:
+            wall += elapsed
+    loop.close()
+    get_llm_client().close()
+    stub.stop()
+
+    measured_rounds = max(0, args.rounds - args.warmup)
+    sha, dirty = git_revision()
+    report = {
+        "commit": sha + ("-dirty" if dirty else ""),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "settings": {
+            "backend": args.backend,
+            "scale": args.scale,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_jitter_ms": args.llm_jitter_ms,
+            "llm_tokens": args.llm_tokens,
+            "concurrency": args.concurrency,
+            "rounds": measured_rounds,
+            "nlu": nlu_parse is not None,
+            "nlu_cache": not args.no_nlu_cache,
+        },
+        "setup": {"documents": counts, "seed_seconds": round(seed_seconds, 3),
+                  "catalog_seconds": round(catalog_seconds, 3)},
+        "turns": len(turns) * measured_rounds,
+        "wall_seconds": round(wall, 3),
+        "throughput_turns_per_s": round(len(turns) * measured_rounds / wall, 3) if wall else 0.0,
+        "paths": dict(collector.paths),
+        "answers": dict(collector.answers),
+        "document_turns": sum(collector.answers.values()),
+        # Cache hits replay answers generated in earlier rounds; "template" is the part that never needs the LLM.
+        "answer_shares_pct": {
+            kind: round(100.0 * count / sum(collector.answers.values()), 1) for kind, count in collector.answers.items()
+        },
+        "without_generation_pct": round(
+            100.0 * len(collector.durations["document_turn.without_generation"])
+            / max(1, sum(collector.answers.values())), 1
+        ),
+        "llm_requests": stub.stub.requests,
+        "stages": {name: summarize(values) for name, values in sorted(collector.durations.items()) if values},
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{sha}-{args.backend}-{args.scale}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{report['turns']} turns in {report['wall_seconds']} s: {report['throughput_turns_per_s']} turns/s")
+    for stage, stats in report["stages"].items():
+        print(f"  {stage:<24} n={stats['count']:<6} p50 {stats['p50_ms']:9.2f}  p95 {stats['p95_ms']:9.2f}  p99 {stats['p99_ms']:9.2f} ms")
+    shares = ", ".join(f"{kind} {pct}%" for kind, pct in sorted(report["answer_shares_pct"].items()))
+    print(f"answered without generation: {report['without_generation_pct']}% of {report['document_turns']} turns "
+          f"that resolved a document ({shares})")
+    print(f"report: {output}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# Synthetic catalog data for benchmarks.
+#
+# Generates brokers, properties and projects in the shapes the actions read,
+# `scale` documents per collection, deterministically from a seed. The names
+# used in data/nlu.yml ("mall of jaipur", "Lush Valley Residences", ...) are
+# always present so replayed utterances find real matches.
+
+import datetime
+import random
+
+from custom_components.nlu_cache import training_examples
+
+CITIES = ["Mumbai", "Delhi", "Jaipur", "Pune", "Bengaluru", "Hyderabad", "Chennai", "Kolkata", "Lucknow",
+          "Ahmedabad", "Uttar Pradesh", "Indore"]
+STATES = ["Maharashtra", "Delhi", "Rajasthan", "Karnataka", "Telangana", "Tamil Nadu", "West Bengal",
+          "Uttar Pradesh", "Gujarat", "Madhya Pradesh"]
+WORDS = ["Horizon", "Lush", "Valley", "Ganga", "View", "Royal", "Green", "Park", "Vista", "Prime", "Sun", "Lake",
+         "Crest", "Orchid", "Silver", "Oak", "Palm", "River", "Skyline", "Heritage"]
+SUFFIXES = ["Residences", "Towers", "Heights", "Enclave", "Greens", "Plaza", "Square", "Homes"]
+FIRST_NAMES = ["Murari", "Anita", "Rahul", "Priya", "Vikram", "Sneha", "Arjun", "Kavita", "Rohan", "Meera"]
+LAST_NAMES = ["Singh", "Sharma", "Patel", "Gupta", "Iyer", "Reddy", "Khan", "Das", "Mehta", "Joshi"]
+FACINGS = ["North", "South", "East", "West", "North-East", "North-West", "South-East", "South-West"]
+
+
+def _named(nlu_path):
+    names = {"property_name": set(), "project_name": set(), "broker_name": set()}
+    for _, parse in training_examples(nlu_path):
+        for entity in parse["entities"]:
+            if entity["entity"] in names:
+                names[entity["entity"]].add(entity["value"])
+    return {key: sorted(values) for key, values in names.items()}
+
+
+def brokers(rng, count, names=()):
+    now = datetime.datetime(2025, 1, 1)
+    for i in range(count):
+        city = rng.choice(CITIES)
+        name = names[i] if i < len(names) else f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}"
+        yield {
+            "name": name,
+            "company": f"{rng.choice(WORDS)} {rng.choice(['Group', 'Realty', 'Estates', 'Associates'])}",
+            "countryCode": "+91",
+            "phone": f"9{rng.randrange(10 ** 9):09d}",
+            "city": city,
+            "state": rng.choice(STATES),
+            "address": f"{rng.randint(1, 200)} {rng.choice(WORDS)} Nagar, {city}",
+            "zipCode": f"{rng.randint(110000, 799999)}",
+            "commissionPercent": round(rng.uniform(0.5, 3.0), 2),
+            "yearStartedInRealEstate": rng.randint(1990, 2024),
+            "status": rng.choice(["active", "inactive"]),
+            "updatedAt": now + datetime.timedelta(minutes=i),
+        }
+
+
+def properties(rng, count, names=()):
+    now = datetime.datetime(2025, 1, 1)
+    for i in range(count):
+        min_budget = rng.randrange(5, 500) * 100000
+        doc = {
+            "propertyType": rng.choice(["Commercial", "Residential"]),
+            "blockName": f"BLOCK {rng.choice('ABCDEFGH')}",
+            "floorName": f"Floor {rng.randint(0, 20)}",
+            "series": rng.choice(["A", "B", "C"]),
+            "shopNo": i + 1,
+            "furnishedStatus": rng.choice(["Furnished", "Semi-Furnished", "Unfurnished"]),
+            "minBudget": min_budget,
+            "maxBudget": min_budget + rng.randrange(1, 50) * 100000,
+            "facing": rng.choice(FACINGS),
+            "vastuCompliant": rng.random() < 0.5,
+            "carpetArea": rng.randint(200, 3000),
+            "carpetAreaType": "sqft",
+            "builtUpArea": rng.randint(300, 3500),
+            "builtUpAreaType": "sqft",
+            "noOfBedRooms": rng.randint(0, 5),
+            "noOfBathRooms": rng.randint(1, 4),
+            "noOfBalconies": rng.randint(0, 3),
+            "noOfParkingLots": rng.randint(0, 2),
+            "city": rng.choice(CITIES),
+            "category": rng.choice(["Commercial", "Residential"]),
+            "projectStatus": rng.choice(["Ready to shift", "Under construction", "Upcoming"]),
+            "updatedAt": now + datetime.timedelta(minutes=i),
+        }
+        if i < len(names):
+            doc["name"] = names[i]
+        # The NLU examples ask about BLOCK B Floor 4 Shop 179.
+        if i == 178:
+            doc.update(blockName="BLOCK B", floorName="Floor 4")
+        yield doc
+
+
+def projects(rng, count, names=()):
+    now = datetime.datetime(2025, 1, 1)
+    for i in range(count):
+        city = rng.choice(CITIES)
+        min_budget = rng.randrange(20, 900) * 100000
+        name = names[i] if i < len(names) else f"{rng.choice(WORDS)} {rng.choice(WORDS)} {rng.choice(SUFFIXES)} {i}"
+        yield {
+            "name": name,
+            "slug": name.lower().replace(" ", "-"),
+            "category": rng.choice(["Commercial", "Residential"]),
+            "projectStatus": rng.choice(["Ready to shift", "Under construction", "Upcoming"]),
+            "minBudget": min_budget,
+            "maxBudget": min_budget + rng.randrange(5, 200) * 100000,
+            "startDate": datetime.datetime(2015 + rng.randint(0, 9), rng.randint(1, 12), 1),
+            "completionDate": datetime.datetime(2026 + rng.randint(0, 5), rng.randint(1, 12), 1),
+            "phone": f"8{rng.randrange(10 ** 9):09d}",
+            "email": f"sales{i}@example.com",
+            "address": f"{rng.randint(1, 500)} {rng.choice(WORDS)} Road, {city}",
+            "city": city,
+            "reraRegistrationNumber": f"RERA-{rng.randrange(10 ** 8):08d}",
+            "projectRegistrationNumber": f"PRJ-{i:06d}",
+            "projectType": rng.choice(["Apartment", "Villa", "Shops", "Offices"]),
+            "projectUnitSubType": rng.choice(["1BHK", "2BHK", "3BHK", "Shop", "Office"]),
+            "updatedAt": now + datetime.timedelta(minutes=i),
+        }
+
+
+def seed(db, scale, nlu_path="data/nlu.yml", seed=42, batch_size=5000):
+    """Replace the three collections in `db` with `scale` synthetic documents each."""
+    rng = random.Random(seed)
+    named = _named(nlu_path)
+    generators = {
+        "brokers": brokers(rng, scale, named["broker_name"]),
+        "properties": properties(rng, scale, named["property_name"]),
+        "projects": projects(rng, scale, named["project_name"]),
+    }
+    counts = {}
+    for collection, docs in generators.items():
+        db[collection].drop()
+        batch = []
+        counts[collection] = 0
+        for doc in docs:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                db[collection].insert_many(batch)
+                counts[collection] += len(batch)
+                batch = []
+        if batch:
+            db[collection].insert_many(batch)
+            counts[collection] += len(batch)
+    return counts
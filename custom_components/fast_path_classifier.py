@@ -0,0 +1,157 @@
+import json
+import logging
+import re
+from typing import Any, Dict, List, Optional, Text, Tuple
+
+from rasa.engine.graph import GraphComponent, ExecutionContext
+from rasa.engine.recipes.default_recipe import DefaultV1Recipe
+from rasa.engine.storage.resource import Resource
+from rasa.engine.storage.storage import ModelStorage
+from rasa.shared.nlu.constants import ENTITIES, INTENT, TEXT
+from rasa.shared.nlu.training_data.message import Message
+from rasa.shared.nlu.training_data.training_data import TrainingData
+
+from custom_components.nlu_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = "fast_path.json"
+
+# "list all brokers", "show me the properties", "list of project", ...
+LIST_QUERY = re.compile(
+    r"^(?:please )?(?:list|show(?: me)?|give me|what are)(?: (?:all|the|of|every|available))* "
+    r"(?:brokers?|propert(?:y|ies)|projects?)$"
+)
+# "show more", "next page", ...: follow-ups that page through the last list.
+MORE_QUERY = re.compile(r"^(?:please )?(?:(?:show|give|load|see)(?: me)? )?(?:some )?(?:more|next(?: page)?|the rest)$")
+
+
+@DefaultV1Recipe.register([DefaultV1Recipe.ComponentType.INTENT_CLASSIFIER], is_trainable=True)
+class FastPathIntentClassifier(GraphComponent):
+    """Classifies trivial utterances locally so they never reach the LLM.
+
+    Training compiles the examples of `fast_path_intents` into one keyword
+    automaton per intent. A message is claimed when its best match covers
+    enough of the normalized text (`threshold`); anything else passes through
+    untouched to `LLMIntentEntityGraphComponent`.
+    """
+
+    @staticmethod
+    def get_default_config() -> Dict[Text, Any]:
+        return {
+            "fast_path_intents": ["greet", "goodbye"],
+            # Intent assigned to bare list queries ("list all brokers") and "show more".
+            "list_intent": "search_database",
+            "threshold": 0.8,
+            # Log the absorbed share of traffic every N messages (0 disables).
+            "report_every": 100,
+        }
+
+    def __init__(
+        self,
+        config: Dict[Text, Any],
+        model_storage: ModelStorage,
+        resource: Resource,
+        phrases: Optional[Dict[Text, List[Text]]] = None,
+    ) -> None:
+        self.config = {**self.get_default_config(), **config}
+        self._model_storage = model_storage
+        self._resource = resource
+        self.phrases = phrases or {}
+        self.threshold = float(self.config["threshold"])
+        self.processed = 0
+        self.absorbed = 0
+        self._compile()
+
+    @classmethod
+    def create(
+        cls,
+        config: Dict[Text, Any],
+        model_storage: ModelStorage,
+        resource: Resource,
+        execution_context: ExecutionContext,
+    ) -> "FastPathIntentClassifier":
+        return cls(config, model_storage, resource)
+
+    @classmethod
+    def load(
+        cls,
+        config: Dict[Text, Any],
+        model_storage: ModelStorage,
+        resource: Resource,
+        execution_context: ExecutionContext,
+        **kwargs: Any,
+    ) -> "FastPathIntentClassifier":
+        try:
+            with model_storage.read_from(resource) as path:
+                phrases = json.loads((path / MODEL_FILE).read_text(encoding="utf-8"))
+        except (ValueError, FileNotFoundError):
+            logger.warning("No fast-path model found, every message will go to the LLM.")
+            phrases = {}
+        return cls(config, model_storage, resource, phrases)
+
+    def _compile(self) -> None:
+        self._exact = {}
+        self._patterns = []
+        for intent, phrases in self.phrases.items():
+            for phrase in phrases:
+                self._exact[phrase] = intent
+            alternation = "|".join(re.escape(p) for p in sorted(phrases, key=len, reverse=True))
+            if alternation:
+                self._patterns.append((intent, re.compile(rf"\b(?:{alternation})\b")))
+
+    def train(self, training_data: TrainingData) -> Resource:
+        intents = set(self.config["fast_path_intents"])
+        owners: Dict[Text, set] = {}
+        for example in training_data.intent_examples:
+            phrase = normalize_text(example.get(TEXT))
+            if phrase:
+                owners.setdefault(phrase, set()).add(example.get(INTENT))
+        phrases: Dict[Text, List[Text]] = {}
+        for phrase, labels in owners.items():
+            # Phrases that also occur under another intent are ambiguous.
+            if len(labels) == 1 and labels & intents:
+                phrases.setdefault(next(iter(labels)), []).append(phrase)
+        self.phrases = {intent: sorted(p) for intent, p in phrases.items()}
+        self._compile()
+        self.persist()
+        return self._resource
+
+    def persist(self) -> None:
+        with self._model_storage.write_to(self._resource) as path:
+            (path / MODEL_FILE).write_text(json.dumps(self.phrases), encoding="utf-8")
+
+    def classify(self, text: Text) -> Tuple[Optional[Text], float]:
+        normalized = normalize_text(text)
+        if not normalized:
+            return None, 0.0
+        intent = self._exact.get(normalized)
+        if intent is not None:
+            return intent, 1.0
+        if self.config["list_intent"] and (LIST_QUERY.match(normalized) or MORE_QUERY.match(normalized)):
+            return self.config["list_intent"], 1.0
+        best_intent, best_coverage = None, 0.0
+        for intent, pattern in self._patterns:
+            covered = sum(len(m.group(0)) for m in pattern.finditer(normalized))
+            coverage = covered / len(normalized)
+            if coverage > best_coverage:
+                best_intent, best_coverage = intent, coverage
+        return best_intent, best_coverage
+
+    def process(self, messages: List[Message]) -> List[Message]:
+        for message in messages:
+            self.processed += 1
+            intent, confidence = self.classify(message.get(TEXT) or "")
+            if intent is not None and confidence >= self.threshold:
+                self.absorbed += 1
+                message.set(INTENT, {"name": intent, "confidence": confidence}, add_to_output=True)
+                if not message.get(ENTITIES):
+                    message.set(ENTITIES, [], add_to_output=True)
+            report_every = self.config["report_every"]
+            if report_every and self.processed % report_every == 0:
+                logger.info("Fast path absorbed %.1f%% of %d messages", 100.0 * self.absorbed_ratio, self.processed)
+        return messages
+
+    @property
+    def absorbed_ratio(self) -> float:
+        return self.absorbed / self.processed if self.processed else 0.0
@@ -1,16 +1,42 @@
-from typing import Any, Dict, List, Text
+from typing import Any, Dict, List, Optional, Text
 from rasa.engine.graph import GraphComponent, ExecutionContext
 from rasa.engine.storage.resource import Resource
 from rasa.engine.storage.storage import ModelStorage
 from rasa.shared.nlu.training_data.message import Message
 from rasa.shared.nlu.constants import INTENT, ENTITIES
 from rasa.engine.recipes.default_recipe import DefaultV1Recipe
-import requests
 import json
+import logging
 import os
 
+from actions.llm_client import get_llm_client
+from actions.tracing import configure as configure_tracing, span
+from custom_components.llm_nlu_prompt import extraction_prompt
+from custom_components.nlu_cache import get_nlu_cache, namespace_for
+
+BATCH_MODES = ("off", "concurrent", "packed")
+
+logger = logging.getLogger(__name__)
+
+
 @DefaultV1Recipe.register("LLMIntentEntityGraphComponent", is_trainable=False)
 class LLMIntentEntityGraphComponent(GraphComponent):
+    @staticmethod
+    def get_default_config() -> Dict[Text, Any]:
+        return {
+            # "off" sends one request per message, "concurrent" sends them in
+            # parallel, "packed" puts `pack_size` messages into one prompt.
+            "batch_mode": "concurrent",
+            "max_parallel_requests": 8,
+            "pack_size": 10,
+            # Reuse results for repeated utterances (see custom_components/nlu_cache.py).
+            "cache": True,
+            # Generation backend ("together", "llama_cpp"); None uses endpoints.yml.
+            "backend": None,
+            # Overrides for that backend's settings in endpoints.yml.
+            "backend_settings": {},
+        }
+
     @classmethod
     def create(
         cls,
@@ -22,39 +48,121 @@ class LLMIntentEntityGraphComponent(GraphComponent):
         return cls(config)
 
     def __init__(self, config: Dict[Text, Any]) -> None:
+        config = {**self.get_default_config(), **config}
         self.api_key = os.getenv("TOGETHER_API_KEY") or config.get("api_key", "TOGETHER_API_KEY")
+        self.client = get_llm_client(self.api_key, config["backend"], **(config["backend_settings"] or {}))
+        self.batch_mode = config["batch_mode"]
+        if self.batch_mode not in BATCH_MODES:
+            raise ValueError(f"batch_mode must be one of {BATCH_MODES}, got {self.batch_mode!r}")
+        self.max_parallel_requests = int(config["max_parallel_requests"])
+        self.pack_size = max(1, int(config["pack_size"]))
+        self.cache = get_nlu_cache() if config["cache"] else None
+        self.cache_namespace = namespace_for(self.client.model)
+        configure_tracing()
+        logger.debug("TOGETHER_API_KEY loaded: %s", self.api_key[:4] + "..." if self.api_key else None)
+
+    @staticmethod
+    def _prompt(user_message: Text) -> Text:
+        return extraction_prompt(user_message)
+
+    @staticmethod
+    def _packed_prompt(user_messages: List[Text]) -> Text:
+        numbered = "\n".join(f"{i + 1}. \"{text}\"" for i, text in enumerate(user_messages))
+        return (
+            "Extract the intent and entities from each of the following user messages. "
+            "Return a JSON array with exactly one object per message, in the same order, each shaped as "
+            "{\"intent\": \"...\", \"entities\": [{\"entity\": \"...\", \"value\": \"...\"}]}\n"
+            f"Messages:\n{numbered}"
+        )
+
+    @staticmethod
+    def _apply(message: Message, result: Optional[Dict[Text, Any]]) -> None:
+        if not isinstance(result, dict):
+            message.set(INTENT, {"name": "search_database", "confidence": 0.5})
+            message.set(ENTITIES, [])
+            return
+        message.set(INTENT, {"name": result.get("intent", "search_database"), "confidence": 1.0})
+        entities = result.get("entities") or []
+        if not isinstance(entities, list):
+            entities = [entities]
+        valid = [dict(entity) for entity in entities if isinstance(entity, dict) and "entity" in entity and "value" in entity]
+        if len(valid) < len(entities):
+            logger.warning("Skipped %d malformed entities in LLM NLU output", len(entities) - len(valid))
+        message.set(ENTITIES, valid)
+
+    def _parse(self, text: Any) -> Optional[Dict[Text, Any]]:
+        if isinstance(text, Exception):
+            logger.warning("LLM NLU request failed: %s", text)
+            return None
+        try:
+            return json.loads(text)
+        except Exception as e:
+            logger.warning("LLM NLU response is not JSON: %s", e)
+            return None
+
+    def _process_concurrent(self, texts: List[Text]) -> List[Optional[Dict[Text, Any]]]:
+        prompts = [self._prompt(text) for text in texts]
+        completions = self.client.complete_many(
+            prompts, max_parallel=self.max_parallel_requests, max_tokens=200, temperature=0.0, top_p=0.7
+        )
+        return [self._parse(text) for text in completions]
+
+    def _process_packed(self, texts: List[Text]) -> List[Optional[Dict[Text, Any]]]:
+        chunks = [texts[i:i + self.pack_size] for i in range(0, len(texts), self.pack_size)]
+        prompts = [self._packed_prompt(chunk) for chunk in chunks]
+        completions = self.client.complete_many(
+            prompts,
+            max_parallel=self.max_parallel_requests,
+            max_tokens=200 * self.pack_size,
+            temperature=0.0,
+            top_p=0.7,
+        )
+        results = []
+        for chunk, completion in zip(chunks, completions):
+            parsed = None if isinstance(completion, Exception) else self._parse(completion)
+            if isinstance(parsed, list) and len(parsed) == len(chunk):
+                results.extend(item if isinstance(item, dict) else None for item in parsed)
+            else:
+                # The model did not return one object per message; redo this
+                # chunk one message at a time so results stay aligned.
+                logger.debug("Packed response misaligned, retrying chunk per message")
+                results.extend(self._process_concurrent(chunk))
+        return results
+
+    def _extract(self, texts: List[Text]) -> List[Optional[Dict[Text, Any]]]:
+        if self.batch_mode == "off" or len(texts) == 1:
+            results = []
+            for user_message in texts:
+                logger.debug("User message: %s", user_message)
+                try:
+                    text = self.client.complete(self._prompt(user_message), max_tokens=200, temperature=0.0, top_p=0.7)
+                except Exception as e:
+                    text = e
+                results.append(self._parse(text))
+            return results
+        if self.batch_mode == "packed":
+            return self._process_packed(texts)
+        return self._process_concurrent(texts)
 
     def process(self, messages: List[Message]) -> List[Message]:
-        print("[LLM NLU DEBUG] TOGETHER_API_KEY loaded:", (self.api_key[:4] + "..." if self.api_key else None))
-        for message in messages:
-            user_message = message.get("text")
-            print("[LLM NLU DEBUG] User message:", user_message)
-            prompt = (M
-                "Extract the intent and entities from the following user message. "
-                "Return as JSON: {\"intent\": \"...\", \"entities\": [{\"entity\": \"...\", \"value\": \"...\"}]}\n"
-                f"Message: \"{user_message}\""
-            )
-            url = "https://api.together.xyz/v1/completions"
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            data = {
-                "model": "meta-llama/Llama-3-8b-chat-hf",
-                "prompt": prompt,
-                "max_tokens": 200,
-                "temperature": 0.0,
-                "top_p": 0.7
-            }
-            try:
-                response = requests.post(url, headers=headers, json=data)
-                response.raise_for_status()
-                text = response.json()["choices"][0]["text"].strip()
-                result = json.loads(text)
-                message.set(INTENT, {"name": result.get("intent", "search_database"), "confidence": 1.0})
-                message.set(ENTITIES, result.get("entities", []))
-            except Exception as e:
-                print("[LLM NLU Graph Component ERROR]", e)
-                message.set(INTENT, {"name": "search_database", "confidence": 0.5})
-                message.set(ENTITIES, [])
-        return messages 
\ No newline at end of file
+        # Messages already classified by an earlier stage (the fast path) are left alone.
+        unclassified = [message for message in messages if not (message.get(INTENT) or {}).get("name")]
+        texts = [message.get("text") for message in unclassified]
+        results: List[Optional[Dict[Text, Any]]] = [None] * len(texts)
+        pending = []
+        for i, text in enumerate(texts):
+            cached = self.cache.get(text, self.cache_namespace) if self.cache is not None else None
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.append(i)
+        if pending:
+            with span("nlu.llm_call", messages=len(pending), batch_mode=self.batch_mode, cached=len(texts) - len(pending)):
+                extracted = self._extract([texts[i] for i in pending])
+            for i, result in zip(pending, extracted):
+                results[i] = result
+                if self.cache is not None and isinstance(result, dict):
+                    self.cache.set(texts[i], self.cache_namespace, result)
+        for message, result in zip(unclassified, results):
+            self._apply(message, result)
+        return messages
@@ -0,0 +1,15 @@
+import hashlib
+
+EXTRACTION_PROMPT = (
+    "Extract the intent and entities from the following user message. "
+    "Return as JSON: {{\"intent\": \"...\", \"entities\": [{{\"entity\": \"...\", \"value\": \"...\"}}]}}\n"
+    "Message: \"{message}\""
+)
+
+# Changes whenever the prompt wording changes, so cached NLU results produced
+# by an older prompt are never served.
+PROMPT_VERSION = hashlib.sha1(EXTRACTION_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+
+def extraction_prompt(user_message):
+    return EXTRACTION_PROMPT.format(message=user_message)
@@ -0,0 +1,315 @@
+# Two-tier cache for LLM intent/entity extraction results.
+#
+# Tier one is an in-process LRU, tier two a SQLite file next to Rasa's own
+# cache. Entries are keyed on the normalized utterance plus a namespace
+# (model name and prompt version), so changing either never serves stale
+# results. Both tiers expire entries after a TTL and are bounded in size.
+#
+# Warm-up from the annotated training data:
+#
+#     python -m custom_components.nlu_cache warm data/nlu.yml
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join(".rasa", "cache", "nlu_cache.db")
+
+_WHITESPACE = re.compile(r"\s+")
+_EDGE_PUNCTUATION = " \t\n.,!?;:'\""
+
+
+def normalize_text(text):
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return _WHITESPACE.sub(" ", text).strip(_EDGE_PUNCTUATION)
+
+
+def cache_key(text, namespace):
+    raw = f"{namespace}\x00{normalize_text(text)}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class LRUTier:
+    def __init__(self, max_entries=10000, ttl_seconds=86400.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at=None):
+        with self._lock:
+            self._entries[key] = (expires_at or time.time() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteTier:
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=100000, ttl_seconds=7 * 86400.0, evict_every=500):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.evict_every = evict_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS nlu_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_nlu_cache_accessed_at ON nlu_cache (accessed_at)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM nlu_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at < now:
+                self._conn.execute("DELETE FROM nlu_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE nlu_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(value), expires_at
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO nlu_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + self.ttl_seconds, now),
+            )
+            self._writes += 1
+            if self._writes % self.evict_every == 0:
+                self._evict(now)
+
+    def set_many(self, items):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO nlu_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                [(key, json.dumps(value), now + self.ttl_seconds, now) for key, value in items],
+            )
+            self._conn.execute("COMMIT")
+            self._evict(now)
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM nlu_cache WHERE expires_at < ?", (now,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM nlu_cache").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM nlu_cache WHERE key IN (SELECT key FROM nlu_cache ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class NLUCache:
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls):
+        ttl = float(os.getenv("NLU_CACHE_TTL_SECONDS", str(7 * 86400)))
+        memory = LRUTier(max_entries=int(os.getenv("NLU_CACHE_MEMORY_ENTRIES", "10000")), ttl_seconds=ttl)
+        disk = None
+        path = os.getenv("NLU_CACHE_PATH", DEFAULT_CACHE_PATH)
+        if path:
+            disk = SQLiteTier(path, max_entries=int(os.getenv("NLU_CACHE_DISK_ENTRIES", "100000")), ttl_seconds=ttl)
+        return cls(memory, disk)
+
+    def get(self, text, namespace):
+        key = cache_key(text, namespace)
+        value = self.memory.get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+        if self.disk is not None:
+            found = self.disk.get(key)
+            if found is not None:
+                value, expires_at = found
+                self.memory.set(key, value, expires_at)
+                self.disk_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def set(self, text, namespace, value):
+        key = cache_key(text, namespace)
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def set_many(self, items, namespace):
+        keyed = [(cache_key(text, namespace), value) for text, value in items]
+        for key, value in keyed:
+            self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set_many(keyed)
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        hits = self.memory_hits + self.disk_hits
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_nlu_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = NLUCache.from_env()
+    return _cache
+
+
+# -- warm-up -----------------------------------------------------------------
+
+# [value](entity), [value]{"entity": "..."} and [value]{"entity": "...", "value": "..."}
+_ANNOTATION = re.compile(r"\[(?P<text>[^\]]+)\](?:\((?P<entity>[^)]+)\)|(?P<json>\{[^}]*\}))")
+
+
+def parse_example(example):
+    """Turn an annotated training example into (plain text, entities)."""
+    entities = []
+
+    def replace(match):
+        text = match.group("text")
+        if match.group("entity"):
+            entities.append({"entity": match.group("entity"), "value": text})
+        else:
+            meta = json.loads(match.group("json"))
+            entities.append({"entity": meta["entity"], "value": meta.get("value", text)})
+        return text
+
+    return _ANNOTATION.sub(replace, example), entities
+
+
+def training_examples(nlu_path):
+    import yaml
+
+    with open(nlu_path, encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+    for block in data.get("nlu", []):
+        intent = block.get("intent")
+        if not intent:
+            continue
+        for line in (block.get("examples") or "").splitlines():
+            line = line.strip()
+            if not line.startswith("- "):
+                continue
+            text, entities = parse_example(line[2:].strip())
+            # Bare placeholders such as "[property_name]" carry no utterance.
+            if text and not re.fullmatch(r"\[[^\]]+\]", text):
+                yield text, {"intent": intent, "entities": entities}
+
+
+def warm(nlu_path, namespace, cache=None):
+    cache = cache or get_nlu_cache()
+    items = list(training_examples(nlu_path))
+    cache.set_many(items, namespace)
+    return len(items)
+
+
+COMPONENT_NAME = "LLMIntentEntityGraphComponent"
+
+
+def component_settings(config_path="config.yml"):
+    """`(backend, backend_settings)` of the LLM NLU component in config.yml."""
+    import yaml
+
+    try:
+        with open(config_path, encoding="utf-8") as f:
+            config = yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError) as e:
+        logger.warning("Could not read %s: %s", config_path, e)
+        return None, {}
+    for step in config.get("pipeline") or []:
+        if str(step.get("name", "")).rsplit(".", 1)[-1] == COMPONENT_NAME:
+            return step.get("backend"), dict(step.get("backend_settings") or {})
+    return None, {}
+
+
+def namespace_for(model):
+    from custom_components.llm_nlu_prompt import PROMPT_VERSION
+
+    return f"{model}:{PROMPT_VERSION}"
+
+
+def default_namespace(model=None, config_path="config.yml"):
+    """The namespace the NLU component reads: its backend's model and the prompt version.
+
+    Without an explicit `model`, the backend and its settings are resolved the
+    way the component resolves them (config.yml, then endpoints.yml and the
+    environment).
+    """
+    if model is None:
+        from actions.llm_client import backend_model
+
+        backend, settings = component_settings(config_path)
+        model = backend_model(backend, **settings)
+    return namespace_for(model)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the LLM NLU result cache.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    warm_parser = sub.add_parser("warm", help="Pre-populate the cache from annotated NLU training data.")
+    warm_parser.add_argument("nlu_path", nargs="?", default=os.path.join("data", "nlu.yml"))
+    warm_parser.add_argument("--model", default=None, help="Model name the cached results are keyed under.")
+    warm_parser.add_argument("--config", default="config.yml", help="Rasa config whose NLU backend settings apply.")
+    args = parser.parse_args()
+    if args.command == "warm":
+        count = warm(args.nlu_path, default_namespace(args.model, args.config))
+        print(f"Cached {count} examples from {args.nlu_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 import os
-import requests
-import json
+
+from actions.filter_compiler import UnsafeFilterError, cached_filter, compile_and_cache, compile_filter
+from actions.llm_client import get_llm_client
+from actions.schema import get_schema
 
 # Mock MongoDB data (for demo)
 brokers = [
@@ -10,21 +12,7 @@ brokers = [
 ]
 
 def call_llama3_together(prompt, api_key):
-    url = "https://api.together.xyz/v1/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": "meta-llama/Llama-3-8b-chat-hf",
-        "prompt": prompt,
-        "max_tokens": 200,
-        "temperature": 0.0,
-        "top_p": 0.7
-    }
-    response = requests.post(url, headers=headers, json=data)
-    response.raise_for_status()
-    return response.json()["choices"][0]["text"].strip()
+    return get_llm_client(api_key).complete(prompt, max_tokens=200, temperature=0.0, top_p=0.7)
 
 if __name__ == "__main__":
     api_key = os.getenv("TOGETHER_API_KEY")
@@ -33,25 +21,26 @@ if __name__ == "__main__":
     # 1. LLM generates MongoDB query
     prompt_query = f"""
 Given the user question and the following MongoDB collection schema:
-Collection: brokers(name, city, phone)
-Write a MongoDB filter (as a Python dict) to answer the question.
+Collection: {get_schema()["brokers"].signature("filter")}
+Write a MongoDB filter (as a JSON object) to answer the question.
 User question: {user_message}
 Filter:
 """
-    llm_query = call_llama3_together(prompt_query, api_key)
-    print("[LLM] Generated MongoDB filter:", llm_query)
+    # Repeated question shapes reuse the compiled plan and skip this LLM call.
+    mongo_filter, template, bindings = cached_filter("brokers", user_message, ["Mumbai"])
     try:
-        mongo_filter = json.loads(llm_query)
-        # Validate fields
-        allowed_fields = {"city", "name"}
-        if not isinstance(mongo_filter, dict) or not set(mongo_filter.keys()).issubset(allowed_fields):
-            raise ValueError("Unsafe query fields")
-    except Exception as e:
+        if mongo_filter is None:
+            llm_query = call_llama3_together(prompt_query, api_key)
+            print("[LLM] Generated MongoDB filter:", llm_query)
+            mongo_filter = compile_and_cache("brokers", template, bindings, llm_query)
+    except UnsafeFilterError as e:
         print("[ERROR] Could not parse or validate LLM output:", e)
         mongo_filter = {}
+    print("[Compiler] Native MongoDB filter:", mongo_filter)
 
     # 2. Execute query (mocked)
-    results = [b for b in brokers if all(str(b.get(k, "")).lower() == str(v).lower() for k, v in mongo_filter.items())]
+    tree = compile_filter("brokers", mongo_filter)
+    results = [b for b in brokers if tree.matches(b, {})]
     print("[MongoDB] Query results:", results)
 
     # 3. LLM summarizes result
@@ -1,31 +1,25 @@
-import requests
 import json
+import logging
+
+from actions.llm_client import get_llm_client
+from custom_components.llm_nlu_prompt import extraction_prompt
+from custom_components.nlu_cache import get_nlu_cache, namespace_for
+
+logger = logging.getLogger(__name__)
 
 def extract_intent_entities_llm(user_message, api_key):
-    prompt = (
-        "Extract the intent and entities from the following user message. "
-        "Return as JSON: {\"intent\": \"...\", \"entities\": [{\"entity\": \"...\", \"value\": \"...\"}]}\n"
-        f"Message: \"{user_message}\""
-    )
-    url = "https://api.together.xyz/v1/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": "meta-llama/Llama-3-8b-chat-hf",
-        "prompt": prompt,
-        "max_tokens": 200,
-        "temperature": 0.0,
-        "top_p": 0.7
-    }
-    response = requests.post(url, headers=headers, json=data)
-    response.raise_for_status()
-    text = response.json()["choices"][0]["text"].strip()
+    client = get_llm_client(api_key)
+    cache = get_nlu_cache()
+    namespace = namespace_for(client.model)
+    cached = cache.get(user_message, namespace)
+    if cached is not None:
+        return cached
+    text = client.complete(extraction_prompt(user_message), max_tokens=200, temperature=0.0, top_p=0.7)
     try:
         result = json.loads(text)
+        cache.set(user_message, namespace, result)
     except Exception as e:
-        print("[DEBUG] LLM NLU parse error:", e)
+        logger.warning("LLM NLU parse error: %s", e)
         result = {"intent": "search_database", "entities": []}
     return result
 
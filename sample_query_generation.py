@@ -1,4 +1,5 @@
 # sample_query_generation.py
+from actions.schema import get_schema
 
 def build_or_query(fields, value):
     return {"$or": [{field: {"$regex": value, "$options": "i"}} for field in fields]}
@@ -14,10 +15,11 @@ user_query_project = "lush valley residences"
 user_query_property = "BLOCK B Floor 4 Shop 179"
 user_query_broker = "Horizon Group"
 
-# Fields for each collection
-proj_fields = ["name", "address", "category", "city", "projectStatus"]
-prop_fields = ["name", "address", "category", "city", "blockName", "series", "projectStatus"]
-brok_fields = ["name", "address", "city", "company"]
+# Fields for each collection, from the schema registry
+search_fields = get_schema().fields("search")
+proj_fields = search_fields["projects"]
+prop_fields = search_fields["properties"]
+brok_fields = search_fields["brokers"]
 
 # Print sample queries
 print_mongo_query("projects", proj_fields, user_query_project)
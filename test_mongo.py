@@ -1,11 +1,10 @@
-import os
-from pymongo import MongoClient
+from actions.mongo import get_db, ping, pool_metrics
 
-uri = os.getenv("MONGODB_URI")
-client = MongoClient(uri)
 try:
-    db = client["homelead"]
+    db = get_db()
     print(db.list_collection_names())
-    print("Connection successful!")
+    rtt = ping()
+    print("Connection successful!" if rtt is not None else "Connection failed: ping did not succeed")
+    print("Pool metrics:", pool_metrics.snapshot())
 except Exception as e:
     print("Connection failed:", e)
\ No newline at end of file
@@ -0,0 +1,65 @@
+from actions.analytics import compile_analytics, detect_metric, detect_operation
+
+MALL = [{"entity": "property_name", "value": "mall of jaipur"}]
+
+
+def test_collection_counts_are_aggregates():
+    query = compile_analytics("How many brokers are there?", [])
+    assert (query.collection, query.operation, query.match) == ("brokers", "count", {})
+    assert compile_analytics("Total number of projects", []).operation == "count"
+
+
+def test_aggregate_keeps_filters():
+    query = compile_analytics(
+        "average minBudget for commercial properties in BLOCK B", [{"entity": "blockName", "value": "BLOCK B"}]
+    )
+    assert (query.operation, query.field) == ("avg", "minBudget")
+    assert query.match == {"blockName": "BLOCK B", "propertyType": "Commercial"}
+
+
+def test_named_document_is_not_an_aggregate():
+    assert compile_analytics("How many bedrooms does mall of jaipur have?", MALL) is None
+    assert compile_analytics("What is the minimum budget of mall of jaipur?", MALL) is None
+    assert compile_analytics(
+        "How many parking lots does the property BLOCK B Floor 4 Shop 179 have",
+        [{"entity": "property_name", "value": "BLOCK B Floor 4 Shop 179"}],
+    ) is None
+
+
+def test_gazetteer_name_is_not_an_aggregate():
+    recognised = {"properties": {"name": ["mall of jaipur"]}}
+    assert compile_analytics("minimum budget of the property mall of jaipur", [], recognised) is None
+
+
+def test_attribute_counts_are_not_aggregates():
+    assert compile_analytics("how many bedrooms does it have", []) is None
+    assert compile_analytics("how many bedrooms do the properties in BLOCK B have", []) is None
+
+
+def test_identifier_numbers_are_not_counts():
+    assert detect_operation("What is the phone number of Horizon Group?") is None
+    assert detect_operation("number of the brokers in Mumbai") == "count"
+    assert detect_operation("country of the broker") is None
+
+
+def test_metric_synonyms():
+    query = compile_analytics("max commission of brokers in Mumbai", [{"entity": "city", "value": "Mumbai"}])
+    assert (query.operation, query.field, query.match) == ("max", "commissionPercent", {"city": "Mumbai"})
+    assert detect_metric("properties", "average price of residential properties") == "minBudget"
+    assert detect_metric("properties", "total carpet area of properties") == "carpetArea"
+    assert detect_metric("properties", "average super built up area of properties") == "superBuiltUpArea"
+    assert detect_metric("properties", "average bedrooms per property") == "noOfBedRooms"
+    assert detect_metric("projects", "highest maxBudget of projects") == "maxBudget"
+    assert detect_metric("brokers", "average price of brokers") is None
+
+
+def test_recognised_values_filter_the_aggregate():
+    recognised = {"brokers": {"city": ["Mumbai"]}, "properties": {"city": ["Mumbai"]}}
+    query = compile_analytics("how many brokers are there in Mumbai", [], recognised)
+    assert (query.operation, query.match) == ("count", {"city": "Mumbai"})
+    recognised = {"projects": {"projectStatus": ["Ongoing", "Completed"], "city": ["Pune"]}}
+    query = compile_analytics("average budget of ongoing or completed projects", [{"entity": "city", "value": "Jaipur"}], recognised)
+    assert query.match == {"city": "Jaipur", "projectStatus": {"$in": ["Ongoing", "Completed"]}}
+    recognised = {"properties": {"category": ["Commercial"], "blockName": ["BLOCK B"]}}
+    query = compile_analytics("average minBudget for commercial properties in BLOCK B", [], recognised)
+    assert query.match == {"blockName": "BLOCK B", "propertyType": "Commercial"}
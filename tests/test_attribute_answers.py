@@ -0,0 +1,57 @@
+import datetime
+
+from actions.analytics import detect_metric
+from actions.attribute_answers import AnswerMetrics, detect_attribute, format_value
+from actions.schema import get_schema
+
+
+def test_detects_the_one_attribute_asked_for():
+    assert detect_attribute("brokers", "What is the phone number of Asha?") == "phone"
+    assert detect_attribute("projects", "rera registration number of Green Valley") == "reraRegistrationNumber"
+    assert detect_attribute("properties", "how many bedrooms does it have") == "noOfBedRooms"
+
+
+def test_open_ended_or_several_attributes_go_to_the_llm():
+    assert detect_attribute("brokers", "phone and email of Asha") is None
+    assert detect_attribute("properties", "why is the carpet area so small") is None
+    assert detect_attribute("brokers", "tell me about Asha") is None
+
+
+def test_names_do_not_ask_for_attributes():
+    entities = [{"entity": "project_name", "value": "Lake View Address"}]
+    assert detect_attribute("projects", "status of Lake View Address", entities) == "projectStatus"
+    assert detect_attribute("projects", "Lake View Address", subject="Lake View Address") is None
+
+
+def test_attribute_entity():
+    assert detect_attribute("brokers", "tell me", [{"entity": "attribute", "value": "mobile"}]) == "phone"
+    assert detect_attribute("brokers", "tell me", [{"entity": "attribute", "value": "facing"}]) is None
+
+
+def test_format_value():
+    assert format_value("brokers", {"commissionPercent": 2.0}, "commissionPercent") == "2%"
+    assert format_value("properties", {"carpetArea": 1200, "carpetAreaType": "sqft"}, "carpetArea") == "1200 sqft"
+    assert format_value("properties", {"minBudget": 4500000.0}, "minBudget") == "4,500,000"
+    assert format_value("properties", {"vastuCompliant": False}, "vastuCompliant") == "no"
+    assert format_value("projects", {"startDate": datetime.datetime(2024, 3, 1)}, "startDate") == "01 March 2024"
+    assert format_value("brokers", {"phone": ""}, "phone") is None
+
+
+def test_analytics_and_attributes_read_one_phrase_table():
+    assert detect_attribute("properties", "how many bhk is it") == "noOfBedRooms"
+    assert detect_metric("properties", "average bhk of properties") == "noOfBedRooms"
+    assert detect_attribute("brokers", "commission rate of Asha") == detect_metric("brokers", "max commission rate")
+    assert get_schema()["brokers"]["commissionPercent"].label == "commission"
+
+
+def test_answer_metrics(caplog):
+    caplog.set_level("INFO", logger="actions.attribute_answers")
+    metrics = AnswerMetrics(report_every=4)
+    for outcome, seconds in (("template", 0.001), ("cache", 0.003), ("generated", 0.5), ("template", 0.003)):
+        metrics.record(outcome, seconds)
+    snapshot = metrics.snapshot()
+    assert snapshot["answers"] == 4
+    assert snapshot["outcomes"] == {"template": 2, "cache": 1, "generated": 1}
+    assert snapshot["without_generation_ratio"] == 0.75
+    assert round(snapshot["avg_ms"]["template"], 3) == 2.0
+    assert "75.0% of 4 document turns" in caplog.text
@@ -0,0 +1,40 @@
+import mongomock
+from pymongo.errors import PyMongoError
+
+from actions.catalog import CatalogCache
+
+
+class FailingDB:
+    def __init__(self):
+        self.calls = 0
+
+    def __getitem__(self, name):
+        self.calls += 1
+        raise PyMongoError("unreachable")
+
+
+def test_failed_load_is_not_retried_on_every_read():
+    db = FailingDB()
+    catalog = CatalogCache(db_factory=lambda: db, collections=("brokers",), ttl_seconds=3600)
+    assert catalog.documents("brokers") == ()
+    assert catalog.documents("brokers") == ()
+    assert db.calls == 1
+
+
+def test_failed_load_is_retried_after_ttl():
+    db = FailingDB()
+    catalog = CatalogCache(db_factory=lambda: db, collections=("brokers",), ttl_seconds=0)
+    catalog.documents("brokers")
+    catalog.documents("brokers")
+    assert db.calls == 2
+
+
+def test_max_documents_is_a_hard_cap_without_eviction():
+    db = mongomock.MongoClient()["catalog"]
+    db.brokers.insert_many([{"_id": i, "name": f"broker {i}"} for i in range(3)])
+    catalog = CatalogCache(db_factory=lambda: db, collections=("brokers",), max_documents=2)
+    assert catalog.reload("brokers")
+    assert [doc["_id"] for doc in catalog.documents("brokers")] == [0, 1]
+    catalog.upsert("brokers", {"_id": 9, "name": "new"})
+    catalog.upsert("brokers", {"_id": 0, "name": "renamed"})
+    assert [doc["name"] for doc in catalog.documents("brokers")] == ["renamed", "broker 1"]
@@ -0,0 +1,13 @@
+from actions.actions import display_name
+
+
+def test_property_parts_are_not_labelled_twice():
+    doc = {"propertyType": "Residential", "blockName": "BLOCK B", "floorName": "Floor 4", "shopNo": 179}
+    assert display_name("properties", doc) == "Residential BLOCK B Floor 4 Shop 179"
+    assert display_name("properties", {"blockName": "B", "floorName": "4"}) == "Block B Floor 4"
+
+
+def test_empty_parts_are_skipped():
+    assert display_name("properties", {"blockName": "B", "floorName": "", "shopNo": None}) == "Block B"
+    assert display_name("properties", {"_id": 7}) == "7"
+    assert display_name("brokers", {"name": "Asha"}) == "Asha"
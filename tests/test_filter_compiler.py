@@ -0,0 +1,44 @@
+import pytest
+
+from actions.filter_compiler import (
+    CompiledPlan, Condition, Param, UnsafeFilterError, compile_filter, parameterize, templatize,
+)
+
+
+def test_compile_filter_accepts_whitelisted_fields():
+    tree = compile_filter("brokers", '{"city": "Mumbai", "commissionPercent": {"$gte": "1.5"}}')
+    assert tree.to_mongo({}) == {"city": "Mumbai", "commissionPercent": {"$gte": 1.5}}
+
+
+@pytest.mark.parametrize("raw", [
+    {"$where": "sleep(1000)"},
+    {"city": {"$regex": ".*"}},
+    {"password": "x"},
+    {"city": {"$in": "Mumbai"}},
+    {"commissionPercent": "a lot"},
+    {"$or": []},
+    "no filter here",
+])
+def test_compile_filter_rejects_unsafe_filters(raw):
+    with pytest.raises(UnsafeFilterError):
+        compile_filter("brokers", raw)
+
+
+def test_templatize_replaces_values_and_numbers():
+    template, bindings = templatize("Brokers in  Mumbai with 2 percent?", ["Mumbai"])
+    assert template == "brokers in {v0} with {v1} percent"
+    assert bindings == {"v0": "Mumbai", "v1": 2}
+
+
+def test_parameterize_and_bind():
+    template, bindings = templatize("brokers in Pune", ["Pune"])
+    plan = CompiledPlan("brokers", parameterize(compile_filter("brokers", {"city": "pune"}), bindings))
+    assert plan.params == {"v0"}
+    assert plan.bind({"v0": "Delhi"}) == {"city": "Delhi"}
+    assert plan.bind({}) is None
+
+
+def test_bind_checks_value_types():
+    plan = CompiledPlan("brokers", Condition("commissionPercent", "$gte", Param("v0")))
+    assert plan.bind({"v0": "2.5"}) == {"commissionPercent": {"$gte": 2.5}}
+    assert plan.bind({"v0": "Mumbai"}) is None
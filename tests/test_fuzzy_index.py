@@ -0,0 +1,17 @@
+from actions.fuzzy_index import FuzzyIndex
+
+DOCS = [{"name": "Lush Valley Residences"}, {"name": "Ganga View Towers"}, {"name": "Horizon Heights"}]
+
+
+def test_scored_candidates_rank_by_trigram_overlap():
+    index = FuzzyIndex(DOCS, ["name"])
+    (score, doc_id), = index.scored_candidates("lush valey", 1)
+    assert index.docs[doc_id]["name"] == "Lush Valley Residences"
+    assert score == index.dice("lush valey", doc_id)
+
+
+def test_dice_of_unrelated_text_is_low():
+    index = FuzzyIndex(DOCS, ["name"])
+    assert index.dice("ganga view towers", 1) > 0.9
+    assert index.dice("ganga view towers", 0) < 0.2
+    assert index.dice("", 0) == 0.0
@@ -0,0 +1,30 @@
+from actions.gazetteer import Automaton, Gazetteer, normalize
+
+
+def test_automaton_finds_overlapping_patterns():
+    automaton = Automaton(["he", "she", "his", "hers"])
+    found = sorted((end, automaton.patterns[index]) for end, index in automaton.iter("ushers"))
+    assert found == [(4, "he"), (4, "she"), (6, "hers")]
+
+
+def test_normalize():
+    assert normalize("  Mall-of  JAIPUR! ") == "mall of jaipur"
+
+
+def test_scan_is_leftmost_longest_whole_word():
+    gazetteer = Gazetteer(
+        {"projects": [{"name": "Green Valley"}, {"name": "Green Valley Phase 2"}], "brokers": [{"city": "Pune"}]},
+        fields={"projects": ("name",), "brokers": ("city",)},
+    )
+    matches = gazetteer.scan("Is Green Valley Phase 2 in PUNE or Punegaon?")
+    assert [m.text for m in matches] == ["green valley phase 2", "pune"]
+
+
+def test_extract_keeps_stored_values():
+    gazetteer = Gazetteer(
+        {"properties": [{"city": "Jaipur", "blockName": "A"}], "brokers": [{"city": "Jaipur"}]},
+        fields={"properties": ("city", "blockName"), "brokers": ("city",)},
+    )
+    assert gazetteer.extract("brokers in jaipur, block a") == {
+        "properties": {"city": ["Jaipur"]}, "brokers": {"city": ["Jaipur"]},
+    }
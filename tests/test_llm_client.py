@@ -0,0 +1,172 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import aiohttp
+import pytest
+
+from actions import llm_client
+from actions.llm_client import (
+    CircuitBreaker, CircuitOpenError, LLMClient, LLMError, UnavailableBackend, get_llm_client,
+)
+
+
+def test_backend_that_fails_to_load_is_cached_as_unavailable(monkeypatch):
+    calls = []
+
+    def broken(api_key, settings):
+        calls.append(settings)
+        raise LLMError("GGUF model not found")
+
+    monkeypatch.setitem(llm_client.BACKENDS, "broken", broken)
+    monkeypatch.setattr(llm_client, "_clients", {})
+    client = get_llm_client("key", "broken")
+    assert isinstance(client, UnavailableBackend)
+    assert not client.ready
+    assert get_llm_client("key", "broken") is client
+    assert len(calls) == 1
+    with pytest.raises(LLMError):
+        client.complete("prompt")
+    assert isinstance(client.complete_many(["a", "b"])[1], LLMError)
+
+
+def test_unknown_backend_is_unavailable(monkeypatch):
+    monkeypatch.setattr(llm_client, "_clients", {})
+    assert not get_llm_client("key", "no-such-backend").ready
+
+
+class FakeResponse:
+    def __init__(self, status, text="ok", headers=None):
+        self.status = status
+        self.headers = headers or {}
+        self._text = text
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            request_info = SimpleNamespace(real_url="https://llm.test/v1/completions")
+            raise aiohttp.ClientResponseError(request_info, (), status=self.status)
+
+    async def json(self):
+        return {"choices": [{"text": self._text}]}
+
+
+class FakeSession:
+    """Answers posts with `statuses` in order; None hangs until cancelled."""
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.posts = 0
+
+    def post(self, url, json, timeout):
+        self.posts += 1
+        status = self.statuses.pop(0)
+        if status is None:
+            return Hang()
+        return FakeResponse(status)
+
+
+class Hang(FakeResponse):
+    def __init__(self):
+        super().__init__(200)
+
+    async def __aenter__(self):
+        await asyncio.Event().wait()
+
+
+def make_client(session, **settings):
+    client = LLMClient(api_key="key", backoff_base=0.0, breaker=CircuitBreaker(failure_threshold=2), **settings)
+
+    def get_session():
+        client._semaphore = asyncio.Semaphore(client.max_concurrency)
+        return session
+
+    client._get_session = get_session
+    return client
+
+
+def test_retryable_statuses_are_retried():
+    session = FakeSession(503, 429, 200)
+    client = make_client(session)
+    assert client.complete("prompt") == "ok"
+    assert session.posts == 3
+    assert client.breaker.state == "closed"
+
+
+def test_retries_are_bounded_and_open_the_breaker():
+    session = FakeSession(503, 503, 503, 503, 400)
+    client = make_client(session, max_retries=3)
+    with pytest.raises(LLMError):
+        client.complete("prompt")
+    assert session.posts == 4
+    with pytest.raises(LLMError):
+        client.complete("prompt")
+    assert client.breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        client.complete("prompt")
+    assert session.posts == 5
+
+
+def test_backoff_honours_retry_after_and_caps_jitter():
+    client = LLMClient(api_key="key", backoff_base=1.0, backoff_max=4.0)
+    assert client._backoff(0, retry_after="2") == 2.0
+    assert client._backoff(0, retry_after="120") == 4.0
+    assert all(0 <= client._backoff(attempt) <= min(4.0, 2 ** attempt) for attempt in range(6))
+
+
+def test_breaker_transitions():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    breaker.opened_at -= 30
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()  # one trial at a time
+    breaker.record_failure()
+    assert breaker.state == "open"
+    breaker.opened_at -= 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_cancelled_trial_frees_the_breaker():
+    session = FakeSession(None, 200)
+    client = make_client(session)
+    client.breaker.record_failure()
+    client.breaker.record_failure()
+    client.breaker.opened_at -= client.breaker.reset_timeout
+
+    async def timed_out_call():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(client.acomplete("prompt"), timeout=0.05)
+
+    asyncio.run(timed_out_call())
+    # The cancellation reaches the client loop asynchronously.
+    deadline = time.monotonic() + 2
+    while client.breaker._trial_in_flight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert client.complete("prompt") == "ok"
+    assert client.breaker.state == "closed"
+
+
+def test_incomplete_backend_fails_at_construction():
+    class NoStreaming(llm_client.GenerationBackend):
+        async def acomplete(self, prompt, **params):
+            return ""
+
+        def complete(self, prompt, **params):
+            return ""
+
+        def complete_many(self, prompts, **params):
+            return []
+
+    with pytest.raises(TypeError):
+        NoStreaming()
@@ -0,0 +1,23 @@
+from types import SimpleNamespace
+
+from actions.mongo import PoolMetrics
+
+
+def test_only_slow_checkouts_count_as_contended():
+    metrics = PoolMetrics(contended_ms=5)
+    for seconds in (0.0001, 0.0002, 0.020):
+        metrics.connection_check_out_started(SimpleNamespace())
+        metrics.connection_checked_out(SimpleNamespace(duration=seconds))
+    snapshot = metrics.snapshot()
+    assert snapshot["checkouts"] == 3
+    assert snapshot["contended_checkouts"] == 1
+    assert snapshot["checkout_wait_ms"]["count"] == 3
+    assert snapshot["checkout_wait_ms"]["max"] == 20.0
+    assert snapshot["waiting"] == 0
+
+
+def test_drivers_without_duration_report_no_waits():
+    metrics = PoolMetrics()
+    metrics.connection_check_out_started(SimpleNamespace())
+    metrics.connection_checked_out(SimpleNamespace())
+    assert metrics.snapshot()["checkout_wait_ms"]["count"] == 0
@@ -0,0 +1,48 @@
+import pytest
+
+from custom_components.llm_nlu_prompt import PROMPT_VERSION
+from custom_components.nlu_cache import cache_key, default_namespace, normalize_text, parse_example
+
+
+@pytest.fixture
+def isolated(monkeypatch, tmp_path):
+    for name in ("LLM_BACKEND", "LLM_MODEL", "LLAMA_MODEL_PATH"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("LLM_ENDPOINTS_FILE", str(tmp_path / "missing.yml"))
+    return tmp_path
+
+
+def test_normalize_text():
+    assert normalize_text("  Tell me about   LUSH Valley?! ") == "tell me about lush valley"
+    assert cache_key("Show more!", "m:v") == cache_key("show more", "m:v")
+
+
+def test_parse_example():
+    text, entities = parse_example("Tell me about [Lush Valley](project_name) in [Pune]{\"entity\": \"city\"}")
+    assert text == "Tell me about Lush Valley in Pune"
+    assert entities == [{"entity": "project_name", "value": "Lush Valley"}, {"entity": "city", "value": "Pune"}]
+
+
+def test_namespace_follows_component_backend(isolated):
+    config = isolated / "config.yml"
+    config.write_text(
+        "pipeline:\n"
+        "  - name: custom_components.llm_nlu_graph_component.LLMIntentEntityGraphComponent\n"
+        "    backend: llama_cpp\n"
+        "    backend_settings:\n"
+        "      model_path: /models/llama-3-8b-instruct.Q4_K_M.gguf\n"
+    )
+    assert default_namespace(config_path=str(config)) == f"llama-3-8b-instruct.Q4_K_M.gguf:{PROMPT_VERSION}"
+
+
+def test_namespace_follows_component_model_override(isolated):
+    config = isolated / "config.yml"
+    config.write_text(
+        "pipeline:\n"
+        "  - name: LLMIntentEntityGraphComponent\n"
+        "    backend: together\n"
+        "    backend_settings:\n"
+        "      model: meta-llama/Llama-3-70b-chat-hf\n"
+    )
+    assert default_namespace(config_path=str(config)) == f"meta-llama/Llama-3-70b-chat-hf:{PROMPT_VERSION}"
+    assert default_namespace("explicit", str(config)) == f"explicit:{PROMPT_VERSION}"
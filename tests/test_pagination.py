@@ -0,0 +1,37 @@
+import base64
+
+from bson import ObjectId, json_util
+
+from actions.pagination import Page, decode_token, is_show_more
+
+
+def token(state):
+    return base64.urlsafe_b64encode(json_util.dumps(state).encode("utf-8")).decode("ascii")
+
+
+def test_resume_token_round_trip():
+    last = ObjectId()
+    query = {"city": "Mumbai", "company": {"$in": ["Horizon Group", "Royal Realty"]}}
+    page = Page("brokers", query, [{"_id": ObjectId()}, {"_id": last}], 40, True)
+    assert decode_token(page.resume_token()) == ("brokers", query, last, 40)
+
+
+def test_last_page_has_no_token():
+    assert Page("brokers", {}, [{"_id": ObjectId()}], 1, False).resume_token() is None
+
+
+def test_tampered_tokens_are_rejected():
+    after = ObjectId()
+    assert decode_token("not a token") is None
+    assert decode_token(token({"c": "users", "q": {}, "a": after, "n": 0})) is None
+    assert decode_token(token({"c": "brokers", "q": {"$where": "sleep(1000)"}, "a": after, "n": 0})) is None
+    assert decode_token(token({"c": "brokers", "q": {"phone": "9000000000"}, "a": after, "n": 0})) is None
+    assert decode_token(token({"c": "brokers", "q": {"city": {"$ne": None}}, "a": after, "n": 0})) is None
+    assert decode_token(token({"c": "brokers", "q": {"city": {"$in": [{"$gt": ""}]}}, "a": after, "n": 0})) is None
+    assert decode_token(token({"c": "brokers", "q": {}, "a": {"$gt": ""}, "n": 0})) is None
+
+
+def test_show_more():
+    assert is_show_more("Show more")
+    assert is_show_more("next page please")
+    assert not is_show_more("tell me more about lush valley")
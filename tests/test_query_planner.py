@@ -0,0 +1,36 @@
+from actions.query_planner import parse_amount, plan_query, structured_filter, target_collections
+
+
+def test_parse_amount_units():
+    assert parse_amount("1.2 crore") == 12000000
+    assert parse_amount("50 lakh") == 5000000
+    assert parse_amount("1,500,000") == 1500000
+    assert parse_amount("2.5 million") == 2500000
+    assert parse_amount(750000) == 750000
+    assert parse_amount("no budget") is None
+
+
+def test_property_name_splits_into_indexed_parts():
+    entities = [{"entity": "property_name", "value": "BLOCK B Floor 4 Shop 179"}]
+    assert structured_filter("properties", entities) == {
+        "blockName": "BLOCK B", "floorName": "Floor 4", "shopNo": 179,
+    }
+
+
+def test_budgets_become_ranges():
+    entities = [{"entity": "budget", "value": "1 crore"}, {"entity": "min_budget", "value": "50 lakh"}]
+    assert structured_filter("projects", entities) == {
+        "minBudget": {"$lte": 10000000}, "maxBudget": {"$gte": 5000000},
+    }
+    assert structured_filter("brokers", entities) == {}
+
+
+def test_empty_and_unknown_entities_are_ignored():
+    entities = [{"entity": "city", "value": ""}, {"entity": "mood", "value": "happy"}]
+    assert structured_filter("brokers", entities) == {}
+    assert plan_query("brokers", entities) is None
+
+
+def test_target_collections():
+    assert target_collections([{"entity": "broker_name", "value": "Asha"}]) == ["brokers"]
+    assert target_collections([], "list the projects and brokers") == ["projects", "brokers"]
@@ -0,0 +1,39 @@
+import mongomock
+
+from actions.catalog import CatalogCache
+from actions.response_cache import ResponseCache
+
+DOC = {"_id": 1, "name": "Horizon Group", "city": "Mumbai", "phone": "+91 9213434545"}
+
+
+def make_catalog():
+    db = mongomock.MongoClient()["catalog"]
+    db.brokers.insert_one(dict(DOC))
+    catalog = CatalogCache(db_factory=lambda: db, collections=("brokers",))
+    catalog.reload("brokers")
+    return catalog
+
+
+def test_catalog_update_drops_cached_answers():
+    catalog = make_catalog()
+    cache = ResponseCache().attach(catalog)
+    doc = catalog.get("brokers", 1)
+    cache.set("brokers", doc, "What is the phone number of Horizon Group?", "+91 9213434545")
+    assert cache.get("brokers", doc, "what's the phone number of horizon group") == "+91 9213434545"
+    version = catalog.version("brokers")
+    catalog.upsert("brokers", {**DOC, "phone": "+91 9000000000"})
+    assert catalog.version("brokers") > version
+    # Gone even for a caller still holding the old document.
+    assert cache.get("brokers", doc, "What is the phone number of Horizon Group?") is None
+    assert cache.get("brokers", catalog.get("brokers", 1), "What is the phone number of Horizon Group?") is None
+
+
+def test_other_documents_keep_their_answers():
+    catalog = make_catalog()
+    cache = ResponseCache().attach(catalog)
+    other = {"_id": 2, "name": "Prime Investments", "city": "Delhi"}
+    cache.set("brokers", other, "which city is it in", "Delhi")
+    catalog.upsert("brokers", {**DOC, "phone": "+91 9000000000"})
+    assert cache.get("brokers", other, "which city is it in") == "Delhi"
+    catalog.reload("brokers")
+    assert cache.get("brokers", other, "which city is it in") is None
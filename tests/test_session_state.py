@@ -0,0 +1,35 @@
+from actions.session_state import SessionStore, is_follow_up
+
+
+def test_is_follow_up():
+    assert is_follow_up("what about its budget?")
+    assert is_follow_up("Is it furnished")
+    assert is_follow_up("their phone number")
+    assert not is_follow_up("budget of mall of jaipur")
+    assert not is_follow_up("list items in the city")
+
+
+def test_memory_store_expires_and_evicts():
+    store = SessionStore(path="", max_sessions=2, ttl_seconds=60)
+    store.set("a", {"doc": 1})
+    store.set("b", {"doc": 2})
+    assert store.get("a") == {"doc": 1}
+    store.set("c", {"doc": 3})
+    assert store.get("b") is None  # least recently used
+    store.ttl_seconds = -1
+    store.set("a", {"doc": 4})
+    assert store.get("a") is None
+
+
+def test_sqlite_store_survives_restart(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = SessionStore(path=path, flush_seconds=3600)
+    store.set("a", {"doc": 1})
+    store.close()
+    restarted = SessionStore(path=path, flush_seconds=3600)
+    try:
+        assert restarted.get("a") == {"doc": 1}
+        restarted.clear("a")
+        assert restarted.get("a") is None
+    finally:
+        restarted.close()
@@ -0,0 +1,55 @@
+import mongomock
+import numpy as np
+
+from actions.catalog import CatalogCache
+from actions.vector_index import HybridRetriever, VectorStore
+
+
+def test_store_reloads_from_disk(tmp_path):
+    path = str(tmp_path / "brokers.f32")
+    store = VectorStore(path, dimensions=32)
+    assert store.sync({"a": "horizon group mumbai", "b": "prime investments delhi"}) == (2, 0)
+    vector = store.rows([store.row_of["a"]])
+
+    reopened = VectorStore(path, dimensions=32)
+    assert reopened.row_of == store.row_of
+    assert np.array_equal(reopened.rows([reopened.row_of["a"]]), vector)
+    # Unchanged text is not embedded again; changed and removed documents are.
+    assert reopened.sync({"a": "horizon group mumbai", "c": "legacy partners pune"}) == (1, 1)
+    assert VectorStore(path, dimensions=32).search(vector[0], 1)[0][1] == "a"
+
+
+def test_store_rebuilds_when_files_do_not_fit(tmp_path):
+    path = str(tmp_path / "brokers.f32")
+    VectorStore(path, dimensions=32).sync({"a": "horizon group mumbai"})
+    assert len(VectorStore(path, dimensions=64)) == 0
+    with open(path, "r+b") as f:
+        f.truncate(0)
+    assert len(VectorStore(path, dimensions=32)) == 0
+
+
+def test_catalog_changes_update_the_index(tmp_path):
+    db = mongomock.MongoClient()["catalog"]
+    db.brokers.insert_many([
+        {"_id": 1, "name": "Horizon Group", "city": "Mumbai"},
+        {"_id": 2, "name": "Prime Investments", "city": "Delhi"},
+    ])
+    catalog = CatalogCache(db_factory=lambda: db, collections=("brokers",))
+    catalog.reload("brokers")
+    retriever = HybridRetriever(catalog, "brokers", index_dir=str(tmp_path), dimensions=32)
+    store = retriever.store
+    old_hash = store.hashes[store.row_of["1"]]
+
+    catalog.upsert("brokers", {"_id": 1, "name": "Horizon Realty", "city": "Pune"})
+    assert store.hashes[store.row_of["1"]] != old_hash
+    assert retriever.candidates("horizon realty pune")[0][0] == "1"
+    catalog.delete("brokers", 2)
+    assert "2" not in store.row_of
+    retriever.close()
+
+    # A restart re-embeds only what changed while it was down.
+    db.brokers.update_one({"_id": 1}, {"$set": {"name": "Horizon Group", "city": "Mumbai"}})
+    catalog.reload("brokers")
+    restarted = HybridRetriever(catalog, "brokers", index_dir=str(tmp_path), dimensions=32)
+    assert sorted(restarted.store.row_of) == ["1", "2"]
+    assert restarted.store.hashes[restarted.store.row_of["1"]] == old_hash